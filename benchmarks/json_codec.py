@@ -0,0 +1,54 @@
+"""Compares JSON backends available to :mod:`pmp_api.utils.json_codec`
+on a large collection.doc+json page.
+
+The test fixture `datadoc.json` (a 10-item page) is repeated to build a
+page of `--items` items, which is then decoded and encoded with each
+installed backend::
+
+   $ python benchmarks/json_codec.py --items 500 --rounds 50
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+here = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from pmp_api.utils import json_codec  # noqa: E402
+
+
+def build_page(item_count):
+    fixture = os.path.join(os.path.dirname(here), 'test', 'fixtures',
+                           'datadoc.json')
+    with open(fixture, 'r') as f:
+        page = json.loads(f.read())
+    items = page['items']
+    page['items'] = [items[n % len(items)] for n in range(item_count)]
+    return page
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+    raw = json.dumps(page).encode('utf-8')
+    print("Page: {} items, {:.1f} KiB".format(args.items, len(raw) / 1024))
+    print("{:<8} {:>12} {:>12}".format('backend', 'loads (ms)', 'dumps (ms)'))
+
+    for name in json_codec.available_backends():
+        json_codec.use_backend(name)
+        loads = timeit.timeit(lambda: json_codec.loads(raw),
+                              number=args.rounds)
+        dumps = timeit.timeit(lambda: json_codec.dumps(page),
+                              number=args.rounds)
+        print("{:<8} {:>12.3f} {:>12.3f}".format(
+            name, 1000 * loads / args.rounds, 1000 * dumps / args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+.. module:: pmp_api.async_client
+   :synopsis: asyncio interface for the PMP API
+
+The :class:`AsyncClient <AsyncClient>` object offers the same API as
+:class:`Client <pmp_api.pmp_client.Client>`, but every method that makes
+a request is a coroutine. Results are returned as :class:`NavigableDoc`
+objects and browser-style navigation (`history`, `back`, `forward`) works
+the same way.
+
+Options that depend on background threads (`prefetch_depth`, and the
+`warm_up` of `gain_access`) are not supported.
+
+This module requires the optional `aiohttp` package.
+"""
+import asyncio
+
+from .pmp_client import Client
+from .pmp_client import _payload_guid
+from .core.auth import PmpAuth
+from .core.async_conn import AsyncPmpConnector
+from .core.exceptions import BadQuery
+from .core.exceptions import NoToken
+from .collectiondoc.navigabledoc import NavigableDoc
+from .collectiondoc.pager import AsyncItemStream
+from .utils.json_utils import copy_json
+
+
+class AsyncClient(Client):
+    """The :class:`AsyncClient <AsyncClient>` object is an asyncio
+    interface for requesting endpoints from the Public Media Platform API.
+
+    Usage::
+
+      >>> from pmp_api.async_client import AsyncClient
+      >>> client = AsyncClient("https://some-protected.api.com")
+      >>> await client.gain_access(CLIENT_ID, CLIENT_SECRET)
+      >>> await client.get("https://some-protected.api.com/some-endpoint")
+      <Navigable doc: https://some-protected.api.com/some-endpoint>
+      >>> await client.close()
+
+    Kwargs passed to the constructor beyond `entry_point` and the caches
+    are handed to :class:`AsyncPmpConnector <AsyncPmpConnector>`.
+    Raises ValueError for `prefetch_depth`, which needs a background
+    thread.
+    """
+    def __init__(self, entry_point, nav_cache=None, home_cache=None,
+                 prefetch_depth=0, **options):
+        if prefetch_depth:
+            errmsg = "AsyncClient does not support `prefetch_depth`."
+            raise ValueError(errmsg)
+        super().__init__(entry_point, nav_cache=nav_cache,
+                         home_cache=home_cache, **options)
+
+    def __enter__(self):
+        raise TypeError("Use `async with` with AsyncClient.")
+
+    def __exit__(self, *exc_info):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Stops the token refresh thread and closes the connection pool
+        of the `connector`.
+        """
+        if self.connector is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None, self.connector.authorizer.stop_refresh)
+            await self.connector.close()
+
+    async def gain_access(self, client_id,
+                          client_secret,
+                          auth_urn="urn:collectiondoc:form:issuetoken",
+                          warm_up=False, **auth_options):
+        """Requests access for `entry_point` using provided authentication.
+        Finds the `auth_urn` and requests a token using the protocol listed
+        there. Extra kwargs are passed to :class:`PmpAuth`.
+
+        Raises ValueError for the `warm_up` options of
+        :meth:`Client.gain_access <pmp_api.pmp_client.Client.gain_access>`.
+        """
+        unsupported = {'home_doc_path', 'profiles', 'queries'}
+        if warm_up or unsupported & auth_options.keys():
+            errmsg = "AsyncClient does not support `warm_up`."
+            raise ValueError(errmsg)
+        authorizer = PmpAuth(client_id, client_secret, **auth_options)
+        connector = AsyncPmpConnector(authorizer, **self.connector_options)
+        try:
+            await self._load_home_doc(connector)
+            access_token_url = self._access_token_url(auth_urn)
+            await connector.get_access_token(access_token_url)
+        except NoToken as exc:
+            await connector.close()
+            errmsg = "Client connection failed. Check entry_point or"
+            errmsg += " authentication schema used."
+            raise NoToken(errmsg) from exc
+        except Exception:
+            await connector.close()
+            raise
+        if self.connector is not None:
+            await self.connector.close()
+        self.connector = connector
+
+    async def get(self, endpoint):
+        """Returns NavigableDoc object obtained from requested endpoint.
+        Also, saves NavigableDoc object as `document` attribute.
+        """
+        self._check_connector()
+        endpoint = self._navigate(endpoint)
+        document = self._cached(endpoint)
+        if document is not None:
+            return self._set_document(document)
+        results = await self.connector.get(endpoint)
+        return self._load(results, endpoint)
+
+    async def fetch(self, endpoint):
+        """Returns NavigableDoc for `endpoint` without touching navigation
+        state. See :meth:`Client.fetch <pmp_api.pmp_client.Client.fetch>`.
+        """
+        self._check_connector()
+        results = await self.connector.get(endpoint)
+        if results is not None:
+            document = NavigableDoc(results)
+            if self.doc_store is not None:
+                self.doc_store.put_page(document)
+            return document
+
+    async def fetch_query(self, rel_type, params=None):
+        """Returns NavigableDoc for query `rel_type` with `params`, built
+        from the home-doc, without touching navigation state.
+
+        Raises BadQuery if the home-doc does not offer the query.
+        """
+        if self.query_cache is not None:
+            cached = self.query_cache.get(rel_type, params)
+            if cached is not None:
+                return cached[1]
+        endpoint = None
+        if self.home_doc is not None:
+            endpoint = self.home_doc.query(rel_type, params=params)
+        if endpoint is None:
+            errmsg = "Can't create request for {0} with params {1}. Check that"
+            errmsg += " {0} is present in the home-doc."
+            raise BadQuery(errmsg.format(rel_type, str(params)))
+        document = await self.fetch(endpoint)
+        if self.query_cache is not None and document is not None:
+            self.query_cache.set(rel_type, params, endpoint, document)
+        return document
+
+    async def get_many(self, endpoints, max_workers=8, ordered=False):
+        """Fetches many endpoints concurrently. Returns async generator of
+        (endpoint, NavigableDoc) tuples. See
+        :meth:`Client.get_many <pmp_api.pmp_client.Client.get_many>`.
+        """
+        self._check_connector()
+        results = self.connector.get_many(endpoints, max_workers=max_workers,
+                                          ordered=ordered)
+        async for endpoint, result in results:
+            if isinstance(result, Exception) or result is None:
+                yield endpoint, result
+            else:
+                yield endpoint, NavigableDoc(result)
+
+    async def get_pages(self, start=1, stop=None, max_workers=8):
+        """Fetches pages `start` to `stop` of the current listing
+        concurrently. Returns async generator of NavigableDoc pages, in
+        order. See :meth:`Client.get_pages <pmp_api.pmp_client.Client.get_pages>`.
+        """
+        if self.pager is None:
+            raise ValueError("No paged document has been loaded")
+        urls = self.pager.page_urls(start, stop)
+        results = self.get_many(urls, max_workers=max_workers, ordered=True)
+        async for endpoint, page in results:
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    async def get_page_items(self, start=1, stop=None, max_workers=8):
+        """Returns async generator of the items of pages `start` to `stop`.
+        """
+        async for page in self.get_pages(start, stop,
+                                         max_workers=max_workers):
+            for item in page.items or ():
+                yield item
+
+    def iter_items(self, rel_type, params=None, page_size=None,
+                   max_items=None, cursor=None, documents=False):
+        """Streams the items of every page of a query without touching
+        navigation state. See
+        :meth:`Client.iter_items <pmp_api.pmp_client.Client.iter_items>`.
+
+        Returns :class:`AsyncItemStream <pmp_api.collectiondoc.pager.AsyncItemStream>`
+        """
+        self._check_connector()
+        if cursor is None:
+            params = dict(params or {})
+            if page_size is not None:
+                params['limit'] = page_size
+            cursor = self._query_url(rel_type, params or None)
+        wrap = NavigableDoc if documents else None
+        return AsyncItemStream(self.connector.get, cursor,
+                               max_items=max_items, wrap=wrap)
+
+    async def save(self, endpoint, document):
+        """Saves a document (a string value) at PMP.
+        """
+        results = await self.connector.put(endpoint, document)
+        for url in self._document_urls(endpoint, document):
+            self.prefetched.pop(url, None)
+            if self.nav_cache is not None:
+                self.nav_cache.delete(url)
+        guid = _payload_guid(document)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(href=endpoint, guid=guid)
+        if self.doc_store is not None and guid:
+            # the stored copy predates the save
+            self.doc_store.delete(guid)
+        return results
+
+    async def delete(self, document):
+        """Deletes a NavigableDoc document from PMP API.
+        """
+        href = document.collectiondoc.get('href')
+        self.prefetched.pop(href, None)
+        if self.nav_cache is not None:
+            self.nav_cache.delete(href)
+        guid = (document.attributes or {}).get('guid')
+        if self.query_cache is not None:
+            self.query_cache.invalidate(href=href, guid=guid)
+        deleted = await self.connector.delete(href)
+        if deleted and self.doc_store is not None and guid:
+            self.doc_store.delete(guid)
+        return deleted
+
+    async def query(self, rel_type, params=None):
+        """Issues request for a query using urn with params to create
+        a well-formed request.
+        """
+        if self.query_cache is None:
+            return await self.get(self._query_url(rel_type, params))
+        self._check_connector()
+        cached = self.query_cache.get(rel_type, params)
+        if cached is not None:
+            endpoint, document = cached
+            self._navigate(endpoint)
+            return self._set_document(document)
+        document = await self.get(self._query_url(rel_type, params))
+        if document is not None:
+            self.query_cache.set(rel_type, params, self.current_page,
+                                 document)
+        return document
+
+    async def _load_home_doc(self, connector):
+        """Sets `home_doc` from a fresh `home_cache` entry or from an
+        unsigned request, which is then saved to `home_cache`.
+        """
+        home_doc = None
+        if self.home_cache is not None and self.home_cache.fresh(
+                self.entry_point):
+            home_doc = copy_json(self.home_cache.get(self.entry_point).body)
+        if home_doc is None:
+            home_doc = await connector.get(self.entry_point, signed=False)
+            if self.home_cache is not None:
+                self.home_cache.store(self.entry_point, home_doc)
+        return self._set_home_doc(home_doc)
+
+    def _home_document(self):
+        # revalidation needs a request, which `home` makes without blocking
+        return self.home_doc
+
+    async def home(self):
+        """Requests API home-doc `entry_point` and returns results.
+        With a `home_cache`, the cached home-doc is used while fresh.
+        """
+        self._check_connector()
+        if self.home_cache is not None:
+            home_doc = await self._load_home_doc(self.connector)
+            if self.connector.authorized:
+                self._navigate(self.entry_point)
+                self.pager = home_doc.pager
+            return home_doc
+        if self.connector.authorized:
+            return await self.get(self.entry_point)
+        return await self._load_home_doc(self.connector)
+
+    async def next(self):
+        """Requests the `next` page listed by navigation or returns None.
+        """
+        if self.pager and self.pager.navigable:
+            if self.pager.next is not None:
+                return await self.get(self.pager.next)
+
+    async def prev(self):
+        """Requests the `prev` page listed by navigation or returns None.
+        """
+        if self.pager and self.pager.navigable:
+            if self.pager.prev is not None:
+                return await self.get(self.pager.prev)
+
+    async def first(self):
+        """Requests the `first` page listed by navigation or returns None.
+        """
+        if self.pager and self.pager.first is not None:
+            return await self.get(self.pager.first)
+
+    async def last(self):
+        """Requests the `last` page listed by navigation or returns None.
+        """
+        if self.pager and self.pager.navigable:
+            if self.pager.last is not None:
+                return await self.get(self.pager.last)
+
+    async def back(self):
+        """Works like a browser's `back` button.
+        """
+        if len(self.history) > 0:
+            return await self.get(self.history[-1])
+
+    async def forward(self):
+        """Works like a browser's `forward` button.
+        """
+        if len(self.forward_stack) > 0:
+            return await self.get(self.forward_stack.pop())
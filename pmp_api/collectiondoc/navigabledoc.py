@@ -3,15 +3,13 @@
    :synopsis: Creates an interactive NavigableDoc object
    from API results.
 """
-import json
-
 from pelecanus.toolbox import get_nested_value
 from pelecanus.toolbox import set_nested_value
 
 from .pager import Pager
 from .query import make_query
-from ..utils.json_utils import qfind
-from ..utils.json_utils import filter_dict
+from ..utils import json_codec
+from ..utils.json_utils import index_rels
 
 
 class NavigableDoc(object):
@@ -25,6 +23,10 @@ class NavigableDoc(object):
     in a collectiondoc result (which can be any dictionary, but which is
     usually loaded from JSON).
 
+    Links are looked up by rel through an index of the document's
+    `links` (navigation, query, edit, auth...), built on first use and
+    rebuilt after `edit`.
+
     Args:
       `collection_result` -- JSON collectiondoc from PMP API
     """
@@ -33,6 +35,7 @@ class NavigableDoc(object):
         self.collectiondoc = collection_result
         self.get = self.collectiondoc.get
         self.href = self.get('href', '')
+        self._rels = None
         self.make_pager()
 
     def __repr__(self):
@@ -73,19 +76,37 @@ class NavigableDoc(object):
 
         return endpoint
 
+    @property
+    def rels(self):
+        """Dictionary mapping each rel of the document's links to the list
+        of links carrying it.
+        """
+        if self._rels is None:
+            self._rels = index_rels(self.links)
+        return self._rels
+
     def query_types(self):
         """Returns generator of query_types offered by the endpoint.
         """
-        for item in qfind(self.collectiondoc, 'rels'):
-            if 'title' in item:
-                yield item['title'], item['rels']
-            else:
-                yield item['rels']
+        seen = set()
+        for links in self.rels.values():
+            for item in links:
+                if id(item) in seen:
+                    continue
+                seen.add(id(item))
+                if 'title' in item:
+                    yield item['title'], item['rels']
+                else:
+                    yield item['rels']
 
     def options(self, rel_type):
         """Returns dictionary of query_options for particular query type.
         """
-        options = list(filter_dict(self.collectiondoc, 'rels', rel_type))
+        try:
+            options = self.rels.get(rel_type, ())
+        except TypeError:
+            # unhashable rel_type, such as a list
+            return None
         if len(options) == 1:
             return options[0]
 
@@ -110,10 +131,13 @@ class NavigableDoc(object):
         Returns: Lowest level object that has been edited or None if not found.
         """
         set_nested_value(self.collectiondoc, keys, update_val)
+        if keys and keys[0] == 'links':
+            self._rels = None
+            self.make_pager()
         return get_nested_value(self.collectiondoc, keys)
 
     def serialize(self):
-        return json.dumps(self.collectiondoc)
+        return json_codec.dumps(self.collectiondoc)
 
     @property
     def attributes(self):
@@ -4,8 +4,26 @@
 
 The :class:`Pager <Pager>` class is for easily following navigation elements
 returned by collection+doc.json documents.
+
+The :class:`ItemStream <ItemStream>` class iterates over the items of all
+pages of a listing, holding one page at a time, and can resume from a
+saved `cursor`. :class:`AsyncItemStream <AsyncItemStream>` does the same
+with `async for`.
+
+The :class:`ReadAhead <ReadAhead>` class fetches the pages after the
+current one in the background, so that following `next` links finds them
+already in memory.
 """
-from ..utils.json_utils import filter_dict
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+
+from ..utils.json_utils import index_rels
 
 
 class Pager(object):
@@ -41,11 +59,13 @@ class Pager(object):
         :param navigable_dict: dicitionary of JSON values
         :type navigable_dict: dict
         """
+        rels = index_rels(navigable_dict)
+
         def _get_page(val):
-            try:
-                return next(filter_dict(navigable_dict, 'rels', val))['href']
-            except StopIteration:
-                return None
+            links = rels.get(val)
+            if links:
+                return links[0].get('href')
+            return None
         return _get_page
 
     def update(self, nav):
@@ -65,8 +85,295 @@ class Pager(object):
             self.first = navigator('first')
             self.current = navigator('self')
 
+    @property
+    def page_size(self):
+        """Number of items per page, from the `limit` of the page urls or
+        the distance between `offset` values. None if unknown.
+        """
+        for url in (self.current, self.first, self.next, self.last):
+            limit = _page_params(url)[1]
+            if limit:
+                return limit
+        if self.next is not None:
+            start = _page_params(self.current or self.first)[0]
+            size = _page_params(self.next)[0] - start
+            if size > 0:
+                return size
+        if self.prev is not None and self.current is not None:
+            size = _page_params(self.current)[0] - _page_params(self.prev)[0]
+            if size > 0:
+                return size
+        return None
+
+    @property
+    def page_count(self):
+        """Number of pages, computed from the `last` link. None if unknown.
+        """
+        size = self.page_size
+        if not size:
+            return None
+        if self.last is None:
+            return 1 if not self.next else None
+        return _page_params(self.last)[0] // size + 1
+
+    def page_url(self, number):
+        """Returns url of page `number` (counting from 1), built by setting
+        `offset` (and `limit`) on the `first` page url.
+
+        Raises IndexError if `number` is outside of the listing and
+        ValueError if the page size cannot be worked out.
+        """
+        size = self.page_size
+        base = self.first or self.current
+        if not size or base is None:
+            raise ValueError("Page size unknown for {}".format(self))
+        count = self.page_count
+        if number < 1 or (count is not None and number > count):
+            raise IndexError("No page {} in {}".format(number, self))
+        scheme, netloc, path, query, fragment = urlsplit(base)
+        params = [(key, value) for key, value in parse_qsl(query)
+                  if key not in ('offset', 'limit')]
+        offset = (number - 1) * size
+        if offset:
+            params.append(('offset', str(offset)))
+        if _page_params(base)[1]:
+            params.append(('limit', str(size)))
+        return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+    def page_urls(self, start=1, stop=None):
+        """Returns urls of pages `start` to `stop` (inclusive, defaults to
+        the last page).
+        """
+        if stop is None:
+            stop = self.page_count
+            if stop is None:
+                raise ValueError("Page count unknown for {}".format(self))
+        return [self.page_url(number) for number in range(start, stop + 1)]
+
     def __str__(self):
         return "<Pager for: {}>".format(self.current)
 
     def __repr__(self):
         return "<Pager for: {}>".format(self.current)
+
+
+def _page_params(url):
+    """Returns (offset, limit) of a page url; offset defaults to 0 and
+    limit to None.
+    """
+    if url is None:
+        return 0, None
+    params = dict(parse_qsl(urlsplit(url).query))
+    try:
+        offset = int(params.get('offset', 0))
+    except ValueError:
+        offset = 0
+    try:
+        limit = int(params['limit'])
+    except (KeyError, ValueError):
+        limit = None
+    return offset, limit
+
+
+class ItemStream(object):
+    """Iterator over the items of every page of a listing, following
+    `next` links. Only the current page is held in memory.
+
+    The `cursor` names the page and position of the next item, so a crawl
+    can be saved and resumed later::
+
+      >>> stream = client.iter_items('urn:collectiondoc:query:docs')
+      >>> for item in stream:
+      ...     process(item)
+      ...     save(stream.cursor)
+      >>> stream = client.iter_items(None, cursor=load())
+
+    Args:
+       `fetch` -- function returning a collection.doc dictionary for a url
+       `cursor` -- page url, or (page url, item index) tuple, to start from
+
+    Kwargs:
+       `max_items` -- stop after this many items (None: all)
+       `wrap` -- function applied to each item dictionary before it is
+       yielded (for example, NavigableDoc)
+    """
+    def __init__(self, fetch, cursor, max_items=None, wrap=None):
+        self.fetch = fetch
+        if isinstance(cursor, str):
+            cursor = (cursor, 0)
+        self.page_url, self.index = cursor
+        self.max_items = max_items
+        self.wrap = wrap
+        self.count = 0
+        self._items = None
+        self._next_url = None
+
+    @property
+    def cursor(self):
+        """(page url, item index) of the next item, or None when done.
+        """
+        if self.page_url is None:
+            return None
+        return self.page_url, self.index
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.max_items is not None and self.count >= self.max_items:
+            raise StopIteration
+        while True:
+            if self.page_url is None:
+                raise StopIteration
+            if self._items is None:
+                page = self.fetch(self.page_url)
+                self._items = page.get('items') or []
+                self._next_url = _next_link(page)
+            if self.index < len(self._items):
+                item = self._items[self.index]
+                self.index += 1
+                self.count += 1
+                return self.wrap(item) if self.wrap else item
+            self.page_url, self.index = self._next_url, 0
+            self._items = None
+
+
+class AsyncItemStream(ItemStream):
+    """:class:`ItemStream <ItemStream>` for asyncio code, where `fetch` is
+    a coroutine function. Iterate with `async for`::
+
+      >>> stream = client.iter_items('urn:collectiondoc:query:docs')
+      >>> async for item in stream:
+      ...     process(item)
+    """
+    def __iter__(self):
+        raise TypeError("AsyncItemStream must be iterated with `async for`")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.max_items is not None and self.count >= self.max_items:
+            raise StopAsyncIteration
+        while True:
+            if self.page_url is None:
+                raise StopAsyncIteration
+            if self._items is None:
+                page = await self.fetch(self.page_url)
+                self._items = page.get('items') or []
+                self._next_url = _next_link(page)
+            if self.index < len(self._items):
+                item = self._items[self.index]
+                self.index += 1
+                self.count += 1
+                return self.wrap(item) if self.wrap else item
+            self.page_url, self.index = self._next_url, 0
+            self._items = None
+
+
+def _next_link(page):
+    """Returns the `next` navigation href of collection.doc `page`.
+    """
+    pager = Pager()
+    pager.update((page.get('links') or {}).get('navigation', None))
+    return pager.next
+
+
+class ReadAhead(object):
+    """Bounded buffer of pages fetched ahead of the reader by following
+    each page's `next` link in a background thread.
+
+    Usage::
+
+      >>> read_ahead = ReadAhead(lambda url: client_fetch(url), depth=2)
+      >>> read_ahead.start(document.pager.next)
+      >>> read_ahead.take(document.pager.next)  # waits if still in flight
+      <Navigable doc: ...>
+
+    Args:
+       `fetch` -- function returning a document with a `pager` for a url
+
+    Kwargs:
+       `depth` -- number of pages kept ahead of the reader
+    """
+    def __init__(self, fetch, depth=1):
+        self.fetch = fetch
+        self.depth = depth
+        self._buffer = OrderedDict()
+        self._next = {}
+        self._generation = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def __contains__(self, url):
+        return url in self._buffer
+
+    def start(self, url):
+        """Fetches `url`, then the pages following it, until `depth`
+        pages are buffered. Pages already buffered are not fetched again.
+        """
+        with self._lock:
+            self._extend(url, self._generation)
+
+    def _extend(self, url, generation):
+        # called holding `_lock`: skip along buffered pages to the first
+        # url that is not yet buffered
+        while url is not None and url in self._buffer:
+            if not self._buffer[url].done():
+                # the page in flight continues the chain when it arrives
+                return
+            url = self._next.get(url)
+        if url is None or len(self._buffer) >= self.depth:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pmp-read-ahead")
+        self._buffer[url] = self._executor.submit(self._run, url, generation)
+
+    def _run(self, url, generation):
+        document = self.fetch(url)
+        pager = getattr(document, 'pager', None)
+        next_url = pager.next if pager is not None and pager.navigable else None
+        with self._lock:
+            if generation == self._generation:
+                if url in self._buffer:
+                    self._next[url] = next_url
+                self._extend(next_url, generation)
+        return document
+
+    def take(self, url):
+        """Removes `url` from the buffer and returns its document, waiting
+        for it if it is still in flight. Returns None if `url` is not
+        buffered or could not be fetched.
+        """
+        with self._lock:
+            future = self._buffer.pop(url, None)
+            self._next.pop(url, None)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception:
+            # let the caller fetch it again and see the error itself
+            return None
+
+    def cancel(self):
+        """Drops buffered pages and stops fetching further ones.
+        """
+        with self._lock:
+            self._generation += 1
+            for future in self._buffer.values():
+                future.cancel()
+            self._buffer.clear()
+            self._next.clear()
+
+    def close(self):
+        """Cancels prefetching and stops the background thread.
+        """
+        self.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -1,9 +1,10 @@
 """
 """
-import json
 import os
 from pelecanus import PelicanJson
 
+from ..utils import json_codec
+
 
 class InvalidProfile(Exception):
     pass
@@ -25,7 +26,7 @@ def new_profile(profile_type="story", collection=None):
                                     'stored_profiles',
                                     profile_file)
     with open(profile_location, 'r') as f:
-        data = json.loads(f.read())
+        data = json_codec.loads(f.read())
         data['version'] = VERSION
 
         if collection is None:
@@ -57,7 +58,7 @@ def empty_values(data, profile_type="story"):
                                     'stored_profiles',
                                     profile_file)
     with open(profile_location, 'r') as f:
-        profile = json.loads(f.read())
+        profile = json_codec.loads(f.read())
     optional = profile['OPTIONAL']
     temp_data = PelicanJson(data)
     return list(temp_data.search_value(optional))
@@ -74,7 +75,7 @@ def validate(data, profile_type="story"):
                                     'stored_profiles',
                                     profile_file)
     with open(profile_location, 'r') as f:
-        profile = json.loads(f.read())
+        profile = json_codec.loads(f.read())
     required = profile['REQUIRED']
     temp_data = PelicanJson(data)
     try:
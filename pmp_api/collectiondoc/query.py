@@ -1,29 +1,111 @@
 """
 .. module:: pmp_api.collectiondoc.query
    :synopsis: Helper functions for validating and making queries
+
+Templates are parsed once and kept in a least-recently-used cache of
+:class:`CompiledTemplate <CompiledTemplate>` objects, so that repeated
+queries against the same template only pay for expansion::
+
+   >>> from pmp_api.collectiondoc.query import make_queries
+   >>> make_queries(template, [{'guid': guid} for guid in guids])
+   ['https://api.pmp.io/docs/...', ...]
 """
+import re
+
+from functools import lru_cache
 
 from uritemplate import expand
 from uritemplate import variables
 
+try:
+    from uritemplate import URITemplate
+except ImportError:
+    # uritemplate < 2.0 only offers the module functions
+    URITemplate = None
+
 from ..core.exceptions import BadQuery
 
+TEMPLATE_CACHE_SIZE = 256
+
+_EXPRESSION = re.compile(r'{([^}]+)}')
+
+
+class CompiledTemplate(object):
+    """A uri-template parsed once: its set of variables and an expander.
+
+    Args:
+       `template` -- uri-template string
+    """
+    def __init__(self, template):
+        self.template = template
+        self.variables = frozenset(variables(template))
+        if URITemplate is not None:
+            self._expand = URITemplate(template).expand
+        else:
+            self._expand = self._expand_parts
+            # literals at even positions, expressions at odd positions
+            self._parts = _EXPRESSION.split(template)
+            for index in range(1, len(self._parts), 2):
+                self._parts[index] = '{' + self._parts[index] + '}'
+
+    def __repr__(self):
+        return "<CompiledTemplate: {}>".format(self.template)
+
+    def _expand_parts(self, params):
+        parts = self._parts[:]
+        for index in range(1, len(parts), 2):
+            parts[index] = expand(parts[index], params)
+        return ''.join(parts)
+
+    def validate(self, params):
+        """Returns True if every key of `params` is a template variable.
+        """
+        return self.variables.issuperset(params.keys())
+
+    def bad_params(self, params):
+        """Returns set of keys of `params` that are not template variables.
+        """
+        return params.keys() - self.variables
+
+    def expand(self, params=None):
+        """Returns the template expanded with `params`, unvalidated.
+        """
+        return self._expand(params or {})
+
+    def make_query(self, params=None):
+        """Returns the template expanded with `params`.
+
+        Raises BadQuery on invalid parameters.
+        """
+        if params is None:
+            params = {}
+        if not self.validate(params):
+            errmsg = "Query param does not exist: {}"
+            raise BadQuery(errmsg.format(self.bad_params(params)))
+        return self._expand(params)
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template):
+    """Returns :class:`CompiledTemplate <CompiledTemplate>` for `template`,
+    from the cache of recently used templates if possible.
+    """
+    return CompiledTemplate(template)
+
 
 def validate(template, var_dict):
     """Returns True/False
     Tests whether a given dictionary `var_dict` is
     valid for a particular uri-template.
     """
-    temp_vars = variables(template)
-    return temp_vars.issuperset(var_dict.keys())
+    return compile_template(template).validate(var_dict)
 
 
 def bad_params(template, var_dict):
     """Returns dictionary of parameters that do
     not pass validation.
     """
-    temp_vars = variables(template)
-    return var_dict.keys() - temp_vars
+    return compile_template(template).bad_params(var_dict)
 
 
 def make_query(template, params=None):
@@ -32,11 +114,14 @@ def make_query(template, params=None):
 
     Raises BadQuery on invalid parameters.
     """
-    if params is None:
-        params = {}
-    if validate(template, params):
-        return expand(template, params)
-    else:
-        badstuff = bad_params(template, params)
-        errmsg = "Query param does not exist: {}"
-        raise BadQuery(errmsg.format(badstuff))
+    return compile_template(template).make_query(params)
+
+
+def make_queries(template, param_dicts):
+    """Returns list of endpoint requests, one for each dictionary of params
+    in `param_dicts`, expanded from a single parse of `template`.
+
+    Raises BadQuery on the first invalid set of parameters.
+    """
+    compiled = compile_template(template)
+    return [compiled.make_query(params) for params in param_dicts]
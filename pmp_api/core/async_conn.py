@@ -0,0 +1,323 @@
+"""
+.. module:: pmp_api.core.async_conn
+   :synopsis: asyncio connection manager for the PMP API
+
+The :class:`AsyncPmpConnector <AsyncPmpConnector>` object is the asyncio
+counterpart of :class:`PmpConnector <pmp_api.core.conn.PmpConnector>`. It
+takes the same :class:`PmpAuth <PmpAuth>` object, signs requests the same
+way and raises the same exceptions, but all of its requests are coroutines,
+so a single process can keep many requests in flight at once.
+
+This module requires the optional `aiohttp` package::
+
+   $ pip install py3-pmp-wrapper[async]
+"""
+import os
+import asyncio
+import requests
+
+from collections import deque
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from .conn import PmpConnector
+from .exceptions import BadRequest
+from .exceptions import EmptyResponse
+from .exceptions import ExpiredToken
+from .exceptions import NoToken
+from ..utils import json_codec
+
+
+class AsyncPmpConnector(object):
+    """AsyncPmpConnector class for issuing signed requests of the PMP Api
+    from asyncio code.
+
+    Objects of this class must be instantiated with a
+    :class:`PmpAuth <PmpAuth>` object. Connections are pooled in a single
+    :class:`aiohttp.ClientSession`, which is created on first use and
+    released with `close` or by using the connector as an async context
+    manager.
+
+    Usage::
+
+       >>> from pmp_api.core.async_conn import AsyncPmpConnector
+       >>> async with AsyncPmpConnector(pmp_auth) as pmp_connect:
+       ...     await pmp_connect.get("https://api-pilot.pmp.io/docs")
+
+    Args:
+       `auth_object` -- :class:`PmpAuth <PmpAuth>` object for authentication
+
+    Kwargs:
+      `base_url` -- url to make requests of PMP API
+      `limit` -- maximum number of simultaneous connections
+      `limit_per_host` -- maximum number of connections per host (0 is
+      unlimited)
+      `keep_alive` -- when False, close each connection after use
+      `rate_limiter` -- :class:`RateLimiter <pmp_api.core.ratelimit.RateLimiter>`
+      awaited before every send
+
+    """
+    def __init__(self, auth_object, base_url="https://api-sandbox.pmp.io",
+                 limit=100, limit_per_host=0, keep_alive=True,
+                 rate_limiter=None):
+        if aiohttp is None:
+            errmsg = "AsyncPmpConnector requires the `aiohttp` package."
+            raise ImportError(errmsg)
+        self.authorizer = auth_object
+        self.base_url = base_url
+        self.last_url = None
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keep_alive = keep_alive
+        self.rate_limiter = rate_limiter
+        self._reauth_lock = None
+        self._token_lock = None
+        self._session = None
+        self._session_pid = None
+
+    authorized = PmpConnector.authorized
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def session(self):
+        """Pooled :class:`aiohttp.ClientSession` shared by all requests.
+        Must be used from inside a running event loop.
+        """
+        pid = os.getpid()
+        if (self._session is None or self._session.closed
+                or self._session_pid != pid):
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_pid = pid
+        return self._session
+
+    async def close(self):
+        """Closes the pooled session and all of its open connections.
+        """
+        if self._session is not None:
+            if self._session_pid == os.getpid():
+                await self._session.close()
+            self._session = None
+            self._session_pid = None
+
+    async def get_access_token(self, access_token_url):
+        """Requests a new access token from `access_token_url` and saves
+        it on the `authorizer`.
+
+        Tasks calling at once share one request. With a `token_store`,
+        the store is checked and the token requested holding the store's
+        lock, as :meth:`PmpAuth.get_access_token2
+        <pmp_api.core.auth.PmpAuth.get_access_token2>` does, in a worker
+        thread so that the file lock does not block the event loop.
+
+        Returns access_token. Raises NoToken on failure.
+        """
+        stale_token = self.authorizer.access_token
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            access_token = self.authorizer.access_token
+            if access_token != stale_token and self.authorized:
+                # another task requested it while this one waited
+                return access_token
+            if self.authorizer.token_store is not None:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    None, self.authorizer.get_access_token2,
+                    access_token_url)
+            return await self._request_token(access_token_url)
+
+    async def _request_token(self, access_token_url):
+        headers = self.authorizer._auth_header()
+        async with self.session.post(access_token_url,
+                                     headers=headers) as response:
+            content = await response.read()
+            if response.status >= 400:
+                errmsg = "Bad response from server on access_token request: "
+                errmsg += "code: {} content: {}".format(response.status,
+                                                        content)
+                raise NoToken(errmsg)
+        result = json_codec.loads(content)
+        return self.authorizer.store_token(result, access_token_url)
+
+    async def reauthorize(self):
+        """Attempts to reauthorize an expired token.
+
+        The token is renewed by :meth:`PmpAuth.renew_token
+        <pmp_api.core.auth.PmpAuth.renew_token>` in a worker thread, so one
+        request is made for all tasks and for any other connector sharing
+        the authorizer. Tasks of this connector wait on one call.
+
+        Returns True if reauthorization is successful.
+
+        Raises ExpiredToken if reauthorization fails.
+        """
+        stale_token = self.authorizer.access_token
+        if self.authorized:
+            return True
+        if self.authorizer.access_token_url is None:
+            errmsg = "Access token expired and access_token_url is unknown"
+            errmsg += " Create new access token for PmpAuth object."
+            raise ExpiredToken(errmsg)
+        if self._reauth_lock is None:
+            self._reauth_lock = asyncio.Lock()
+        async with self._reauth_lock:
+            if not self.authorized:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(
+                    None, lambda: self.authorizer.renew_token(
+                        stale_token=stale_token))
+        return True
+
+    async def _sign(self, req_method, req_endpoint):
+        """Returns signed headers for a request, reauthorizing first if the
+        access token has expired.
+        """
+        req = requests.Request(req_method, req_endpoint)
+        req.headers = {}
+        req.headers['Content-Type'] = 'application/vnd.collection.doc+json'
+        if not self.keep_alive:
+            req.headers['Connection'] = 'close'
+        try:
+            signed_req = self.authorizer.sign_request(req)
+        except ExpiredToken:
+            await self.reauthorize()
+            signed_req = self.authorizer.sign_request(req)
+        return signed_req.headers
+
+    async def _request_factory(self, req_method, req_endpoint, payload=None,
+                               signed=True):
+        """Signs and sends a request.
+
+        Returns (status_code, body) tuple, where `body` is the response
+        content in bytes.
+        """
+        if signed:
+            headers = await self._sign(req_method, req_endpoint)
+        else:
+            headers = {}
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(req_method)
+        async with self.session.request(req_method, req_endpoint,
+                                        data=payload,
+                                        headers=headers) as response:
+            content = await response.read()
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(req_method, response.headers)
+            return response.status, content
+
+    def _parse(self, endpoint, content):
+        try:
+            return json_codec.loads(content)
+        except ValueError:
+            errmsg = "No JSON returned by endpoint: {}.".format(endpoint)
+            raise EmptyResponse(errmsg)
+
+    async def get(self, endpoint, signed=True):
+        """GETs a document from from requested PMP endpoint.
+
+        Args:
+           `endpoint` -- PMP API url
+
+        Kwargs:
+           `signed` -- set False to request public documents (the home-doc)
+           without an access token
+
+        Returns dictionary of values (JSON) returned by endpoint.
+        """
+        status, content = await self._request_factory('GET', endpoint,
+                                                      signed=signed)
+        if status < 400:
+            self.last_url = endpoint
+            return self._parse(endpoint, content)
+        else:
+            errmsg = "Bad response from server on request for endpoint: {}"
+            errmsg += " Response status code: {}"
+            raise BadRequest(errmsg.format(endpoint, status))
+
+    async def get_many(self, endpoints, max_workers=8, ordered=False):
+        """GETs many documents concurrently over the shared session. No
+        more than `max_workers` requests are ever in flight, so
+        `endpoints` may be a long (or lazy) iterable.
+
+        Args:
+           `endpoints` -- iterable of PMP API urls
+
+        Kwargs:
+           `max_workers` -- number of concurrent requests
+           `ordered` -- yield results in the order of `endpoints` rather
+           than as they complete
+
+        Returns async generator of (endpoint, result) tuples, where result
+        is the dictionary of values returned by the endpoint or the
+        exception raised while requesting it.
+        """
+        endpoints = iter(endpoints)
+        window = deque()
+
+        def submit_next():
+            endpoint = next(endpoints, None)
+            if endpoint is None:
+                return False
+            window.append((endpoint, asyncio.ensure_future(self.get(endpoint))))
+            return True
+
+        while len(window) < max_workers and submit_next():
+            pass
+
+        try:
+            while window:
+                if ordered:
+                    endpoint, task = window.popleft()
+                    await asyncio.wait([task])
+                else:
+                    await asyncio.wait([task for _, task in window],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    position = next(index for index, (_, task)
+                                    in enumerate(window) if task.done())
+                    endpoint, task = window[position]
+                    del window[position]
+                submit_next()
+                try:
+                    result = task.result()
+                except Exception as exc:
+                    result = exc
+                yield endpoint, result
+        finally:
+            for _, task in window:
+                task.cancel()
+
+    async def put(self, endpoint, document):
+        """PUTs a passed-in document up to PMP API at endpoint url.
+
+        Returns dictionary of values (JSON) returned by endpoint.
+        Raises BadRequest on an error response.
+        """
+        status, content = await self._request_factory('PUT', endpoint,
+                                                      payload=document)
+        if status < 400:
+            self.last_url = endpoint
+            return self._parse(endpoint, content)
+        else:
+            errmsg = "Bad response from server on request for endpoint: {},"
+            errmsg += " Response status code: {}"
+            raise BadRequest(errmsg.format(endpoint, status))
+
+    async def delete(self, endpoint):
+        """Deletes the requesed endpoint from PMP API.
+
+        Returns True if the server confirms the delete.
+        """
+        status, _ = await self._request_factory('DELETE', endpoint)
+        return status == 204
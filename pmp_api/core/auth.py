@@ -7,6 +7,7 @@ with PMP API and they can also generate and revoke access-tokens.
 """
 import six
 import datetime
+import threading
 import requests
 from base64 import b64encode
 
@@ -37,6 +38,18 @@ class PmpAuth(object):
     `client-id`
     `client-secret`
 
+    Kwargs:
+    `refresh_mode` -- None (default) to renew tokens only after they expire,
+    'lazy' to renew in the background when a request is signed within
+    `refresh_margin` of expiry, or 'background' to keep a thread that
+    renews the token `refresh_margin` before it expires
+    `refresh_margin` -- seconds before `token_expires` to renew the token,
+    at most half of the token's lifetime; renewals are never attempted
+    less than `MIN_REFRESH_INTERVAL` seconds apart
+    `token_store` -- :class:`FileTokenStore <pmp_api.core.token_store.FileTokenStore>`
+    shared with other processes: a still-valid token found there is reused
+    instead of requesting one, and requested tokens are saved to it
+
     Methods:
 
     `get_access_token(endpoint)` -- retrieves new access token by posting
@@ -45,17 +58,43 @@ class PmpAuth(object):
     `sign_request(request_object)` -- uses access_token to sign requests for
     the resource
 
+    `refresh()` -- renews the access token from `access_token_url`
+
+    `renew_token(stale_token)` -- thread-safe renewal: when many threads
+    find the same token stale, one renews it and the others reuse the result
+
+    `stop_refresh()` -- stops the background refresh thread
+
     returns:
     PmPAuth object
     """
 
-    def __init__(self, client_id, client_secret):
+    REFRESH_MODES = (None, 'lazy', 'background')
+    MIN_REFRESH_INTERVAL = 10
+    MAX_MARGIN_FRACTION = 0.5
+
+    def __init__(self, client_id, client_secret, refresh_mode=None,
+                 refresh_margin=300, token_store=None):
+        if refresh_mode not in self.REFRESH_MODES:
+            errmsg = "refresh_mode must be one of {}"
+            raise ValueError(errmsg.format(self.REFRESH_MODES))
         self.client_id = client_id
         self.client_secret = client_secret
         self.access_token = None
         self.token_expires = None
         self.token_issued = None
+        self.token_received = None
         self.access_token_url = None
+        self.refresh_mode = refresh_mode
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.token_store = token_store
+        self._refresh_lock = threading.Lock()
+        self._token_lock = threading.Lock()
+        self._renew_lock = threading.Lock()
+        self._refreshing = False
+        self._last_refresh = None
+        self._refresh_thread = None
+        self._stop_refresh = threading.Event()
 
     def _auth_header(self):
         """Returns Basic authorization headers as specified in PMP spec.
@@ -122,23 +161,7 @@ class PmpAuth(object):
                                  params=params,
                                  headers=headers)
         if response.ok:
-            result = response.json()
-            self.access_token = result.get('access_token', None)
-
-            if self.access_token is None:
-                raise NoToken("Access Token missing: {}".format(endpoint))
-
-            time_format = "%Y-%m-%dT%H:%M:%S+00:00"
-            issue_time = result.get('token_issue_date', None)
-            self.token_issued = datetime.datetime.strptime(issue_time,
-                                                           time_format)
-
-            expiration = result.get('token_expires_in', None)
-            expires = datetime.timedelta(seconds=expiration)
-            self.token_expires = datetime.datetime.utcnow() + expires
-            self.access_token_url = endpoint
-
-            return self.access_token
+            return self.store_token(response.json(), endpoint)
         else:
             errmsg = "Bad response from server on access_token request: "
             errmsg += "code: {} content: {}".format(response.status_code,
@@ -157,38 +180,235 @@ class PmpAuth(object):
 
         See: https://github.com/publicmediaplatform/pmpdocs/wiki/Authenticating-with-the-API#grabbing-an-access-token-over-http
 
+        With a `token_store`, a valid token saved by another process is
+        reused; otherwise the request is made holding the store's lock.
+
         Args:
            access_token_url: http string taken from PMP API Home-Doc
         """
+        if self.token_store is None:
+            return self._request_token2(access_token_url)
+        with self.token_store.locked():
+            access_token = self.shared_token(access_token_url)
+            if access_token is not None:
+                return access_token
+            return self._request_token2(access_token_url)
+
+    def _request_token2(self, access_token_url):
         header = {"Content-Type": "application/x-www-form-urlencoded"}
         response = requests.post(access_token_url,
                                  auth=(self.client_id, self.client_secret),
                                  headers=header)
         if response.ok:
-            result = response.json()
-            self.access_token = result.get('access_token', None)
-
-            if self.access_token is None:
-                errmsg = "Access Token missing: {}".format(access_token_url)
-                raise NoToken(errmsg)
-
-            time_format = "%Y-%m-%dT%H:%M:%S+00:00"
-            issue_time = result.get('token_issue_date', None)
-            self.token_issued = datetime.datetime.strptime(issue_time,
-                                                           time_format)
-
-            expiration = result.get('token_expires_in', None)
-            expires = datetime.timedelta(seconds=expiration)
-            self.token_expires = datetime.datetime.utcnow() + expires
-            self.access_token_url = access_token_url
-
-            return self.access_token
+            return self.store_token(response.json(), access_token_url)
         else:
             errmsg = "Bad response from server on access_token request: "
             errmsg += "code: {} content: {}".format(response.status_code,
                                                     response.content)
             raise NoToken(errmsg)
 
+    def store_token(self, result, access_token_url):
+        """Saves the token values from a parsed access_token response.
+
+        This is shared by every transport that requests tokens, so that
+        the blocking and asyncio connectors treat tokens the same way.
+
+        Args:
+           `result` -- dictionary parsed from access_token response JSON
+           `access_token_url` -- url the token was requested from
+
+        returns:
+           access_token
+        """
+        access_token = result.get('access_token', None)
+        if access_token is None:
+            errmsg = "Access Token missing: {}".format(access_token_url)
+            raise NoToken(errmsg)
+
+        time_format = "%Y-%m-%dT%H:%M:%S+00:00"
+        issue_time = result.get('token_issue_date', None)
+        expiration = result.get('token_expires_in', None)
+        expires = datetime.timedelta(seconds=expiration)
+
+        token_issued = datetime.datetime.strptime(issue_time, time_format)
+        token_expires = datetime.datetime.utcnow() + expires
+        self._set_token(access_token, token_issued, token_expires,
+                        access_token_url)
+        if self.token_store is not None:
+            self.token_store.save(self.client_id, access_token_url,
+                                  access_token, token_issued, token_expires)
+        return access_token
+
+    def _set_token(self, access_token, token_issued, token_expires,
+                   access_token_url):
+        with self._token_lock:
+            self.access_token = access_token
+            self.token_issued = token_issued
+            self.token_expires = token_expires
+            self.token_received = datetime.datetime.utcnow()
+            self.access_token_url = access_token_url
+        if self.refresh_mode == 'background':
+            self._start_refresh_thread()
+
+    def shared_token(self, access_token_url):
+        """Adopts a token saved in `token_store` by another process.
+
+        The saved token is used only if it differs from the current one and
+        is still valid (outside `refresh_margin` when a `refresh_mode` is
+        set).
+
+        returns:
+        access_token or None
+        """
+        if self.token_store is None:
+            return None
+        record = self.token_store.load(self.client_id, access_token_url)
+        if record is None:
+            return None
+        access_token, token_issued, token_expires = record
+        usable_until = datetime.datetime.utcnow()
+        if self.refresh_mode is not None:
+            usable_until += self._margin(token_expires - token_issued)
+        if access_token == self.access_token or token_expires <= usable_until:
+            return None
+        self._set_token(access_token, token_issued, token_expires,
+                        access_token_url)
+        return access_token
+
+    def _margin(self, lifetime):
+        """Returns `refresh_margin` capped at `MAX_MARGIN_FRACTION` of a
+        token `lifetime`, so that a renewed token is not due at once.
+        """
+        return min(self.refresh_margin, lifetime * self.MAX_MARGIN_FRACTION)
+
+    def refresh_at(self):
+        """Returns time at which the token should be renewed, or None.
+        """
+        with self._token_lock:
+            token_expires = self.token_expires
+            token_received = self.token_received
+        if token_expires is None:
+            return None
+        margin = self.refresh_margin
+        if token_received is not None:
+            margin = self._margin(token_expires - token_received)
+        refresh_at = token_expires - margin
+        if self._last_refresh is not None:
+            interval = datetime.timedelta(seconds=self.MIN_REFRESH_INTERVAL)
+            refresh_at = max(refresh_at, self._last_refresh + interval)
+        return refresh_at
+
+    @property
+    def refresh_due(self):
+        """True if the token expires within `refresh_margin`.
+        """
+        refresh_at = self.refresh_at()
+        if refresh_at is None:
+            return False
+        return refresh_at <= datetime.datetime.utcnow()
+
+    def refresh(self):
+        """Renews the access token from the saved `access_token_url`.
+
+        returns:
+        access_token
+        """
+        if self.access_token_url is None:
+            errmsg = "Cannot refresh token: access_token_url is unknown"
+            raise ExpiredToken(errmsg)
+        return self.get_access_token2(self.access_token_url)
+
+    def token_state(self):
+        """Returns (access_token, token_expires) read together.
+        """
+        with self._token_lock:
+            return self.access_token, self.token_expires
+
+    def renew_token(self, stale_token=None):
+        """Renews the access token unless another thread has already
+        replaced `stale_token` with a valid one.
+
+        Only one renewal runs at a time; threads arriving meanwhile wait
+        for it and then reuse the new token instead of requesting their own.
+
+        Kwargs:
+           `stale_token` -- the token the caller found unusable
+
+        returns:
+        access_token
+        """
+        with self._renew_lock:
+            access_token, token_expires = self.token_state()
+            now = datetime.datetime.utcnow()
+            replaced = access_token is not None and access_token != stale_token
+            if replaced and token_expires is not None and token_expires > now:
+                return access_token
+            return self.refresh()
+
+    def _refresh_quietly(self):
+        """Refreshes the token, leaving the current token in place on
+        failure so that signing falls back to reauthorizing on expiry.
+        """
+        self._last_refresh = datetime.datetime.utcnow()
+        try:
+            self.renew_token(stale_token=self.access_token)
+            return True
+        except (NoToken, ExpiredToken, requests.RequestException):
+            return False
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+
+    def _start_lazy_refresh(self):
+        """Starts a one-off refresh thread unless one is running.
+        """
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh_quietly,
+                                  name="pmp-token-refresh", daemon=True)
+        thread.start()
+
+    def _start_refresh_thread(self):
+        """Starts the background refresh thread unless it is running.
+        """
+        with self._refresh_lock:
+            thread = self._refresh_thread
+            if thread is not None and thread.is_alive():
+                return
+            self._stop_refresh.clear()
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_loop,
+                name="pmp-token-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh_loop(self, retry_interval=30):
+        """Sleeps until `refresh_margin` before expiry, then renews the
+        token; repeats until `stop_refresh` is called.
+        """
+        while not self._stop_refresh.is_set():
+            now = datetime.datetime.utcnow()
+            wait = self.refresh_at() - now
+            if wait.total_seconds() > 0:
+                if self._stop_refresh.wait(wait.total_seconds()):
+                    return
+                continue
+            with self._refresh_lock:
+                self._refreshing = True
+            if not self._refresh_quietly():
+                if self._stop_refresh.wait(retry_interval):
+                    return
+
+    def stop_refresh(self):
+        """Stops the background refresh thread, if any.
+        """
+        self._stop_refresh.set()
+        thread = self._refresh_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._refresh_thread = None
+
     def sign_request(self, request_obj):
         """Provided with a :class:requests.Request object, this method will sign a
         request for the PMP API. Raises ExpiredToken if token has expired
@@ -201,14 +421,19 @@ class PmpAuth(object):
            instance of `requests.Request` (signed)
         """
         now = datetime.datetime.utcnow()
-        if self.access_token is None:
+        access_token, token_expires = self.token_state()
+        if access_token is None:
             raise NoToken("Access Token missing and needed to sign request")
 
-        elif self.token_expires < now:
+        elif token_expires < now:
             errmsg = "Access token expired: create new access token"
             errmsg += " You may use get_access_token method of PmpAuth object."
             raise ExpiredToken(errmsg)
 
-        token_signed = 'Bearer {}'.format(self.access_token)
+        elif self.refresh_mode == 'lazy' and self.refresh_due:
+            # still valid: sign now and renew off the request path
+            self._start_lazy_refresh()
+
+        token_signed = 'Bearer {}'.format(access_token)
         request_obj.headers['Authorization'] = token_signed
         return request_obj
@@ -0,0 +1,759 @@
+"""
+.. module:: pmp_api.core.cache
+   :synopsis: Response caches for the PMP connector
+
+The :class:`ResponseCache <ResponseCache>` object keeps parsed
+collection.doc+json bodies together with their `ETag` and `Last-Modified`
+validators, so that :class:`PmpConnector <pmp_api.core.conn.PmpConnector>`
+can issue conditional GETs and reuse the cached body on a `304 Not
+Modified` response::
+
+   >>> from pmp_api.core.cache import ResponseCache
+   >>> cache = ResponseCache(max_entries=500, max_bytes=50 * 1024 * 1024)
+   >>> pmp_connect = PmpConnector(pmp_auth, cache=cache)
+
+Entries are evicted least-recently-used first once either limit is passed.
+
+The :class:`SqliteCache <SqliteCache>` object stores compressed responses
+on disk with a time-to-live, so that restarted processes (or several
+worker processes) can share them. While an entry is fresh it is served
+without any request at all. Caches may be layered with
+:class:`ChainCache <ChainCache>`::
+
+   >>> cache = ChainCache(ResponseCache(), SqliteCache('/var/cache/pmp.db'))
+
+The :class:`HomeDocCache <HomeDocCache>` object keeps the home-doc of each
+entry point, which rarely changes, so that
+:class:`Client <pmp_api.pmp_client.Client>` fetches it once per `ttl`::
+
+   >>> home_cache = HomeDocCache(ttl=3600, path='/var/cache/pmp-home.json')
+   >>> client = Client(ENTRY_POINT, home_cache=home_cache)
+
+The :class:`QueryCache <QueryCache>` object keeps query results keyed by
+query urn and params, whatever order the params were given in, each for
+the `ttl` of its urn. :class:`Client <pmp_api.pmp_client.Client>` drops
+results that list a document it saves or deletes::
+
+   >>> query_cache = QueryCache(ttls={'urn:collectiondoc:query:docs': 60})
+   >>> client = Client(ENTRY_POINT, query_cache=query_cache)
+"""
+import os
+import time
+import zlib
+import sqlite3
+import threading
+import requests
+
+from collections import OrderedDict
+
+from ..collectiondoc.navigabledoc import NavigableDoc
+from ..utils import json_codec
+from ..utils.json_utils import copy_json
+
+# `_max_age` result for `Cache-Control: no-store`
+NO_STORE = object()
+
+
+class CacheEntry(object):
+    """A cached response body and the validators needed to revalidate it.
+
+    Args:
+       `body` -- parsed JSON body
+
+    Kwargs:
+       `etag` -- value of the `ETag` response header
+       `last_modified` -- value of the `Last-Modified` response header
+       `size` -- size of the response body in bytes
+       `expires` -- timestamp until which the entry may be used without
+       revalidation (None if it must always be revalidated)
+       `no_store` -- True if the response said `Cache-Control: no-store`
+       and must never be kept
+    """
+    def __init__(self, body, etag=None, last_modified=None, size=0,
+                 expires=None, no_store=False):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+        self.expires = expires
+        self.no_store = no_store
+
+    @classmethod
+    def from_response(cls, response, body):
+        """Returns a CacheEntry for a :class:`requests.Response`. A
+        `Cache-Control: max-age` header sets the entry's expiry and a
+        `no-store` directive marks the entry as not to be cached.
+        """
+        headers = response.headers
+        expires = None
+        max_age = _max_age(headers.get('Cache-Control', None))
+        no_store = max_age is NO_STORE
+        if max_age is not None and not no_store:
+            expires = time.time() + max_age
+        return cls(body,
+                   etag=headers.get('ETag', None),
+                   last_modified=headers.get('Last-Modified', None),
+                   size=len(response.content or b''),
+                   expires=expires,
+                   no_store=no_store)
+
+    @property
+    def fresh(self):
+        """True if the entry may be used without contacting the server.
+        """
+        return self.expires is not None and time.time() < self.expires
+
+    @property
+    def revalidatable(self):
+        """True if the entry has validators for a conditional request.
+        """
+        return self.etag is not None or self.last_modified is not None
+
+    def validators(self):
+        """Returns conditional request headers for this entry.
+        """
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+def _max_age(cache_control):
+    """Returns max-age in seconds from a `Cache-Control` header or None.
+    A `no-cache` directive returns 0 and a `no-store` directive returns
+    `NO_STORE`, whatever else the header says.
+    """
+    if not cache_control:
+        return None
+    max_age = None
+    for directive in cache_control.split(','):
+        directive = directive.strip().lower()
+        if directive == 'no-store':
+            return NO_STORE
+        if directive == 'no-cache':
+            max_age = 0
+        elif directive.startswith('max-age=') and max_age is None:
+            try:
+                max_age = int(directive.split('=', 1)[1])
+            except ValueError:
+                pass
+    return max_age
+
+
+def _storable(entry, ttl):
+    """Applies default `ttl` to `entry` and returns True if the entry is
+    worth caching: it can be revalidated or it has not yet expired, and
+    the server did not forbid storing it.
+    """
+    if entry.no_store:
+        return False
+    if entry.expires is None and ttl is not None:
+        entry.expires = time.time() + ttl
+    return entry.revalidatable or entry.fresh
+
+
+class LRUStore(object):
+    """Thread-safe mapping bounded by number of entries and total size,
+    which evicts least-recently-used entries first.
+
+    Kwargs:
+       `max_entries` -- maximum number of entries (None for no limit)
+       `max_bytes` -- maximum total size of entries (None for no limit)
+    """
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns value stored for `key` and marks it recently used.
+        """
+        with self._lock:
+            try:
+                value, size = self._entries[key]
+            except KeyError:
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=0):
+        """Stores `value` under `key`, evicting old entries if needed.
+        Values larger than `max_bytes` are not stored.
+        """
+        with self._lock:
+            self._discard(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        """Removes `key` and returns its value.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value, _ = self._entries[key]
+            self._discard(key)
+            return value
+
+    def keys(self):
+        """Returns list of keys, least-recently-used first.
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def items(self):
+        """Returns list of (key, value) tuples, least-recently-used first,
+        without marking them used.
+        """
+        with self._lock:
+            return [(key, value) for key, (value, _)
+                    in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _discard(self, key):
+        if key in self._entries:
+            _, size = self._entries.pop(key)
+            self.total_bytes -= size
+
+    def _evict(self):
+        while self._entries and (
+                (self.max_entries is not None
+                 and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None
+                 and self.total_bytes > self.max_bytes)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+
+class ResponseCache(object):
+    """In-memory cache of :class:`CacheEntry <CacheEntry>` objects keyed
+    by url.
+
+    Kwargs:
+       `max_entries` -- maximum number of cached responses
+       `max_bytes` -- maximum total size of cached response bodies
+       `ttl` -- seconds a response may be reused without revalidation
+       when the server does not say (None: always revalidate)
+    """
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024,
+                 ttl=None):
+        self.ttl = ttl
+        self._store = LRUStore(max_entries=max_entries, max_bytes=max_bytes)
+
+    def __len__(self):
+        return len(self._store)
+
+    @property
+    def total_bytes(self):
+        return self._store.total_bytes
+
+    def get(self, url):
+        """Returns CacheEntry for `url` or None.
+        """
+        return self._store.get(url)
+
+    def set(self, url, entry):
+        """Stores a CacheEntry for `url`.
+        """
+        if _storable(entry, self.ttl):
+            self._store.set(url, entry, entry.size)
+        else:
+            self._store.pop(url)
+
+    def delete(self, url):
+        """Removes any entry stored for `url`.
+        """
+        self._store.pop(url)
+
+    def clear(self):
+        self._store.clear()
+
+
+class NavigationCache(object):
+    """Bounded cache of recently visited :class:`NavigableDoc` objects,
+    keyed by url, used by :class:`Client <pmp_api.pmp_client.Client>` so
+    that `back`, `forward` and re-visits do not refetch pages.
+
+    Documents are copied when stored and when returned, so edits made to
+    a document in hand never show up as server state.
+
+    Kwargs:
+       `depth` -- maximum number of documents kept
+       `max_bytes` -- maximum total (approximate serialized) size of
+       documents kept
+       `max_age` -- seconds a document is reused before it is fetched
+       again (None: reuse until evicted)
+    """
+    def __init__(self, depth=20, max_bytes=16 * 1024 * 1024, max_age=None):
+        self.max_age = max_age
+        self._store = LRUStore(max_entries=depth, max_bytes=max_bytes)
+
+    def __len__(self):
+        return len(self._store)
+
+    def get(self, url):
+        """Returns a copy of the fresh NavigableDoc stored for `url` or
+        None.
+        """
+        cached = self._store.get(url)
+        if cached is None:
+            return None
+        body, stored = cached
+        if self.max_age is not None and time.time() - stored > self.max_age:
+            self._store.pop(url)
+            return None
+        return NavigableDoc(copy_json(body))
+
+    def set(self, url, document, size=None):
+        """Stores a copy of NavigableDoc `document` for `url`. Its `size`
+        in bytes is estimated when not given.
+        """
+        body = copy_json(document.collectiondoc)
+        if size is None:
+            size = _approximate_size(body)
+        self._store.set(url, (body, time.time()), size)
+
+    def delete(self, url):
+        self._store.pop(url)
+
+    def clear(self):
+        self._store.clear()
+
+
+class QueryCache(object):
+    """Bounded cache of query results (:class:`NavigableDoc` objects)
+    keyed by query urn and canonicalized params, so that equal queries hit
+    the same entry however their params are ordered or typed.
+
+    Each entry remembers the hrefs and guids of the documents it lists, so
+    that `invalidate` can drop every page a changed document appears in.
+
+    Kwargs:
+       `ttl` -- seconds results are reused (None: until evicted)
+       `ttls` -- dictionary of seconds per query urn, overriding `ttl`
+       `max_entries` -- maximum number of results kept
+       `max_bytes` -- maximum total (approximate serialized) size of
+       results kept
+    """
+    def __init__(self, ttl=300, ttls=None, max_entries=256,
+                 max_bytes=16 * 1024 * 1024):
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self._store = LRUStore(max_entries=max_entries, max_bytes=max_bytes)
+
+    def __len__(self):
+        return len(self._store)
+
+    @staticmethod
+    def key(rel_type, params=None):
+        """Returns hashable key for query `rel_type` with `params`. Params
+        set to None are left out, as they are when the query is expanded.
+        """
+        canonical = []
+        for name, value in (params or {}).items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                value = tuple(str(part) for part in value)
+            else:
+                value = str(value)
+            canonical.append((str(name), value))
+        return rel_type, tuple(sorted(canonical))
+
+    def get(self, rel_type, params=None):
+        """Returns (endpoint, NavigableDoc) stored for the query, or None
+        if there is none or it has expired.
+        """
+        key = self.key(rel_type, params)
+        cached = self._store.get(key)
+        if cached is None:
+            return None
+        endpoint, document, expires, _ = cached
+        if expires is not None and time.time() >= expires:
+            self._store.pop(key)
+            return None
+        return endpoint, document
+
+    def set(self, rel_type, params, endpoint, document, size=None):
+        """Stores NavigableDoc `document` fetched from `endpoint` as the
+        result of the query. Its `size` in bytes is estimated when not
+        given.
+        """
+        ttl = self.ttls.get(rel_type, self.ttl)
+        if ttl is not None and ttl <= 0:
+            return
+        expires = time.time() + ttl if ttl is not None else None
+        if size is None:
+            size = _approximate_size(document.collectiondoc)
+        self._store.set(self.key(rel_type, params),
+                        (endpoint, document, expires, _references(document)),
+                        size)
+
+    def invalidate(self, href=None, guid=None):
+        """Removes results listing the document with `href` or `guid`.
+
+        Returns number of results removed.
+        """
+        doomed = {ref for ref in (href, guid) if ref}
+        removed = 0
+        for key, (_, _, _, references) in self._store.items():
+            if doomed & references:
+                self._store.pop(key)
+                removed += 1
+        return removed
+
+    def clear(self):
+        self._store.clear()
+
+
+def _approximate_size(collectiondoc):
+    """Returns estimated serialized size of a collection.doc+json body: its
+    first item counts for every item, so that long listings are not
+    serialized in full just to be measured.
+    """
+    items = collectiondoc.get('items') or []
+    if not items:
+        return len(json_codec.dumps(collectiondoc))
+    head = {key: value for key, value in collectiondoc.items()
+            if key != 'items'}
+    return (len(json_codec.dumps(head)) +
+            len(json_codec.dumps(items[0])) * len(items))
+
+
+def _references(document):
+    """Returns frozenset of the hrefs and guids of a NavigableDoc and of
+    its items.
+    """
+    references = set()
+    for doc in [document.collectiondoc] + list(document.items or ()):
+        references.add(doc.get('href'))
+        references.add((doc.get('attributes') or {}).get('guid'))
+    references.discard(None)
+    references.discard('')
+    return frozenset(references)
+
+
+class HomeDocCache(object):
+    """Home-docs keyed by entry point, kept in memory and optionally in a
+    JSON file so that restarted processes can reuse them.
+
+    A home-doc is reused without any request for `ttl` seconds (or the
+    response's `Cache-Control: max-age`). After that it is revalidated with
+    a conditional GET when the server sent validators.
+
+    Kwargs:
+       `ttl` -- seconds a home-doc is used without contacting the server
+       `path` -- location of the JSON file home-docs are saved to
+    """
+    def __init__(self, ttl=3600, path=None):
+        self.ttl = ttl
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            self._entries.update(self._read())
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as home_file:
+                saved = json_codec.loads(home_file.read())
+        except (OSError, ValueError):
+            return {}
+        entries = {}
+        for entry_point, record in saved.items():
+            try:
+                entries[entry_point] = CacheEntry(
+                    record['body'], etag=record.get('etag'),
+                    last_modified=record.get('last_modified'),
+                    expires=record.get('expires'))
+            except (KeyError, TypeError, AttributeError):
+                continue
+        return entries
+
+    def _write(self):
+        records = {entry_point: {'body': entry.body,
+                                 'etag': entry.etag,
+                                 'last_modified': entry.last_modified,
+                                 'expires': entry.expires}
+                   for entry_point, entry in self._entries.items()}
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, 'w') as home_file:
+            home_file.write(json_codec.dumps(records))
+        os.replace(tmp_path, self.path)
+
+    def get(self, entry_point):
+        """Returns CacheEntry for `entry_point`, fresh or not, or None.
+        """
+        with self._lock:
+            return self._entries.get(entry_point)
+
+    def set(self, entry_point, entry):
+        with self._lock:
+            self._entries[entry_point] = entry
+            if self.path is not None:
+                self._write()
+
+    def delete(self, entry_point):
+        with self._lock:
+            if self._entries.pop(entry_point, None) and self.path is not None:
+                self._write()
+
+    def store(self, entry_point, home_doc):
+        """Saves `home_doc` fetched by other means, fresh for `ttl`.
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        self.set(entry_point, CacheEntry(copy_json(home_doc),
+                                         expires=expires))
+
+    def fresh(self, entry_point):
+        """True if the home-doc for `entry_point` may be used without
+        contacting the server.
+        """
+        entry = self.get(entry_point)
+        return entry is not None and entry.fresh
+
+    def fetch(self, entry_point):
+        """Returns the home-doc for `entry_point`: from the cache while
+        fresh, otherwise requested (conditionally, if possible) and saved.
+
+        Each call returns a separate copy of the document.
+        """
+        entry = self.get(entry_point)
+        if entry is not None and entry.fresh:
+            return copy_json(entry.body)
+
+        headers = entry.validators() if entry is not None else {}
+        response = requests.get(entry_point, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            entry.expires = None
+        else:
+            response.raise_for_status()
+            body = json_codec.loads(response.content)
+            entry = CacheEntry.from_response(response, body)
+            if entry.no_store:
+                self.delete(entry_point)
+                return body
+        if entry.expires is None and self.ttl is not None:
+            entry.expires = time.time() + self.ttl
+        self.set(entry_point, entry)
+        return copy_json(entry.body)
+
+
+class SqliteCache(object):
+    """On-disk cache of :class:`CacheEntry <CacheEntry>` objects keyed by
+    url, stored in a SQLite database.
+
+    Bodies are stored zlib-compressed. Every entry has a time-to-live;
+    expired entries that carry validators are kept for revalidation, others
+    are dropped. When the total size of stored bodies passes `max_bytes`,
+    least-recently-used entries are removed.
+
+    The database is opened in WAL mode with a busy timeout, so several
+    threads and worker processes may share one cache file.
+
+    Args:
+       `path` -- location of the SQLite database file
+
+    Kwargs:
+       `ttl` -- seconds a response may be reused without revalidation
+       when the server does not say
+       `max_bytes` -- maximum total size of compressed bodies
+       `compress_level` -- zlib compression level
+       `timeout` -- seconds to wait for another process holding a lock
+    """
+    def __init__(self, path, ttl=300, max_bytes=256 * 1024 * 1024,
+                 compress_level=6, timeout=30.0):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.timeout = timeout
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        """Returns a connection for the current thread and process.
+        """
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                            url TEXT PRIMARY KEY,
+                            etag TEXT,
+                            last_modified TEXT,
+                            body BLOB NOT NULL,
+                            size INTEGER NOT NULL,
+                            expires REAL,
+                            accessed REAL NOT NULL)""")
+        conn.execute("""CREATE INDEX IF NOT EXISTS responses_accessed
+                        ON responses (accessed)""")
+
+    def __len__(self):
+        conn = self._connect()
+        return conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    @property
+    def total_bytes(self):
+        conn = self._connect()
+        query = 'SELECT COALESCE(SUM(size), 0) FROM responses'
+        return conn.execute(query).fetchone()[0]
+
+    def get(self, url):
+        """Returns CacheEntry for `url` or None.
+        """
+        conn = self._connect()
+        row = conn.execute("""SELECT etag, last_modified, body, expires
+                              FROM responses WHERE url = ?""",
+                           (url,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body, expires = row
+        entry = CacheEntry(None, etag=etag, last_modified=last_modified,
+                           expires=expires)
+        if not entry.fresh and not entry.revalidatable:
+            self.delete(url)
+            return None
+        raw = zlib.decompress(body)
+        entry.body = json_codec.loads(raw)
+        entry.size = len(raw)
+        conn.execute('UPDATE responses SET accessed = ? WHERE url = ?',
+                     (time.time(), url))
+        return entry
+
+    def set(self, url, entry):
+        """Stores a CacheEntry for `url` and trims the cache to
+        `max_bytes`.
+        """
+        if not _storable(entry, self.ttl):
+            self.delete(url)
+            return
+        raw = json_codec.dumps(entry.body).encode('utf-8')
+        body = zlib.compress(raw, self.compress_level)
+        if len(body) > self.max_bytes:
+            self.delete(url)
+            return
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute("""INSERT OR REPLACE INTO responses
+                            (url, etag, last_modified, body, size,
+                             expires, accessed)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                         (url, entry.etag, entry.last_modified,
+                          sqlite3.Binary(body), len(body),
+                          entry.expires, time.time()))
+            self._trim(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _trim(self, conn):
+        """Removes least-recently-used entries until the total size is
+        below `max_bytes`.
+        """
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses')
+        excess = total.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        rows = conn.execute("""SELECT url, size FROM responses
+                               ORDER BY accessed ASC""")
+        doomed = []
+        for url, size in rows:
+            if excess <= 0:
+                break
+            doomed.append((url,))
+            excess -= size
+        conn.executemany('DELETE FROM responses WHERE url = ?', doomed)
+
+    def delete(self, url):
+        """Removes any entry stored for `url`.
+        """
+        conn = self._connect()
+        conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+
+    def purge_expired(self):
+        """Removes entries that have expired and cannot be revalidated.
+        """
+        conn = self._connect()
+        conn.execute("""DELETE FROM responses
+                        WHERE expires < ? AND etag IS NULL
+                        AND last_modified IS NULL""", (time.time(),))
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM responses')
+
+    def close(self):
+        """Closes the connection opened by the current thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class ChainCache(object):
+    """Layers several caches, for example a fast in-memory cache in front
+    of a shared :class:`SqliteCache <SqliteCache>`.
+
+    Lookups try each cache in order and copy hits into the caches in
+    front; writes and deletes go to every cache.
+
+    Args:
+       `caches` -- cache objects, fastest first
+    """
+    def __init__(self, *caches):
+        self.caches = caches
+
+    def get(self, url):
+        """Returns the first CacheEntry found for `url` or None.
+        """
+        for index, cache in enumerate(self.caches):
+            entry = cache.get(url)
+            if entry is not None:
+                for front in self.caches[:index]:
+                    front.set(url, entry)
+                return entry
+        return None
+
+    def set(self, url, entry):
+        for cache in self.caches:
+            cache.set(url, entry)
+
+    def delete(self, url):
+        for cache in self.caches:
+            cache.delete(url)
+
+    def clear(self):
+        for cache in self.caches:
+            cache.clear()
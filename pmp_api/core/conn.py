@@ -6,14 +6,25 @@ The :class:`PmpConnector <PmpConnector>` object takes a
 :class:`PmpAuth <PmpAuth>` object and uses it to issue signed
 requests for all PMP endpoints.
 """
+import os
 import datetime
+import threading
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+from collections import deque
 from operator import lt
+from requests.adapters import HTTPAdapter
 
+from .cache import CacheEntry
+from .singleflight import SingleFlight
 from .exceptions import BadRequest
 from .exceptions import EmptyResponse
 from .exceptions import ExpiredToken
+from ..utils import json_codec
+from ..utils.json_utils import copy_json
 
 
 class PmpConnector(object):
@@ -28,22 +39,105 @@ class PmpConnector(object):
        >>> pmp_connect = PmpConnector(pmp_auth)
        >>> pmp_connect.get("https://api-pilot.pmp.io/docs")
 
+    All requests share a single pooled :class:`requests.Session`, so
+    connections are kept alive between calls. The session is built on
+    first use and may be released with `close` or by using the connector
+    as a context manager::
+
+       >>> with PmpConnector(pmp_auth, pool_maxsize=20) as pmp_connect:
+       ...     pmp_connect.get("https://api-pilot.pmp.io/docs")
+
     Methods:
-      `get` -- the sole method of the PmpConnector is for signing
-    requests for PMP endpoints. This method will automatically
-    attempt to renew its access token if the token has expired.
+      `get`, `put`, `delete` -- sign requests for PMP endpoints. These
+    methods will automatically attempt to renew the access token if the
+    token has expired.
 
     Args:
        `auth_object` -- :class:`PmpAuth <PmpAuth>` object for authentication
 
     Kwargs:
       `base_url` -- url to make requests of PMP API
+      `pool_connections` -- number of per-host connection pools to cache
+      `pool_maxsize` -- maximum number of connections kept per host
+      `pool_block` -- block when a host pool is exhausted instead of
+      opening throwaway connections
+      `keep_alive` -- when False, ask the server to close each connection
+      `cache` -- response cache from :mod:`pmp_api.core.cache` used to
+      reuse fresh documents and make conditional GET requests
+      `retry` -- :class:`RetryPolicy <pmp_api.core.retry.RetryPolicy>` for
+      transient failures (None: send each request once)
+      `rate_limiter` -- :class:`RateLimiter <pmp_api.core.ratelimit.RateLimiter>`
+      consulted before every send
+      `coalesce` -- when True, concurrent GETs for the same url share one
+      request
 
     """
-    def __init__(self, auth_object, base_url="https://api-sandbox.pmp.io"):
+    def __init__(self, auth_object, base_url="https://api-sandbox.pmp.io",
+                 pool_connections=10, pool_maxsize=10, pool_block=False,
+                 keep_alive=True, cache=None, retry=None, rate_limiter=None,
+                 coalesce=False):
         self.authorizer = auth_object
+        self.coalesce = coalesce
+        self._flight = SingleFlight()
+        self.cache = cache
+        self.retry = retry
+        self.rate_limiter = rate_limiter
         self.base_url = base_url
         self.last_url = None
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def session(self):
+        """Pooled :class:`requests.Session` shared by all requests.
+
+        The session is created lazily and is rebuilt if the process has
+        forked since it was created: sockets inherited from a parent
+        process must not be shared with the child. Threads using the
+        connector at once share one session.
+        """
+        pid = os.getpid()
+        session = self._session
+        if session is not None and self._session_pid == pid:
+            return session
+        with self._session_lock:
+            if self._session is None or self._session_pid != pid:
+                self._session = self._make_session()
+                self._session_pid = pid
+            return self._session
+
+    def _make_session(self):
+        """Returns a new :class:`requests.Session` with pooled adapters
+        mounted for http and https.
+        """
+        sesh = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                              pool_maxsize=self.pool_maxsize,
+                              pool_block=self.pool_block)
+        sesh.mount('https://', adapter)
+        sesh.mount('http://', adapter)
+        return sesh
+
+    def close(self):
+        """Closes the pooled session and all of its open connections.
+        A new session will be created on the next request.
+        """
+        if self._session is not None:
+            if self._session_pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._session_pid = None
 
     @property
     def authorized(self):
@@ -60,23 +154,27 @@ class PmpConnector(object):
     def reauthorize(self):
         """Attempts to reauthorize an expired token.
 
+        Safe to call from many threads at once, and from several connectors
+        sharing one authorizer: :meth:`PmpAuth.renew_token
+        <pmp_api.core.auth.PmpAuth.renew_token>` requests one new token
+        while the others wait for it and then reuse it.
+
         Returns True if reauthorization is successful.
 
         Raises ExpiredToken if reauthorization fails.
         """
+        stale_token = self.authorizer.access_token
         if self.authorized:
             return True
-        else:
-            if self.authorizer.access_token_url is None:
-                errmsg = "Access token expired and access_token_url is unknown"
-                errmsg += " Create new access token for PmpAuth object."
-                raise ExpiredToken(errmsg)
-            else:
-                url = self.authorizer.access_token_url
-                self.authorizer.get_access_token2(url)
-                return True
-
-    def _request_factory(self, req_method, req_endpoint, payload=None):
+        if self.authorizer.access_token_url is None:
+            errmsg = "Access token expired and access_token_url is unknown"
+            errmsg += " Create new access token for PmpAuth object."
+            raise ExpiredToken(errmsg)
+        self.authorizer.renew_token(stale_token=stale_token)
+        return True
+
+    def _request_factory(self, req_method, req_endpoint, payload=None,
+                         headers=None, idempotent=False):
         """Assembles Request and Session and sends Request.
 
         This method factors out commonalities between other request methods:
@@ -90,16 +188,23 @@ class PmpConnector(object):
 
         Kwargs:
            `payload` -- Data to send to server (for "PUT"s)
+           `headers` -- Extra request headers
+           `idempotent` -- allow the `retry` policy to resend a "PUT" or
+           "DELETE"
 
         Returns response from server to calling method.
         """
-        sesh = requests.Session()
+        sesh = self.session
         if payload is None:
             req = requests.Request(req_method, req_endpoint)
         else:
             req = requests.Request(req_method, req_endpoint, data=payload)
         req.headers = {}
         req.headers['Content-Type'] = 'application/vnd.collection.doc+json'
+        if not self.keep_alive:
+            req.headers['Connection'] = 'close'
+        if headers:
+            req.headers.update(headers)
 
         try:
             signed_req = self.authorizer.sign_request(req)
@@ -108,8 +213,18 @@ class PmpConnector(object):
             signed_req = self.authorizer.sign_request(req)
 
         prepped_req = sesh.prepare_request(signed_req)
-        response = sesh.send(prepped_req)
-        return response
+
+        def send():
+            if self.rate_limiter is None:
+                return sesh.send(prepped_req)
+            self.rate_limiter.acquire(req_method)
+            response = sesh.send(prepped_req)
+            self.rate_limiter.update(req_method, response.headers)
+            return response
+
+        if self.retry is None:
+            return send()
+        return self.retry.call(req_method, send, idempotent=idempotent)
 
     def get(self, endpoint):
         """GETs a document from from requested PMP endpoint.
@@ -117,40 +232,166 @@ class PmpConnector(object):
         Args:
            `endpoint` -- PMP API url
 
+        If `coalesce` is set, threads asking for the same url with the same
+        access token while a request is in flight wait for that request and
+        receive their own copy of its result.
+
+        If the connector has a `cache`, fresh cached documents are returned
+        without a request. Other requests for cached endpoints are sent with
+        `If-None-Match` / `If-Modified-Since` validators and the cached
+        document is returned when the server replies `304`.
+
         Returns dictionary of values (JSON) returned by endpoint.
         """
-        response = self._request_factory('GET', endpoint)
-
-        if response.ok:
+        if self.coalesce:
+            key = (endpoint, self.authorizer.access_token)
+            return self._flight.do(key, lambda: self._get(endpoint),
+                                   share=copy_json)
+        return self._get(endpoint)
+
+    def _get(self, endpoint):
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.get(endpoint)
+            if entry is not None and entry.fresh:
+                self.last_url = endpoint
+                return copy_json(entry.body)
+        headers = entry.validators() if entry is not None else None
+        response = self._request_factory('GET', endpoint, headers=headers)
+
+        if entry is not None and response.status_code == 304:
+            self.last_url = endpoint
+            # renew the entry's time-to-live
+            entry.expires = None
+            self.cache.set(endpoint, entry)
+            return copy_json(entry.body)
+        elif response.ok:
             self.last_url = endpoint
             try:
-                results = response.json()
-                return results
+                results = json_codec.loads(response.content)
             except ValueError:
                 errmsg = "No JSON returned by endpoint: {}.".format(endpoint)
                 raise EmptyResponse(errmsg)
+            if self.cache is not None:
+                self._cache_response(endpoint, response, results)
+            return results
         else:
             errmsg = "Bad response from server on request for endpoint: {}"
             errmsg += " Response status code: {}"
             raise BadRequest(errmsg.format(endpoint,
                                            response.status_code))
 
-    def put(self, endpoint, document):
+    def _cache_response(self, endpoint, response, results):
+        """Stores a copy of `results` in the `cache`.
+        """
+        entry = CacheEntry.from_response(response, copy_json(results))
+        self.cache.set(endpoint, entry)
+
+    def get_many(self, endpoints, max_workers=8, ordered=False):
+        """GETs many documents concurrently over the shared session.
+
+        Requests are issued from a pool of `max_workers` threads and no
+        more than `max_workers` requests are ever in flight, so
+        `endpoints` may be a long (or lazy) iterable.
+
+        Args:
+           `endpoints` -- iterable of PMP API urls
+
+        Kwargs:
+           `max_workers` -- number of concurrent requests
+           `ordered` -- yield results in the order of `endpoints` rather
+           than as they complete
+
+        Returns generator of (endpoint, result) tuples in the order they
+        complete, where result is the dictionary of values returned by the
+        endpoint or the exception raised while requesting it.
+        """
+        if ordered:
+            return self._get_ordered(iter(endpoints), max_workers)
+        return self._get_unordered(iter(endpoints), max_workers)
+
+    def _get_ordered(self, endpoints, max_workers):
+        """Yields results in request order. Up to `max_workers` requests
+        run ahead of the result being yielded.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            window = deque()
+
+            def submit_next():
+                endpoint = next(endpoints, None)
+                if endpoint is None:
+                    return False
+                window.append((endpoint, executor.submit(self.get, endpoint)))
+                return True
+
+            while len(window) < max_workers and submit_next():
+                pass
+
+            try:
+                while window:
+                    endpoint, future = window.popleft()
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        result = exc
+                    submit_next()
+                    yield endpoint, result
+            finally:
+                for _, future in window:
+                    future.cancel()
+
+    def _get_unordered(self, endpoints, max_workers):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+
+            def submit_next():
+                endpoint = next(endpoints, None)
+                if endpoint is None:
+                    return False
+                pending[executor.submit(self.get, endpoint)] = endpoint
+                return True
+
+            while len(pending) < max_workers and submit_next():
+                pass
+
+            try:
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        endpoint = pending.pop(future)
+                        submit_next()
+                        try:
+                            yield endpoint, future.result()
+                        except Exception as exc:
+                            yield endpoint, exc
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def put(self, endpoint, document, idempotent=False):
         """PUTs a passed-in document up to PMP API at endpoint url.
 
         Args:
            `endpoint` -- PMP API url
            `document` -- collectiondoc+json document, specified in PMP spec.
 
+        Kwargs:
+           `idempotent` -- set True if repeating this PUT is safe, so that
+           it may be retried by the `retry` policy
+
         Returns dictionary of values (JSON) returned by endpoint.
         (which should be {'url': 'https://Document_location'})
         """
-        response = self._request_factory('PUT', endpoint, payload=document)
+        response = self._request_factory('PUT', endpoint, payload=document,
+                                         idempotent=idempotent)
 
         if response.ok:
             self.last_url = endpoint
+            if self.cache is not None:
+                # a fresh cached GET would hide the change
+                self.cache.delete(endpoint)
             try:
-                results = response.json()
+                results = json_codec.loads(response.content)
                 return results
             except ValueError:
                 errmsg = "No JSON returned by endpoint: {}.".format(endpoint)
@@ -165,15 +406,22 @@ class PmpConnector(object):
             raise BadRequest(errmsg)
             """
 
-    def delete(self, endpoint):
+    def delete(self, endpoint, idempotent=False):
         """Deletes the requesed endpoint from PMP API. Will return false
         on NOT AUTHORIZED response or any response that does not confirm doc
         has been deleted.
 
+        Kwargs:
+           `idempotent` -- set True if repeating this DELETE is safe, so
+           that it may be retried by the `retry` policy
+
         Returns boolean
         """
-        response = self._request_factory('DELETE', endpoint)
+        response = self._request_factory('DELETE', endpoint,
+                                         idempotent=idempotent)
         if response.status_code == 204:
+            if self.cache is not None:
+                self.cache.delete(endpoint)
             return True
         else:
             return False
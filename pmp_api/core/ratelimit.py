@@ -0,0 +1,147 @@
+"""
+.. module:: pmp_api.core.ratelimit
+   :synopsis: Client-side rate limiting for PMP requests
+
+The :class:`RateLimiter <RateLimiter>` object keeps separate token buckets
+for reads (GET) and writes (PUT, DELETE, POST). A connector asks it for a
+token before every send, so workers sharing one limiter stay under a
+sustainable request rate instead of bursting into throttling errors::
+
+   >>> from pmp_api.core.ratelimit import RateLimiter
+   >>> limiter = RateLimiter(read_rate=20, write_rate=2)
+   >>> pmp_connect = PmpConnector(pmp_auth, rate_limiter=limiter)
+
+Buckets hand out reservations under a lock and callers wait outside of it,
+so the same limiter can be shared by threads (`acquire`) and asyncio tasks
+(`acquire_async`).
+"""
+import time
+import asyncio
+import threading
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket.
+
+    Args:
+       `rate` -- tokens added per second
+
+    Kwargs:
+       `capacity` -- largest burst allowed (defaults to `rate`)
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """Takes `tokens` from the bucket and returns the number of seconds
+        the caller must wait before using them.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens=1):
+        """Waits without blocking the event loop until `tokens` are
+        available.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def set_rate(self, rate):
+        """Changes the refill rate, keeping tokens earned so far.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+
+class RateLimiter(object):
+    """Separate read and write token buckets for PMP requests.
+
+    Kwargs:
+       `read_rate` -- GET requests per second
+       `write_rate` -- PUT/DELETE/POST requests per second
+       `read_burst` -- largest burst of GETs (defaults to `read_rate`)
+       `write_burst` -- largest burst of writes (defaults to `write_rate`)
+       `adaptive` -- adjust rates from rate-limit response headers
+       `min_rate` -- lowest rate adaptive adjustment will set
+    """
+    READ_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+    def __init__(self, read_rate=10.0, write_rate=2.0, read_burst=None,
+                 write_burst=None, adaptive=False, min_rate=0.1):
+        self.read = TokenBucket(read_rate, read_burst)
+        self.write = TokenBucket(write_rate, write_burst)
+        self.max_rates = {'read': float(read_rate),
+                          'write': float(write_rate)}
+        self.adaptive = adaptive
+        self.min_rate = min_rate
+
+    def bucket(self, method):
+        """Returns TokenBucket used for requests with `method`.
+        """
+        if method.upper() in self.READ_METHODS:
+            return self.read
+        return self.write
+
+    def acquire(self, method):
+        """Blocks until a request with `method` may be sent.
+        """
+        self.bucket(method).acquire()
+
+    async def acquire_async(self, method):
+        """Waits until a request with `method` may be sent.
+        """
+        await self.bucket(method).acquire_async()
+
+    def update(self, method, headers):
+        """Adjusts the rate for `method` from response `headers` when
+        `adaptive` is set.
+
+        Understands `X-RateLimit-Remaining` together with
+        `X-RateLimit-Reset` (seconds until reset, or an epoch timestamp):
+        the remaining budget is spread evenly until the reset, never above
+        the configured rate.
+        """
+        if not self.adaptive:
+            return
+        remaining = _number(headers.get('X-RateLimit-Remaining', None))
+        reset = _number(headers.get('X-RateLimit-Reset', None))
+        if remaining is None or reset is None:
+            return
+        if reset > 1e9:
+            # epoch timestamp rather than a delta
+            reset = reset - time.time()
+        if reset <= 0:
+            return
+        kind = 'read' if method.upper() in self.READ_METHODS else 'write'
+        rate = min(self.max_rates[kind], max(self.min_rate, remaining / reset))
+        self.bucket(method).set_rate(rate)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
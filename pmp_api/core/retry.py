@@ -0,0 +1,161 @@
+"""
+.. module:: pmp_api.core.retry
+   :synopsis: Retry policy for requests made by the PMP connector
+
+The :class:`RetryPolicy <RetryPolicy>` object decides which failed
+requests :class:`PmpConnector <pmp_api.core.conn.PmpConnector>` should send
+again and how long to wait in between::
+
+   >>> from pmp_api.core.retry import RetryPolicy
+   >>> policy = RetryPolicy(max_attempts=5, total_timeout=120)
+   >>> pmp_connect = PmpConnector(pmp_auth, retry=policy)
+   >>> policy.stats['retries']
+   0
+
+Waits use exponential backoff with full jitter and honor a server's
+`Retry-After` header, up to `retry_after_max` seconds. Only idempotent requests are retried: GETs always,
+PUTs and DELETEs only when the caller says they are idempotent.
+"""
+import time
+import random
+import datetime
+import threading
+import requests
+
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy(object):
+    """Retry policy for PMP requests.
+
+    Kwargs:
+       `max_attempts` -- total number of attempts for one request
+       `statuses` -- response status codes that should be retried
+       `exceptions` -- exception classes that should be retried
+       `backoff_base` -- seconds of the first backoff window
+       `backoff_max` -- largest backoff window in seconds
+       `total_timeout` -- seconds all attempts for one request may take
+       (None for no limit)
+       `idempotent_methods` -- methods that may always be retried
+       `respect_retry_after` -- wait as long as `Retry-After` asks
+       `retry_after_max` -- longest `Retry-After` wait in seconds; a server
+       asking for more is not retried (None for no limit)
+       `sleep` -- function used to wait (replaceable for testing)
+
+    Attributes:
+       `stats` -- :class:`collections.Counter` of `requests`, `retries`,
+       `exhausted` and per-cause counts (`status_503`, `ConnectionError`)
+    """
+    def __init__(self, max_attempts=3,
+                 statuses=(429, 500, 502, 503, 504),
+                 exceptions=(requests.ConnectionError, requests.Timeout),
+                 backoff_base=0.5, backoff_max=30.0, total_timeout=None,
+                 idempotent_methods=('GET', 'HEAD', 'OPTIONS'),
+                 respect_retry_after=True, retry_after_max=120.0,
+                 sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.statuses = frozenset(statuses)
+        self.exceptions = tuple(exceptions)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.total_timeout = total_timeout
+        self.idempotent_methods = frozenset(idempotent_methods)
+        self.respect_retry_after = respect_retry_after
+        self.retry_after_max = retry_after_max
+        self.sleep = sleep
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, *keys):
+        with self._lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def can_retry(self, method, idempotent=False):
+        """Returns True if requests with `method` may be retried.
+        """
+        return idempotent or method.upper() in self.idempotent_methods
+
+    def backoff(self, attempt):
+        """Returns seconds to wait after failed `attempt` (starting at 1):
+        a random value up to an exponentially growing window.
+        """
+        window = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, window)
+
+    def retry_after(self, response):
+        """Returns seconds requested by the `Retry-After` header of
+        `response` or None.
+        """
+        value = response.headers.get('Retry-After', None)
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return None
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return max(0.0, (when - now).total_seconds())
+
+    def call(self, method, send, idempotent=False):
+        """Calls `send` until it returns a response that should not be
+        retried or attempts run out.
+
+        Args:
+           `method` -- request method ("GET", "PUT", "DELETE")
+           `send` -- function without arguments that sends the request and
+           returns a :class:`requests.Response`
+
+        Kwargs:
+           `idempotent` -- allow retries of methods not listed in
+           `idempotent_methods`
+
+        Returns the last response. Re-raises the last exception if the final
+        attempt failed with one.
+        """
+        self._count('requests')
+        retryable = self.can_retry(method, idempotent)
+        deadline = None
+        if self.total_timeout is not None:
+            deadline = time.monotonic() + self.total_timeout
+
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = send()
+            except self.exceptions as exc:
+                if not retryable:
+                    raise
+                cause, response, error = type(exc).__name__, None, exc
+            else:
+                if not retryable or response.status_code not in self.statuses:
+                    return response
+                cause = 'status_{}'.format(response.status_code)
+                error = None
+
+            delay = self.backoff(attempt)
+            too_long = False
+            if response is not None and self.respect_retry_after:
+                requested = self.retry_after(response)
+                if requested is not None:
+                    delay = requested
+                    too_long = (self.retry_after_max is not None and
+                                requested > self.retry_after_max)
+            out_of_time = too_long or (deadline is not None and
+                                       time.monotonic() + delay > deadline)
+            if attempt >= self.max_attempts or out_of_time:
+                self._count(cause, 'exhausted')
+                if error is not None:
+                    raise error
+                return response
+
+            self._count(cause, 'retries')
+            if response is not None:
+                response.close()
+            self.sleep(delay)
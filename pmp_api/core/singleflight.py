@@ -0,0 +1,88 @@
+"""
+.. module:: pmp_api.core.singleflight
+   :synopsis: Coalesces identical concurrent calls
+
+The :class:`SingleFlight <SingleFlight>` object makes sure only one call
+for a given key runs at a time: callers that arrive while a call is in
+flight wait for it and receive its result (or its exception) instead of
+repeating the work.
+
+Usage::
+
+   >>> flight = SingleFlight()
+   >>> flight.do('home', lambda: connector.get(home_url))
+"""
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """Thread-safe call coalescing keyed by any hashable value.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, share=None):
+        """Calls `func` unless a call for `key` is already running, in which
+        case waits for that call and returns its result.
+
+        Args:
+           `key` -- hashable identifying the call
+           `func` -- function without arguments
+
+        Kwargs:
+           `share` -- function applied to the result before it is handed to
+           waiting callers (for example, to give each caller its own copy).
+           The leader's result is snapshotted with `share` before any waiter
+           is woken, so the leader may modify its result at once.
+
+        Returns result of `func`; re-raises its exception in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return share(call.result) if share else call.result
+
+        try:
+            result = func()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        else:
+            call.result = result
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            if waiters and share and call.error is None:
+                # waiters copy this snapshot, never the leader's object
+                try:
+                    call.result = share(call.result)
+                except Exception as exc:
+                    call.error = exc
+            call.done.set()
+
+    def in_flight(self):
+        """Returns number of calls currently running.
+        """
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,144 @@
+"""
+.. module:: pmp_api.core.token_store
+   :synopsis: Access tokens shared between processes
+
+The :class:`FileTokenStore <FileTokenStore>` object keeps access tokens in
+a JSON file guarded by a lock file, so that worker processes using the same
+client credentials share one token instead of each requesting their own::
+
+   >>> from pmp_api.core.token_store import FileTokenStore
+   >>> store = FileTokenStore('/var/run/pmp/tokens.json')
+   >>> client.gain_access(CLIENT_ID, CLIENT_SECRET, token_store=store)
+
+Tokens are keyed by client-id and access-token url. A
+:class:`PmpAuth <pmp_api.core.auth.PmpAuth>` object holding the store
+reuses a token another process saved while it is still valid, and saves
+every token it requests for the others. Requests for a new token are made
+while holding the lock, so only one process requests at a time.
+
+Locking uses `fcntl.flock` and is only available on POSIX systems.
+"""
+import os
+import datetime
+import threading
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from ..utils import json_codec
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class FileTokenStore(object):
+    """File-backed access-token store shared by processes and threads.
+
+    The token file is created readable by its owner only.
+
+    Args:
+       `path` -- location of the JSON token file; the lock file is
+       `path` + ".lock"
+    """
+    def __init__(self, path):
+        if fcntl is None:
+            errmsg = "FileTokenStore requires fcntl (POSIX file locking)."
+            raise ImportError(errmsg)
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._local = threading.local()
+
+    @staticmethod
+    def key(client_id, access_token_url):
+        return "{} {}".format(client_id, access_token_url)
+
+    @contextlib.contextmanager
+    def locked(self, shared=False):
+        """Context manager holding the store's file lock.
+
+        Locks are re-entrant within a thread, so `load` and `save` may be
+        called while holding the exclusive lock.
+
+        Kwargs:
+           `shared` -- take a shared (read) lock instead of an exclusive one
+        """
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._local.depth = 1
+            try:
+                yield
+            finally:
+                self._local.depth = 0
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as token_file:
+                data = token_file.read()
+        except FileNotFoundError:
+            return {}
+        try:
+            tokens = json_codec.loads(data)
+        except ValueError:
+            # a damaged file only costs a token request
+            return {}
+        return tokens if isinstance(tokens, dict) else {}
+
+    def _write(self, tokens):
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as token_file:
+            token_file.write(json_codec.dumps(tokens))
+        os.replace(tmp_path, self.path)
+
+    def load(self, client_id, access_token_url):
+        """Returns (access_token, token_issued, token_expires) saved for
+        `client_id` and `access_token_url`, or None.
+        """
+        with self.locked(shared=True):
+            record = self._read().get(self.key(client_id, access_token_url))
+        if not record:
+            return None
+        try:
+            issued = datetime.datetime.strptime(record['token_issued'],
+                                                TIME_FORMAT)
+            expires = datetime.datetime.strptime(record['token_expires'],
+                                                 TIME_FORMAT)
+            return record['access_token'], issued, expires
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def save(self, client_id, access_token_url, access_token, token_issued,
+             token_expires):
+        """Saves a token for `client_id` and `access_token_url`, keeping
+        tokens saved for other credentials.
+        """
+        record = {'access_token': access_token,
+                  'token_issued': token_issued.strftime(TIME_FORMAT),
+                  'token_expires': token_expires.strftime(TIME_FORMAT)}
+        with self.locked():
+            tokens = self._read()
+            tokens[self.key(client_id, access_token_url)] = record
+            self._write(tokens)
+
+    def delete(self, client_id, access_token_url):
+        """Removes the token saved for `client_id` and `access_token_url`.
+        """
+        with self.locked():
+            tokens = self._read()
+            if tokens.pop(self.key(client_id, access_token_url), None):
+                self._write(tokens)
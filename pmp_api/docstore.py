@@ -0,0 +1,420 @@
+"""
+.. module:: pmp_api.docstore
+   :synopsis: Local SQLite mirror of PMP documents
+
+The :class:`DocumentStore <DocumentStore>` object keeps collection.doc+json
+documents in a SQLite database indexed by guid, href, profile, collections,
+tags and published date, so that repeated lookups are answered locally::
+
+   >>> from pmp_api.docstore import DocumentStore
+   >>> store = DocumentStore('/var/lib/pmp/docs.db', client=client)
+   >>> client = Client(ENTRY_POINT, doc_store=store)
+   >>> store.get('some-guid')
+   <Navigable doc: https://api.pmp.io/docs/some-guid>
+   >>> store.find(tag='kpbs', profile='story', limit=10)
+   [<Navigable doc: ...>, ...]
+
+With a `client`, a guid missing locally is fetched from the API and
+stored. `find` searches only the documents mirrored locally, unless it is
+asked to send the query to the API with `remote=True`. A :class:`Client <pmp_api.pmp_client.Client>`
+given a `doc_store` saves every document it fetches, along with the items
+of listing pages.
+
+Stored documents are also indexed for full-text search of their title,
+teaser, description, byline and content, using SQLite FTS5 where
+available::
+
+   >>> store.search('border wall', limit=10)
+   [<Navigable doc: ...>, ...]
+"""
+import os
+import re
+import html
+import zlib
+import time
+import sqlite3
+import threading
+
+from .collectiondoc.navigabledoc import NavigableDoc
+from .core.exceptions import BadRequest
+from .core.exceptions import EmptyResponse
+from .utils import json_codec
+
+
+class DocumentStore(object):
+    """SQLite store of PMP documents with secondary indexes.
+
+    The database is opened in WAL mode with a busy timeout, so several
+    threads and worker processes may share one file.
+
+    Args:
+       `path` -- location of the SQLite database file
+
+    Kwargs:
+       `client` -- authorized :class:`Client <pmp_api.pmp_client.Client>`
+       used for lookups that miss locally (None: local only)
+       `compress_level` -- zlib compression level of stored documents
+       `timeout` -- seconds to wait for another process holding a lock
+
+    Attributes:
+       `fts` -- True if search uses SQLite FTS5, False if it falls back to
+       scanning the indexed text
+    """
+    SEARCH_FIELDS = ('title', 'teaser', 'description', 'byline',
+                     'contentencoded')
+
+    def __init__(self, path, client=None, compress_level=6, timeout=30.0):
+        self.path = path
+        self.client = client
+        self.compress_level = compress_level
+        self.timeout = timeout
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        """Returns a connection for the current thread and process.
+        """
+        pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = pid
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                guid TEXT NOT NULL UNIQUE,
+                href TEXT,
+                profile TEXT,
+                published TEXT,
+                body BLOB NOT NULL,
+                stored REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS documents_href ON documents (href);
+            CREATE INDEX IF NOT EXISTS documents_profile
+                ON documents (profile, published);
+            CREATE INDEX IF NOT EXISTS documents_published
+                ON documents (published);
+            CREATE TABLE IF NOT EXISTS document_tags (
+                guid TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (tag, guid)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS document_tags_guid
+                ON document_tags (guid);
+            CREATE TABLE IF NOT EXISTS document_collections (
+                guid TEXT NOT NULL,
+                collection TEXT NOT NULL,
+                PRIMARY KEY (collection, guid)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS document_collections_guid
+                ON document_collections (guid);
+        """)
+        # rows of document_text share the rowid of their document
+        columns = ', '.join(self.SEARCH_FIELDS)
+        try:
+            conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS document_text
+                            USING fts5({})""".format(columns))
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            conn.execute("""CREATE TABLE IF NOT EXISTS document_text (
+                                id INTEGER PRIMARY KEY, {})""".format(columns))
+            self.fts = False
+
+    def __len__(self):
+        conn = self._connect()
+        return conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def put(self, document):
+        """Stores a NavigableDoc (or collection.doc dictionary). Documents
+        without a guid, such as search results, are not stored.
+
+        Returns True if the document was stored.
+        """
+        return self.put_many([document]) == 1
+
+    def put_many(self, documents):
+        """Stores many documents in one transaction.
+
+        Returns number of documents stored.
+        """
+        rows = [row for row in map(_index_row, documents) if row is not None]
+        if not rows:
+            return 0
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for guid, href, profile, published, tags, collections, doc in rows:
+                body = zlib.compress(json_codec.dumps(doc).encode('utf-8'),
+                                     self.compress_level)
+                # an upsert keeps the rowid, and so the document_text row
+                conn.execute("""INSERT INTO documents
+                                (guid, href, profile, published, body, stored)
+                                VALUES (?, ?, ?, ?, ?, ?)
+                                ON CONFLICT (guid) DO UPDATE SET
+                                href = excluded.href,
+                                profile = excluded.profile,
+                                published = excluded.published,
+                                body = excluded.body,
+                                stored = excluded.stored""",
+                             (guid, href, profile, published,
+                              sqlite3.Binary(body), time.time()))
+                rowid = conn.execute(
+                    'SELECT rowid FROM documents WHERE guid = ?',
+                    (guid,)).fetchone()[0]
+                conn.execute('DELETE FROM document_tags WHERE guid = ?',
+                             (guid,))
+                conn.executemany("""INSERT OR IGNORE INTO document_tags
+                                    (guid, tag) VALUES (?, ?)""",
+                                 [(guid, tag) for tag in tags])
+                conn.execute('DELETE FROM document_collections WHERE guid = ?',
+                             (guid,))
+                conn.executemany("""INSERT OR IGNORE INTO document_collections
+                                    (guid, collection) VALUES (?, ?)""",
+                                 [(guid, href) for href in collections])
+                self._index_text(conn, rowid, doc)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(rows)
+
+    def put_page(self, document):
+        """Stores a document and, for listings, each of its items.
+
+        Returns number of documents stored.
+        """
+        collectiondoc = _collectiondoc(document)
+        return self.put_many([collectiondoc] +
+                             list(collectiondoc.get('items') or ()))
+
+    def delete(self, guid):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT rowid FROM documents WHERE guid = ?',
+                               (guid,)).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM document_text WHERE rowid = ?', row)
+            for table in ('documents', 'document_tags',
+                          'document_collections'):
+                conn.execute('DELETE FROM {} WHERE guid = ?'.format(table),
+                             (guid,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _index_text(self, conn, rowid, doc):
+        attributes = doc.get('attributes') or {}
+        values = [_plain_text(attributes.get(field))
+                  for field in self.SEARCH_FIELDS]
+        conn.execute('DELETE FROM document_text WHERE rowid = ?', (rowid,))
+        conn.execute("""INSERT INTO document_text (rowid, {})
+                        VALUES ({})""".format(
+            ', '.join(self.SEARCH_FIELDS),
+            ', '.join('?' * (len(values) + 1))), [rowid] + values)
+
+    def rebuild_search_index(self):
+        """Indexes the text of every stored document again, for example
+        after the index was damaged or `SEARCH_FIELDS` changed.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM document_text')
+            rows = conn.execute('SELECT rowid, body FROM documents').fetchall()
+            for rowid, body in rows:
+                doc = json_codec.loads(zlib.decompress(body))
+                self._index_text(conn, rowid, doc)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def search(self, text, limit=20):
+        """Returns stored NavigableDocs containing every word of `text` in
+        their title, teaser, description, byline or content, best matches
+        first (newest first without FTS5).
+        """
+        words = _WORD.findall(text.lower())
+        if not words:
+            return []
+        conn = self._connect()
+        if self.fts:
+            match = ' '.join('"{}"'.format(word) for word in words)
+            rows = conn.execute("""SELECT d.body FROM document_text t
+                                   JOIN documents d ON d.rowid = t.rowid
+                                   WHERE document_text MATCH ?
+                                   ORDER BY bm25(document_text) LIMIT ?""",
+                                (match, limit)).fetchall()
+        else:
+            text_column = " || ' ' || ".join(
+                "COALESCE(t.{}, '')".format(field)
+                for field in self.SEARCH_FIELDS)
+            clauses = ' AND '.join(
+                "LOWER({}) LIKE ? ESCAPE '\\'".format(text_column)
+                for _ in words)
+            rows = conn.execute("""SELECT d.body FROM document_text t
+                                   JOIN documents d ON d.rowid = t.rowid
+                                   WHERE {} ORDER BY d.published DESC
+                                   LIMIT ?""".format(clauses),
+                                ['%{}%'.format(_escape_like(word))
+                                 for word in words] +
+                                [limit]).fetchall()
+        return self._load(rows)
+
+    def _load(self, rows):
+        return [NavigableDoc(json_codec.loads(zlib.decompress(body)))
+                for body, in rows]
+
+    def get(self, guid, fetch=True):
+        """Returns NavigableDoc with `guid`, from the store or, on a miss,
+        from the API (when the store has a `client` and `fetch` is True).
+        Returns None if it cannot be found.
+        """
+        conn = self._connect()
+        rows = conn.execute('SELECT body FROM documents WHERE guid = ?',
+                            (guid,)).fetchall()
+        if rows:
+            return self._load(rows)[0]
+        if fetch and self.client is not None:
+            try:
+                document = self.client.fetch_query(
+                    'urn:collectiondoc:hreftpl:docs', {'guid': guid})
+            except (BadRequest, EmptyResponse):
+                return None
+            if document is not None:
+                self.put(document)
+            return document
+
+    def get_href(self, href):
+        """Returns NavigableDoc stored for `href` or None.
+        """
+        conn = self._connect()
+        rows = conn.execute('SELECT body FROM documents WHERE href = ?',
+                            (href,)).fetchall()
+        return self._load(rows)[0] if rows else None
+
+    def find(self, tag=None, collection=None, profile=None, since=None,
+             until=None, limit=None, remote=False):
+        """Returns NavigableDocs matching all of the given filters, newest
+        published first.
+
+        `profile` and `collection` match a full link href or its last path
+        segment (a profile alias such as 'story', or a collection guid).
+
+        Only documents mirrored in the store are searched, so the result
+        may be incomplete. With `remote`, and a store `client`, the docs
+        query is sent to the API instead and its results are stored and
+        returned.
+
+        Kwargs:
+           `tag` -- tag the documents carry
+           `collection` -- collection the documents belong to
+           `profile` -- profile of the documents
+           `since` -- earliest published date (ISO-8601, inclusive)
+           `until` -- latest published date (ISO-8601, inclusive)
+           `limit` -- maximum number of documents
+           `remote` -- query the API rather than the local mirror
+        """
+        if remote and self.client is not None:
+            return self._find_remote(tag, collection, profile, since, until,
+                                     limit)
+        clauses, args = [], []
+        if tag is not None:
+            clauses.append("""guid IN (SELECT guid FROM document_tags
+                                       WHERE tag = ?)""")
+            args.append(tag)
+        if collection is not None:
+            clauses.append("""guid IN (SELECT guid FROM document_collections
+                                       WHERE collection = ?
+                                       OR collection LIKE ?)""")
+            args.extend([collection, '%/' + collection])
+        if profile is not None:
+            clauses.append('(profile = ? OR profile LIKE ?)')
+            args.extend([profile, '%/' + profile])
+        if since is not None:
+            clauses.append('published >= ?')
+            args.append(since)
+        if until is not None:
+            clauses.append('published <= ?')
+            args.append(until)
+        query = 'SELECT body FROM documents'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY published DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+        conn = self._connect()
+        return self._load(conn.execute(query, args).fetchall())
+
+    def _find_remote(self, tag, collection, profile, since, until, limit):
+        params = {'tag': tag, 'collection': collection, 'profile': profile,
+                  'startdate': since, 'enddate': until, 'limit': limit}
+        params = {key: value for key, value in params.items()
+                  if value is not None}
+        try:
+            page = self.client.fetch_query('urn:collectiondoc:query:docs',
+                                           params)
+        except (BadRequest, EmptyResponse):
+            return []
+        if page is None:
+            return []
+        self.put_page(page)
+        items = [NavigableDoc(item) for item in page.items or ()]
+        return items[:limit] if limit is not None else items
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_TAG = re.compile(r'<[^>]*>')
+
+
+def _escape_like(value):
+    return (value.replace('\\', '\\\\').replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def _plain_text(value):
+    """Returns `value` with HTML tags and entities removed, or None.
+    """
+    if not value or not isinstance(value, str):
+        return None
+    return html.unescape(_TAG.sub(' ', value))
+
+
+def _collectiondoc(document):
+    return getattr(document, 'collectiondoc', document)
+
+
+def _hrefs(links, rel):
+    return [link['href'] for link in (links or {}).get(rel) or ()
+            if link.get('href')]
+
+
+def _index_row(document):
+    """Returns the indexed values of `document`, or None if it has no
+    guid.
+    """
+    doc = _collectiondoc(document)
+    attributes = doc.get('attributes') or {}
+    guid = attributes.get('guid')
+    if not guid:
+        return None
+    links = doc.get('links') or {}
+    profiles = _hrefs(links, 'profile')
+    return (guid, doc.get('href'), profiles[0] if profiles else None,
+            attributes.get('published'), attributes.get('tags') or [],
+            _hrefs(links, 'collection'), doc)
@@ -16,13 +16,20 @@ object can also navigate 'forward' and 'back', similar to a browser.
 All results returned from PMP endpoints are returned as :class:`NavigableDoc`
 objects, so the API for :class:`NavigableDoc` is important to look at as well.
 """
+import os
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
+
 from .core.auth import PmpAuth
 from .core.conn import PmpConnector
 from .core.exceptions import BadQuery
 from .core.exceptions import NoToken
 from .collectiondoc.navigabledoc import NavigableDoc
+from .collectiondoc.pager import ItemStream
+from .collectiondoc.pager import ReadAhead
+from .utils import json_codec
+from .utils.json_utils import copy_json
 from .utils.json_utils import filter_dict
 
 
@@ -48,13 +55,52 @@ class Client(object):
       >>> client.next()
       <Navigable doc: https://some-protected.api.com/some-endpoint?NEXTPAGE>
 
+    Navigation methods (`get`, `query`, `next`, `back`...) change the
+    client's state. To share one authorized client, and its connection
+    pool, between threads use the stateless `fetch` and `fetch_query`::
+
+      >>> client.fetch_query('urn:collectiondoc:query:docs', {'tag': 'kpbs'})
+      <Navigable doc: https://some-protected.api.com/docs?tag=kpbs>
+
     """
 
-    def __init__(self, entry_point):
+    def __init__(self, entry_point, nav_cache=None, home_cache=None,
+                 prefetch_depth=0, doc_store=None, query_cache=None,
+                 **connector_options):
         """Args:
         entry_point: URL that will serve as entry-point to the API
+
+        Kwargs:
+        nav_cache: :class:`NavigationCache <pmp_api.core.cache.NavigationCache>`
+        of recently visited documents. When present, `back`, `forward`,
+        `first` and re-visits are answered from the cache while its
+        documents are fresh.
+        home_cache: :class:`HomeDocCache <pmp_api.core.cache.HomeDocCache>`
+        shared by clients, so the home-doc is fetched once per `ttl`.
+        prefetch_depth: number of pages to fetch ahead in the background
+        by following `next` links, so that `next` finds them in memory.
+        Prefetching is cancelled when the client navigates elsewhere.
+        doc_store: :class:`DocumentStore <pmp_api.docstore.DocumentStore>`
+        that every fetched document (and listing item) is saved to.
+        query_cache: :class:`QueryCache <pmp_api.core.cache.QueryCache>`
+        of results of `query` and `fetch_query`. Results listing a document
+        are dropped when it is saved or deleted through the client.
+
+        Other kwargs (`cache`, `retry`, `rate_limiter`...) are handed to
+        :class:`PmpConnector <pmp_api.core.conn.PmpConnector>`.
         """
         self.entry_point = entry_point
+        self.nav_cache = nav_cache
+        self.home_cache = home_cache
+        self.home_doc = None
+        self.doc_store = doc_store
+        self.query_cache = query_cache
+        self.connector_options = connector_options
+        self.prefetched = {}
+        self.read_ahead = None
+        if prefetch_depth:
+            self.read_ahead = ReadAhead(self._fetch_document,
+                                        depth=prefetch_depth)
         self.history = []
         self.forward_stack = []
         self.current_page = None
@@ -62,63 +108,381 @@ class Client(object):
         self.pager = None
         self.document = None
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the read-ahead and token refresh threads and closes the
+        connection pool of the `connector`. The `doc_store` and caches,
+        which may be shared, are left open.
+        """
+        if self.read_ahead is not None:
+            self.read_ahead.close()
+        if self.connector is not None:
+            self.connector.authorizer.stop_refresh()
+            self.connector.close()
+
     def gain_access(self, client_id,
                     client_secret,
-                    auth_urn="urn:collectiondoc:form:issuetoken"):
+                    auth_urn="urn:collectiondoc:form:issuetoken",
+                    warm_up=False,
+                    home_doc_path=None,
+                    profiles=(),
+                    queries=(),
+                    **auth_options):
         """Requests access for `entry_point` using provided authentication.
         Finds the `auth_urn` and requests a token using the protocol listed
         there.
-        """
-        resp = requests.get(self.entry_point)
-        home_doc = resp.json()
-        self.document = NavigableDoc(home_doc)
-        auth_schema = self.document.options(auth_urn)
-        access_token_url = auth_schema.get('href', None)
-        if not access_token_url:
-            errmsg = "Missing authentication URL at endpoint."
-            errmsg += " Review API values at {0} with options {1}"
-            raise NoToken(errmsg.format(auth_urn, str(auth_schema)))
 
-        authorizer = PmpAuth(client_id, client_secret)
+        With `warm_up`, the token request, the home-doc fetch and the
+        prefetches of `profiles` and `queries` run concurrently. A home-doc
+        saved at `home_doc_path` (or in `home_cache`) lets the token request start without
+        waiting for the home-doc; the fetched home-doc replaces it (and is
+        saved there for the next start). Prefetched documents are served by
+        the first `get` of their url.
+
+        Kwargs:
+           `warm_up` -- bootstrap concurrently
+           `home_doc_path` -- file where the home-doc is persisted
+           `profiles` -- profile guids to prefetch
+           `queries` -- (rel_type, params) tuples to prefetch
+
+        Extra kwargs (`refresh_mode`, `refresh_margin`, `token_store`) are
+        passed to :class:`PmpAuth <pmp_api.core.auth.PmpAuth>`.
+        """
+        authorizer = PmpAuth(client_id, client_secret, **auth_options)
         try:
+            if warm_up:
+                self._warm_up(authorizer, auth_urn, home_doc_path,
+                              profiles, queries)
+                return
+            self._set_home_doc(self._fetch_home_doc())
+            access_token_url = self._access_token_url(auth_urn)
             authorizer.get_access_token2(access_token_url)
-            self.connector = PmpConnector(authorizer)
+            self.connector = PmpConnector(authorizer,
+                                          **self.connector_options)
         except NoToken as exc:
             errmsg = "Client connection failed. Check entry_point or"
             errmsg += " authentication schema used."
             raise NoToken(errmsg) from exc
 
-    def get(self, endpoint):
-        """Returns NavigableDoc object obtained from requested endpoint.
+    def _fetch_home_doc(self):
+        if self.home_cache is not None:
+            return self.home_cache.fetch(self.entry_point)
+        resp = requests.get(self.entry_point)
+        return json_codec.loads(resp.content)
 
-        Uses the `connector` object to issue signed requests
-        Also, saves NavigableDoc object as `document` attribute.
+    def _saved_home_doc(self, home_doc_path):
+        """Returns a previously saved home-doc, fresh or not, or None.
+        """
+        if self.home_cache is not None:
+            entry = self.home_cache.get(self.entry_point)
+            if entry is not None:
+                return copy_json(entry.body)
+        return _read_home_doc(home_doc_path)
+
+    def _set_home_doc(self, home_doc):
+        self.home_doc = NavigableDoc(home_doc)
+        self.document = self.home_doc
+        return self.home_doc
+
+    def _home_document(self):
+        """Returns the home-doc NavigableDoc, revalidated through
+        `home_cache` once it is stale. Falls back to the copy in hand
+        if revalidation fails.
+        """
+        if (self.home_doc is not None and self.home_cache is not None
+                and not self.home_cache.fresh(self.entry_point)):
+            try:
+                self.home_doc = NavigableDoc(self._fetch_home_doc())
+            except (requests.RequestException, ValueError):
+                pass
+        return self.home_doc
+
+    def _warm_up(self, authorizer, auth_urn, home_doc_path, profiles,
+                 queries):
+        """Bootstraps `connector`, `document` and `prefetched` with
+        concurrent requests. See `gain_access`.
+        """
+        saved = self._saved_home_doc(home_doc_path)
+        workers = min(8, 2 + len(profiles) + len(queries))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            home_future = pool.submit(self._fetch_home_doc)
+            if saved is not None:
+                self._set_home_doc(saved)
+            else:
+                self._set_home_doc(home_future.result())
+            access_token_url = self._access_token_url(auth_urn)
+            token_future = pool.submit(authorizer.get_access_token2,
+                                       access_token_url)
+            token_future.result()
+            connector = PmpConnector(authorizer, **self.connector_options)
+
+            urls = [self._profile_url(guid) for guid in profiles]
+            urls.extend(self._query_url(rel_type, params)
+                        for rel_type, params in queries)
+            prefetches = [(url, pool.submit(connector.get, url))
+                          for url in urls]
+
+            if saved is not None:
+                try:
+                    home_doc = home_future.result()
+                except (requests.RequestException, ValueError):
+                    # the saved home-doc stays in use
+                    home_doc = None
+                if home_doc is not None:
+                    self._set_home_doc(home_doc)
+                    fresh_url = self._access_token_url(auth_urn)
+                    if fresh_url != access_token_url:
+                        authorizer.get_access_token2(fresh_url)
+            if home_doc_path is not None:
+                _write_home_doc(home_doc_path, self.document.collectiondoc)
+
+            self.prefetched = {}
+            for url, future in prefetches:
+                try:
+                    self.prefetched[url] = future.result()
+                except Exception:
+                    # prefetching is best-effort: `get` will retry
+                    continue
+                if self.doc_store is not None:
+                    self.doc_store.put_page(self.prefetched[url])
+        self.connector = connector
+
+    def _profile_url(self, guid):
+        """Returns url for profile `guid` using the home-doc's profiles
+        template.
+        """
+        return self._query_url("urn:collectiondoc:hreftpl:profiles",
+                               {'guid': guid})
 
-        Args:
-           endpoint -- url endpoint requested.
+    def _access_token_url(self, auth_urn):
+        """Returns the access-token url offered by the home-doc saved
+        as `document`. Raises NoToken if it cannot be found.
+        """
+        auth_schema = self.document.options(auth_urn)
+        access_token_url = auth_schema.get('href', None)
+        if not access_token_url:
+            errmsg = "Missing authentication URL at endpoint."
+            errmsg += " Review API values at {0} with options {1}"
+            raise NoToken(errmsg.format(auth_urn, str(auth_schema)))
+        return access_token_url
+
+    def _check_connector(self):
+        """Raises NoToken if `gain_access` has not been called.
         """
         if self.connector is None:
             errmsg = "Need access token before making requests."
             errmsg += " Call `gain_access`"
             raise NoToken(errmsg)
+
+    def _navigate(self, endpoint):
+        """Updates `history`, `forward_stack` and `current_page` for a
+        request of `endpoint` and returns the url that should be fetched.
+        """
         if self.current_page is None:
             # our first request only should be None
             self.current_page = endpoint
-            results = self.connector.get(endpoint)
         elif len(self.history) > 0 and self.history[-1] == endpoint:
             self.forward_stack.append(self.current_page)
             self.current_page = self.history.pop()
-            results = self.connector.get(self.current_page)
         else:
             self.history.append(self.current_page)
             self.current_page = endpoint
-            results = self.connector.get(endpoint)
+        return self.current_page
 
+    def _load(self, results, endpoint=None):
+        """Saves `results` as the current `document` and `pager` and
+        returns the new NavigableDoc, which is added to `nav_cache`.
+        """
         if results is not None:
-            self.document = NavigableDoc(results)
-            self.pager = self.document.pager
+            self._set_document(NavigableDoc(results))
+            if self.nav_cache is not None and endpoint is not None:
+                self.nav_cache.set(endpoint, self.document)
+            if self.doc_store is not None:
+                self.doc_store.put_page(self.document)
             return self.document
 
+    def _set_document(self, document):
+        self.document = document
+        self.pager = document.pager
+        return document
+
+    def _cached(self, endpoint):
+        """Returns NavigableDoc for `endpoint` from `nav_cache` or from
+        documents prefetched by `gain_access`, or None.
+        """
+        if self.nav_cache is not None:
+            document = self.nav_cache.get(endpoint)
+            if document is not None:
+                return document
+        results = self.prefetched.pop(endpoint, None)
+        if results is not None:
+            return NavigableDoc(results)
+
+    def get(self, endpoint):
+        """Returns NavigableDoc object obtained from requested endpoint.
+
+        Uses the `connector` object to issue signed requests
+        Also, saves NavigableDoc object as `document` attribute.
+
+        Args:
+           endpoint -- url endpoint requested.
+        """
+        self._check_connector()
+        endpoint = self._navigate(endpoint)
+        document = self._cached(endpoint)
+        if self.read_ahead is not None:
+            if endpoint not in self.read_ahead:
+                # navigating elsewhere: the pages ahead are not needed
+                self.read_ahead.cancel()
+            else:
+                ahead = self.read_ahead.take(endpoint)
+                if document is None and ahead is not None:
+                    document = ahead
+                    if self.nav_cache is not None:
+                        self.nav_cache.set(endpoint, document)
+        if document is not None:
+            result = self._set_document(document)
+        else:
+            result = self._load(self.connector.get(endpoint), endpoint)
+        if self.read_ahead is not None and result is not None:
+            if self.pager.navigable:
+                self.read_ahead.start(self.pager.next)
+        return result
+
+    def _fetch_document(self, endpoint):
+        document = NavigableDoc(self.connector.get(endpoint))
+        if self.doc_store is not None:
+            self.doc_store.put_page(document)
+        return document
+
+    def fetch(self, endpoint):
+        """Returns NavigableDoc for `endpoint` without touching navigation
+        state (`history`, `forward_stack`, `current_page`, `document` and
+        `pager`), so many threads may share one client.
+
+        Args:
+           endpoint -- url endpoint requested.
+        """
+        self._check_connector()
+        results = self.connector.get(endpoint)
+        if results is not None:
+            document = NavigableDoc(results)
+            if self.doc_store is not None:
+                self.doc_store.put_page(document)
+            return document
+
+    def fetch_query(self, rel_type, params=None):
+        """Returns NavigableDoc for query `rel_type` with `params`, built
+        from the home-doc, without touching navigation state. See `fetch`.
+
+        Raises BadQuery if the home-doc does not offer the query.
+        """
+        if self.query_cache is not None:
+            cached = self.query_cache.get(rel_type, params)
+            if cached is not None:
+                return cached[1]
+        home_doc = self._home_document()
+        endpoint = None
+        if home_doc is not None:
+            endpoint = home_doc.query(rel_type, params=params)
+        if endpoint is None:
+            errmsg = "Can't create request for {0} with params {1}. Check that"
+            errmsg += " {0} is present in the home-doc."
+            raise BadQuery(errmsg.format(rel_type, str(params)))
+        document = self.fetch(endpoint)
+        if self.query_cache is not None and document is not None:
+            self.query_cache.set(rel_type, params, endpoint, document)
+        return document
+
+    def get_many(self, endpoints, max_workers=8, ordered=False):
+        """Fetches many endpoints concurrently and yields results as they
+        complete. Navigation state (`history`, `current_page`, `document`
+        and `pager`) is left untouched.
+
+        Args:
+           `endpoints` -- iterable of url endpoints
+
+        Kwargs:
+           `max_workers` -- number of concurrent requests
+           `ordered` -- yield results in the order of `endpoints`
+
+        Returns generator of (endpoint, NavigableDoc) tuples. If a request
+        fails, the exception raised is yielded in place of the NavigableDoc.
+        """
+        self._check_connector()
+        results = self.connector.get_many(endpoints, max_workers=max_workers,
+                                          ordered=ordered)
+        for endpoint, result in results:
+            if isinstance(result, Exception) or result is None:
+                yield endpoint, result
+            else:
+                yield endpoint, NavigableDoc(result)
+
+    def get_pages(self, start=1, stop=None, max_workers=8):
+        """Fetches pages `start` to `stop` (inclusive, defaults to the last
+        page) of the current listing in parallel and yields them in order.
+
+        Page urls are computed from the `offset`/`limit` of the current
+        `pager`, so up to `max_workers` pages are requested at once while
+        earlier pages are being consumed. Navigation state is left
+        untouched.
+
+        Returns generator of NavigableDoc pages. Raises the exception of a
+        failed page when that page is reached.
+        """
+        if self.pager is None:
+            raise ValueError("No paged document has been loaded")
+        urls = self.pager.page_urls(start, stop)
+        results = self.get_many(urls, max_workers=max_workers, ordered=True)
+        for endpoint, page in results:
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    def get_page_items(self, start=1, stop=None, max_workers=8):
+        """Yields the items of pages `start` to `stop` in order. See
+        `get_pages`.
+        """
+        for page in self.get_pages(start, stop, max_workers=max_workers):
+            for item in page.items or ():
+                yield item
+
+    def iter_items(self, rel_type, params=None, page_size=None,
+                   max_items=None, cursor=None, documents=False):
+        """Streams the items of every page of a query without touching
+        navigation state (`history`, `document`, `pager`).
+
+        Pages are fetched one at a time as items are consumed, so memory
+        use does not grow with the size of the listing.
+
+        Args:
+           `rel_type` -- Relation Type (urn) of the query
+
+        Kwargs:
+           `params` -- Dictionary of params to construct the query
+           `page_size` -- items per page requested (the query's `limit`)
+           `max_items` -- stop after this many items
+           `cursor` -- `cursor` of an earlier stream (or a page url) to
+           resume from; `rel_type` and `params` are then not used
+           `documents` -- yield NavigableDoc objects instead of dictionaries
+
+        Returns :class:`ItemStream <pmp_api.collectiondoc.pager.ItemStream>`
+        """
+        self._check_connector()
+        if cursor is None:
+            params = dict(params or {})
+            if page_size is not None:
+                params['limit'] = page_size
+            cursor = self._query_url(rel_type, params or None)
+        wrap = NavigableDoc if documents else None
+        return ItemStream(self.connector.get, cursor, max_items=max_items,
+                          wrap=wrap)
+
     def save(self, endpoint, document):
         """Saves a document (a string value) at PMP.
         Args:
@@ -127,8 +491,45 @@ class Client(object):
            `document` -- data (str) to send over as a document payload.
         """
         results = self.connector.put(endpoint, document)
+        if self.read_ahead is not None:
+            self.read_ahead.cancel()
+        # documents are saved on the publish host but read from the api
+        # host: drop what is kept for the read url too
+        for url in self._document_urls(endpoint, document):
+            self.prefetched.pop(url, None)
+            if self.connector.cache is not None:
+                self.connector.cache.delete(url)
+            if self.nav_cache is not None:
+                self.nav_cache.delete(url)
+        guid = _payload_guid(document)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(href=endpoint, guid=guid)
+        if results and self.doc_store is not None and guid:
+            # the stored copy predates the save
+            self.doc_store.delete(guid)
         return results
 
+    def _document_urls(self, endpoint, document):
+        """Returns set of urls a saved `document` may be read from: the
+        `endpoint` it was sent to, its own `href` and its url under the
+        home-doc's `urn:collectiondoc:hreftpl:docs` template.
+        """
+        urls = {endpoint}
+        collectiondoc = getattr(document, 'collectiondoc', document)
+        if isinstance(collectiondoc, dict) and collectiondoc.get('href'):
+            urls.add(collectiondoc['href'])
+        guid = _payload_guid(document)
+        home_doc = self._home_document()
+        if guid and home_doc is not None:
+            try:
+                read_url = home_doc.query('urn:collectiondoc:hreftpl:docs',
+                                          params={'guid': guid})
+            except BadQuery:
+                read_url = None
+            if read_url is not None:
+                urls.add(read_url)
+        return urls
+
     def delete(self, document):
         """Deletes a document from PMP API: simply fires 'DELETE'
         to provided document's href endpoint. If permissions allow it, it
@@ -137,7 +538,19 @@ class Client(object):
         Args:
            `document` -- NavigableDoc document to be deleted from PMP
         """
-        return self.connector.delete(document.collectiondoc.get('href'))
+        href = document.collectiondoc.get('href')
+        self.prefetched.pop(href, None)
+        if self.read_ahead is not None:
+            self.read_ahead.cancel()
+        if self.nav_cache is not None:
+            self.nav_cache.delete(href)
+        guid = (document.attributes or {}).get('guid')
+        if self.query_cache is not None:
+            self.query_cache.invalidate(href=href, guid=guid)
+        deleted = self.connector.delete(href)
+        if deleted and self.doc_store is not None and guid:
+            self.doc_store.delete(guid)
+        return deleted
 
     # def upload(self, endpoint, upload_document):
     #     """Uploads a rich media object to PMP API.
@@ -154,23 +567,58 @@ class Client(object):
 
         Kwargs:
            `params` -- Dictionary of params to construct a query
+
+        With a `query_cache`, a stored result of the same query is
+        returned without a request.
         """
-        pmp_request = self.document.query(rel_type, params=params)
+        if self.query_cache is None:
+            return self.get(self._query_url(rel_type, params))
+        self._check_connector()
+        cached = self.query_cache.get(rel_type, params)
+        if cached is not None:
+            endpoint, document = cached
+            self._navigate(endpoint)
+            return self._set_document(document)
+        document = self.get(self._query_url(rel_type, params))
+        if document is not None:
+            self.query_cache.set(rel_type, params, self.current_page,
+                                 document)
+        return document
+
+    def _query_url(self, rel_type, params=None):
+        """Returns url for query `rel_type` expanded with `params`.
+
+        Templates are looked up in the home-doc, then in the current
+        `document`. Raises BadQuery if the query cannot be made.
+        """
+        pmp_request = None
+        for document in (self._home_document(), self.document):
+            if document is not None:
+                pmp_request = document.query(rel_type, params=params)
+                if pmp_request is not None:
+                    break
         if pmp_request is None:
             errmsg = "Can't create request for {0} with params {1}. Check that"
             errmsg += " {0} is present in docuemnt."
             raise BadQuery(errmsg.format(rel_type, str(params)))
-        else:
-            return self.get(pmp_request)
+        return pmp_request
 
     def home(self):
         """Requests API home-doc `entry_point` and returns results.
+        With a `home_cache`, the cached home-doc is used while fresh.
         """
+        if self.home_cache is not None:
+            home_doc = self._set_home_doc(self._fetch_home_doc())
+            if self.connector is not None and self.connector.authorized:
+                self._navigate(self.entry_point)
+                self.pager = home_doc.pager
+            return home_doc
         if self.connector is not None and self.connector.authorized:
             return self.get(self.entry_point)
         else:
             # Fragile: fix or reject and make all requests be authenticated
-            self.document = NavigableDoc(requests.get(self.entry_point).json())
+            resp = requests.get(self.entry_point)
+            self.document = NavigableDoc(json_codec.loads(resp.content))
             return self.document
 
     def next(self):
@@ -221,3 +669,39 @@ class Client(object):
             return
         else:
             return self.get(self.forward_stack.pop())
+
+
+def _payload_guid(document):
+    """Returns the guid of a document payload (a JSON string, dictionary
+    or NavigableDoc), or None.
+    """
+    collectiondoc = getattr(document, 'collectiondoc', document)
+    if isinstance(collectiondoc, (str, bytes)):
+        try:
+            collectiondoc = json_codec.loads(collectiondoc)
+        except ValueError:
+            return None
+    if not isinstance(collectiondoc, dict):
+        return None
+    return (collectiondoc.get('attributes') or {}).get('guid')
+
+
+def _read_home_doc(path):
+    """Returns home-doc saved at `path` or None.
+    """
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as home_file:
+            return json_codec.loads(home_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_home_doc(path, home_doc):
+    """Saves `home_doc` at `path`, replacing any earlier copy at once.
+    """
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, 'w') as home_file:
+        home_file.write(json_codec.dumps(home_doc))
+    os.replace(tmp_path, path)
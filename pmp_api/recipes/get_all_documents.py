@@ -18,9 +18,7 @@ def get_all_docs(client):
 
     """
     def get_documents(doc_type):
-        docs = client.query("urn:collectiondoc:query:{}".format(doc_type))
-        while docs is not None:
-            for element in docs.items:
-                yield element['attributes']['title'], element['href']
-            docs = client.next()
+        rel_type = "urn:collectiondoc:query:{}".format(doc_type)
+        for element in client.iter_items(rel_type):
+            yield element['attributes']['title'], element['href']
     return get_documents
@@ -0,0 +1,278 @@
+"""
+.. module:: pmp_api.sync
+   :synopsis: Incremental synchronization of PMP documents
+
+The :class:`SyncEngine <SyncEngine>` object mirrors the results of a PMP
+query into another system, fetching only documents published since its
+last run. Progress is saved in a checkpoint store after every document, so
+a run that crashes resumes where it stopped::
+
+   >>> from pmp_api.sync import SyncEngine, FileCheckpointStore
+   >>> store = FileCheckpointStore('/var/lib/pmp/sync.json')
+   >>> engine = SyncEngine(client, store, params={'tag': 'kpbs'})
+   >>> engine.run(save_to_cms)
+   42
+
+The high-water mark is the latest date seen together with the guids seen
+at that date: the next run queries from that date (inclusive) and skips
+those guids, so nothing is lost or repeated at the boundary.
+
+The docs query can only filter on the published date, so changes are found
+by a second pass over documents published within `revisit` seconds before
+the high-water mark: those whose `modified` date is later than the start of
+the previous run are handled again. Edits to documents published earlier
+than that are not detected.
+"""
+import os
+import copy
+import datetime
+
+from .utils import json_codec
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+
+class MemoryCheckpointStore(object):
+    """Checkpoints kept in memory, for tests and short-lived processes.
+    """
+    def __init__(self):
+        self._checkpoints = {}
+
+    def load(self, key):
+        """Returns checkpoint saved for `key` or None.
+        """
+        return copy.deepcopy(self._checkpoints.get(key))
+
+    def save(self, key, checkpoint):
+        self._checkpoints[key] = copy.deepcopy(checkpoint)
+
+
+class FileCheckpointStore(object):
+    """Checkpoints kept in a JSON file. Every save replaces the file at
+    once, so a crash never leaves a partly written checkpoint.
+
+    Args:
+       `path` -- location of the JSON file
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as checkpoint_file:
+                return json_codec.loads(checkpoint_file.read())
+        except FileNotFoundError:
+            return {}
+
+    def load(self, key):
+        """Returns checkpoint saved for `key` or None.
+        """
+        return self._read().get(key)
+
+    def save(self, key, checkpoint):
+        checkpoints = self._read()
+        checkpoints[key] = checkpoint
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, 'w') as checkpoint_file:
+            checkpoint_file.write(json_codec.dumps(checkpoints))
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class SyncEngine(object):
+    """Fetches documents of a query published since the previous run.
+
+    Each run covers a fixed window, from the saved high-water mark to the
+    time the run started, so that documents published while it pages
+    through results do not shift its pages. A crashed run is resumed from
+    its saved position within the same window.
+
+    `handler` is called once per new document, and again when a document
+    published within `revisit` seconds of the high-water mark is changed.
+    The checkpoint is saved after every `checkpoint_every` documents, so a
+    crash repeats at most the documents handled since the last save (only
+    the document being handled with the default of 1).
+
+    Args:
+       `client` -- authorized :class:`Client <pmp_api.pmp_client.Client>`
+       `store` -- checkpoint store (`MemoryCheckpointStore`,
+       `FileCheckpointStore` or any object with `load(key)` and
+       `save(key, checkpoint)`)
+
+    Kwargs:
+       `rel_type` -- query urn
+       `params` -- extra query params (for example `tag` or `profile`)
+       `key` -- name of this sync's checkpoint (defaults to `rel_type`)
+       `page_size` -- documents requested per page
+       `date_field` -- document attribute holding the date tracked by the
+       high-water mark; the query's `startdate` filter applies to it, so it
+       should be the date the server filters on (`published`)
+       `checkpoint_every` -- save the checkpoint after this many documents
+       `modified_field` -- document attribute holding the date of the last
+       change
+       `revisit` -- seconds before the high-water mark in which published
+       documents are checked for changes (0 or None: only new documents)
+    """
+    def __init__(self, client, store, rel_type="urn:collectiondoc:query:docs",
+                 params=None, key=None, page_size=100, date_field='published',
+                 checkpoint_every=1, modified_field='modified',
+                 revisit=86400):
+        self.client = client
+        self.store = store
+        self.rel_type = rel_type
+        self.params = dict(params or {})
+        self.key = key or rel_type
+        self.page_size = page_size
+        self.date_field = date_field
+        self.checkpoint_every = checkpoint_every
+        self.modified_field = modified_field
+        self.revisit = revisit
+
+    def checkpoint(self):
+        """Returns the saved checkpoint, or a new one.
+        """
+        return self.store.load(self.key) or {'since': None, 'seen': [],
+                                             'modified': None, 'run': None}
+
+    def _query_params(self, since, until):
+        params = dict(self.params)
+        if since is not None:
+            params['startdate'] = since
+        params['enddate'] = until
+        return params
+
+    def run(self, handler):
+        """Calls `handler` with each document (a dictionary) published
+        since the previous run, and with recently published documents
+        changed since then, then moves the high-water mark forward.
+
+        Returns number of documents handled.
+        """
+        checkpoint = self.checkpoint()
+        since = checkpoint['since']
+        boundary = set(checkpoint['seen'])
+        run = checkpoint['run']
+        if run is None:
+            until = datetime.datetime.utcnow().strftime(DATE_FORMAT)
+            run = {'until': until, 'phase': 'new', 'cursor': None,
+                   'latest': since, 'latest_seen': list(checkpoint['seen'])}
+            checkpoint['run'] = run
+
+        handled = 0
+        if run.get('phase', 'new') == 'new':
+            handled += self._sync_new(handler, checkpoint, since, boundary)
+            run['phase'], run['cursor'] = 'changed', None
+            self.store.save(self.key, checkpoint)
+        modified_since = checkpoint.get('modified')
+        if self.revisit and since is not None and modified_since:
+            handled += self._sync_changed(handler, checkpoint, since,
+                                          boundary, modified_since)
+
+        self.store.save(self.key, {'since': run['latest'],
+                                   'seen': run['latest_seen'],
+                                   'modified': run['until'],
+                                   'run': None})
+        return handled
+
+    def _stream(self, params, run):
+        return self.client.iter_items(
+            self.rel_type, params, page_size=self.page_size,
+            cursor=tuple(run['cursor']) if run['cursor'] else None)
+
+    def _sync_new(self, handler, checkpoint, since, boundary):
+        """Handles documents published from `since` to the end of the run's
+        window, moving the run's high-water mark.
+        """
+        run = checkpoint['run']
+        stream = self._stream(self._query_params(since, run['until']), run)
+        latest = _parse_date(run['latest'])
+        handled = unsaved = 0
+        for item in stream:
+            guid = _attribute(item, 'guid')
+            date = _attribute(item, self.date_field)
+            if not (date == since and guid in boundary):
+                handler(item)
+                handled += 1
+
+            parsed = _parse_date(date)
+            if parsed is not None:
+                if latest is None or parsed > latest:
+                    latest = parsed
+                    run['latest'], run['latest_seen'] = date, [guid]
+                elif parsed == latest and guid not in run['latest_seen']:
+                    run['latest_seen'].append(guid)
+            run['cursor'] = list(stream.cursor) if stream.cursor else None
+            unsaved += 1
+            if unsaved >= self.checkpoint_every:
+                self.store.save(self.key, checkpoint)
+                unsaved = 0
+        return handled
+
+    def _sync_changed(self, handler, checkpoint, since, boundary,
+                      modified_since):
+        """Handles documents published in the `revisit` seconds up to
+        `since` whose modified date is later than `modified_since`.
+        """
+        run = checkpoint['run']
+        changed_after = _parse_date(modified_since)
+        start = _parse_date(since)
+        if start is None or changed_after is None:
+            return 0
+        start -= datetime.timedelta(seconds=self.revisit)
+        start = start.astimezone(datetime.timezone.utc)
+        params = self._query_params(start.strftime(DATE_FORMAT), since)
+        stream = self._stream(params, run)
+        handled = unsaved = 0
+        for item in stream:
+            guid = _attribute(item, 'guid')
+            date = _attribute(item, self.date_field)
+            # new at the boundary: handled by the first pass
+            new = date == since and guid not in boundary
+            modified = _parse_date(_attribute(item, self.modified_field))
+            if not new and modified is not None and modified > changed_after:
+                handler(item)
+                handled += 1
+            run['cursor'] = list(stream.cursor) if stream.cursor else None
+            unsaved += 1
+            if unsaved >= self.checkpoint_every:
+                self.store.save(self.key, checkpoint)
+                unsaved = 0
+        return handled
+
+    def find_deleted(self, guids, batch_size=50):
+        """Yields those of `guids` that the query no longer returns, which
+        means they were deleted (or are no longer readable).
+
+        PMP does not publish deletions, so the caller passes the guids it
+        holds; they are looked up `batch_size` at a time.
+        """
+        guids = list(guids)
+        for start in range(0, len(guids), batch_size):
+            batch = guids[start:start + batch_size]
+            params = dict(self.params, guid=batch, limit=len(batch))
+            found = set()
+            stream = self.client.iter_items(self.rel_type, params)
+            for item in stream:
+                found.add(_attribute(item, 'guid'))
+            for guid in batch:
+                if guid not in found:
+                    yield guid
+
+
+def _attribute(item, name):
+    return (item.get('attributes') or {}).get(name)
+
+
+def _parse_date(value):
+    """Returns an aware datetime for an ISO-8601 date string, or None.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
@@ -0,0 +1,80 @@
+"""
+.. module:: pmp_api.utils.json_codec
+   :synopsis: Pluggable JSON backend for decoding and encoding documents
+
+Collection.doc+json documents are decoded and encoded through the `loads`
+and `dumps` functions in this module. They use the fastest JSON library
+that is installed, in order of preference: `orjson`, `ujson` and finally
+the standard library `json` module::
+
+   >>> from pmp_api.utils import json_codec
+   >>> json_codec.backend
+   'orjson'
+   >>> json_codec.use_backend('json')  # force the standard library
+"""
+import json
+
+_backends = {}
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    pass
+else:
+    _backends['orjson'] = (orjson.loads,
+                           lambda obj: orjson.dumps(obj).decode('utf-8'))
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    pass
+else:
+    _backends['ujson'] = (ujson.loads,
+                          lambda obj: ujson.dumps(obj, ensure_ascii=False))
+
+_backends['json'] = (json.loads, json.dumps)
+
+PREFERENCE = ('orjson', 'ujson', 'json')
+
+backend = None
+_loads = None
+_dumps = None
+
+
+def available_backends():
+    """Returns list of installed backend names, fastest first.
+    """
+    return [name for name in PREFERENCE if name in _backends]
+
+
+def use_backend(name=None):
+    """Selects the JSON backend used by `loads` and `dumps`. With no
+    `name`, the fastest installed backend is used.
+
+    Raises ValueError if `name` is not installed.
+    """
+    global backend, _loads, _dumps
+    if name is None:
+        name = available_backends()[0]
+    if name not in _backends:
+        errmsg = "JSON backend not available: {}. Choose from {}"
+        raise ValueError(errmsg.format(name, available_backends()))
+    backend = name
+    _loads, _dumps = _backends[name]
+
+
+def loads(data):
+    """Decodes JSON from `data` (bytes or str).
+
+    Raises ValueError on invalid JSON, whichever backend is in use.
+    """
+    return _loads(data)
+
+
+def dumps(obj):
+    """Encodes `obj` as a JSON string.
+    """
+    return _dumps(obj)
+
+
+use_backend()
@@ -68,3 +68,50 @@ def filter_dict(json_dict, key, val):
             # dict[key] is a string
             return False
     return filter(filterfunc, qjson_dict)
+
+
+def index_rels(links):
+    """Returns dictionary mapping each rel to the list of link dicts that
+    carry it, in document order. Built in one pass, so that looking up a
+    rel does not search the whole document.
+
+    Args:
+       `links` -- `links` of a collectiondoc (a dict of link lists) or a
+       single list of links, such as `navigation`
+    """
+    index = {}
+    if isinstance(links, dict):
+        groups = links.values()
+    else:
+        groups = [links or ()]
+    for group in groups:
+        if isinstance(group, dict):
+            group = [group]
+        elif not isinstance(group, list):
+            continue
+        for link in group:
+            if not isinstance(link, dict) or 'rels' not in link:
+                continue
+            rels = link['rels']
+            if isinstance(rels, str):
+                rels = [rels]
+            elif not isinstance(rels, list):
+                continue
+            for rel in rels:
+                index.setdefault(rel, []).append(link)
+    return index
+
+
+def copy_json(json_value):
+    """Returns a deep copy of a value loaded from JSON (nested dicts and
+    lists of immutable scalars). Much faster than :func:`copy.deepcopy`
+    for this restricted case.
+
+    Args:
+       `json_value` -- JSON value (dict, list or scalar)
+    """
+    if isinstance(json_value, dict):
+        return {k: copy_json(v) for k, v in json_value.items()}
+    elif isinstance(json_value, list):
+        return [copy_json(v) for v in json_value]
+    return json_value
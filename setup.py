@@ -72,5 +72,9 @@ setup(
         "uritemplate",
         "pelecanus"
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "speedups": ["orjson"],
+    },
     long_description = long_description
 )
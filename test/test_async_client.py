@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import asyncio
+import datetime
+
+from multiprocessing import Process
+from urllib.parse import parse_qs, urlsplit
+from unittest import IsolatedAsyncioTestCase, skipIf
+from unittest.mock import AsyncMock, Mock, patch
+
+from server import run_forever
+from pmp_api.core.auth import PmpAuth
+from pmp_api.core.conn import PmpConnector
+from pmp_api.core.exceptions import BadQuery
+from pmp_api.core.exceptions import EmptyResponse
+from pmp_api.core.exceptions import ExpiredToken
+from pmp_api.core.exceptions import NoToken
+from pmp_api.core.token_store import FileTokenStore
+from pmp_api.collectiondoc.navigabledoc import NavigableDoc
+
+try:
+    import aiohttp
+    from pmp_api.async_client import AsyncClient
+    from pmp_api.core.async_conn import AsyncPmpConnector
+except ImportError:
+    aiohttp = None
+
+
+@skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncClient(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        self.fixture_dir = os.path.join(current_dir, 'fixtures')
+        entry_point = 'http://127.0.0.1:8080/?json_response={}'
+        self.home_doc = os.path.join(self.fixture_dir, 'homedoc.json')
+        self.data_doc = os.path.join(self.fixture_dir, 'datadoc.json')
+        self.test_entry_point = entry_point.format(self.home_doc)
+        self.data_url = entry_point.format(self.data_doc)
+        self.server_process = Process(target=run_forever)
+        self.server_process.start()
+
+    def tearDown(self):
+        self.server_process.terminate()
+        self.server_process.join()
+        del self.server_process
+
+    async def test_gain_access_with_server(self):
+        async with AsyncClient(self.test_entry_point) as client:
+            await client.gain_access('client-id', 'client-secret')
+            self.assertTrue(client.connector.authorized)
+            self.assertEqual(client.connector.authorizer.access_token,
+                             'SERVER-TOKEN')
+            self.assertEqual(len(client.document.links), 7)
+
+    async def test_get_and_navigate(self):
+        async with AsyncClient(self.test_entry_point) as client:
+            await client.gain_access('client-id', 'client-secret')
+            document = await client.get(self.data_url)
+            self.assertIsInstance(document, NavigableDoc)
+            self.assertEqual(len(document.items), 10)
+            self.assertEqual(client.current_page, self.data_url)
+            await client.get(self.test_entry_point)
+            self.assertEqual(client.history[-1], self.data_url)
+            await client.back()
+            self.assertEqual(client.current_page, self.data_url)
+            self.assertEqual(client.forward_stack, [self.test_entry_point])
+
+    async def test_concurrent_gets(self):
+        async with AsyncClient(self.test_entry_point) as client:
+            await client.gain_access('client-id', 'client-secret')
+            requests = [client.connector.get(self.data_url)
+                        for _ in range(5)]
+            results = await asyncio.gather(*requests)
+            self.assertEqual(len(results), 5)
+            self.assertTrue(all(len(r['items']) == 10 for r in results))
+
+    async def test_get_without_connector_raise_no_token(self):
+        client = AsyncClient(self.test_entry_point)
+        with self.assertRaises(NoToken):
+            await client.get(self.data_url)
+
+    async def test_delete(self):
+        async with AsyncClient(self.test_entry_point) as client:
+            await client.gain_access('client-id', 'client-secret')
+            document = await client.get(self.data_url)
+            item = NavigableDoc(document.items[5])
+            self.assertTrue(await client.delete(item))
+
+
+@skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncPmpConnector(IsolatedAsyncioTestCase):
+
+    async def test_reauthorize_without_url(self):
+        past = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        authorizer = Mock(**{'access_token': 'token',
+                             'token_expires': past,
+                             'access_token_url': None})
+        connector = AsyncPmpConnector(authorizer)
+        with self.assertRaises(ExpiredToken):
+            await connector.reauthorize()
+
+    async def test_parse_no_json(self):
+        connector = AsyncPmpConnector(Mock())
+        with self.assertRaises(EmptyResponse):
+            connector._parse('http://www.google.com', b'')
+
+    async def test_concurrent_reauthorize_single_flight(self):
+        authorizer = PmpAuth('client-id', 'client-secret')
+        authorizer.access_token = 'OLD-TOKEN'
+        authorizer.access_token_url = "http://www.google.com"
+        authorizer.token_expires = (datetime.datetime.utcnow() -
+                                    datetime.timedelta(seconds=1))
+        connector = AsyncPmpConnector(authorizer)
+        sync_connector = PmpConnector(authorizer)
+        calls = []
+
+        def slow_token(url):
+            calls.append(url)
+            time.sleep(0.1)
+            authorizer.access_token = 'NEW-TOKEN'
+            authorizer.token_expires = (datetime.datetime.utcnow() +
+                                        datetime.timedelta(hours=4))
+
+        loop = asyncio.get_running_loop()
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=slow_token):
+            # a sync connector sharing the authorizer renews at the same time
+            sync_result = loop.run_in_executor(None,
+                                               sync_connector.reauthorize)
+            results = await asyncio.gather(*[connector.reauthorize()
+                                             for _ in range(20)])
+            self.assertTrue(await sync_result)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [True] * 20)
+
+
+def listing(url, offset, last=2):
+    navigation = [{'rels': ['self'], 'href': url + '?offset={}'.format(offset)},
+                  {'rels': ['first'], 'href': url + '?offset=0'},
+                  {'rels': ['last'], 'href': url + '?offset={}'.format(last)}]
+    if offset < last:
+        navigation.append({'rels': ['next'],
+                           'href': url + '?offset={}'.format(offset + 1)})
+    return {'href': url + '?offset={}'.format(offset),
+            'links': {'navigation': navigation},
+            'items': [{'links': {}, 'attributes': {'guid': str(offset)}}]}
+
+
+@skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncClientStateless(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            home_values = json.loads(jf.read())
+        self.client = AsyncClient('http://127.0.0.1:8080/')
+        self.client._set_home_doc(home_values)
+        self.url = 'http://127.0.0.1:8080/docs'
+        connector = AsyncPmpConnector(Mock())
+
+        async def get(url, signed=True):
+            await asyncio.sleep(0)
+            offset = parse_qs(urlsplit(url).query).get('offset', ['0'])
+            return listing(self.url, int(offset[0]))
+
+        connector.get = AsyncMock(side_effect=get)
+        self.client.connector = connector
+
+    async def test_fetch_and_fetch_query(self):
+        document = await self.client.fetch(self.url + '?offset=1')
+        self.assertEqual(document.attributes, None)
+        self.assertEqual(document.items[0]['attributes']['guid'], '1')
+        document = await self.client.fetch_query(
+            'urn:collectiondoc:query:docs', {'offset': 2})
+        self.assertEqual(document.href, self.url + '?offset=2')
+        self.assertIsNone(self.client.current_page)
+        with self.assertRaises(BadQuery):
+            await self.client.fetch_query('urn:missing')
+
+    async def test_iter_items(self):
+        stream = self.client.iter_items('urn:collectiondoc:query:docs',
+                                        {'offset': 0})
+        guids = [item['attributes']['guid'] async for item in stream]
+        self.assertEqual(guids, ['0', '1', '2'])
+        self.assertIsNone(stream.cursor)
+        with self.assertRaises(TypeError):
+            iter(stream)
+
+    async def test_get_many_and_pages(self):
+        urls = [self.url + '?offset={}'.format(n) for n in (2, 0, 1)]
+        results = [(endpoint, page.href) async for endpoint, page
+                   in self.client.get_many(urls, max_workers=2, ordered=True)]
+        self.assertEqual(results, list(zip(urls, urls)))
+        unordered = [endpoint async for endpoint, _
+                     in self.client.get_many(urls, max_workers=2)]
+        self.assertEqual(sorted(unordered), sorted(urls))
+
+        await self.client.get(self.url + '?offset=0')
+        items = [item['attributes']['guid'] async for item
+                 in self.client.get_page_items()]
+        self.assertEqual(items, ['0', '1', '2'])
+
+    async def test_sync_only_options_rejected(self):
+        with self.assertRaises(ValueError):
+            AsyncClient('http://127.0.0.1:8080/', prefetch_depth=2)
+        with self.assertRaises(ValueError):
+            await self.client.gain_access('id', 'secret', warm_up=True)
+        with self.assertRaises(TypeError):
+            with self.client:
+                pass
+
+
+@skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncTokenStore(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = FileTokenStore(os.path.join(self.tmpdir, 'tokens.json'))
+        self.token_url = 'http://127.0.0.1:8080/auth/access_token'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def post(self, *args, **kwargs):
+        time.sleep(0.05)
+        issued = datetime.datetime.utcnow()
+        return Mock(**{'ok': True, 'json.return_value': {
+            'access_token': 'SHARED',
+            'token_issue_date': issued.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+            'token_expires_in': 3600}})
+
+    async def test_cold_start_requests_one_token(self):
+        connectors = [AsyncPmpConnector(PmpAuth('client-id', 'client-secret',
+                                                token_store=self.store))
+                      for _ in range(2)]
+        with patch('requests.post', side_effect=self.post) as mocker:
+            tokens = await asyncio.gather(
+                *[connector.get_access_token(self.token_url)
+                  for connector in connectors for _ in range(4)])
+        self.assertEqual(tokens, ['SHARED'] * 8)
+        self.assertEqual(mocker.call_count, 1)
+        for connector in connectors:
+            await connector.close()
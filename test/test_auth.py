@@ -2,6 +2,7 @@ from unittest import TestCase
 from unittest.mock import Mock, patch
 
 import datetime
+import threading
 import requests
 
 from pmp_api.core.exceptions import NoToken
@@ -328,3 +329,134 @@ class PmpAuthTestGetToken(TestCase):
         with patch.object(requests, 'post', return_value=response) as mocker:
             with self.assertRaises(NoToken):
                 self.authorizer.get_access_token2(token_url)
+
+
+class TestPmpAuthProactiveRefresh(TestCase):
+
+    def setUp(self):
+        from pmp_api.core.auth import PmpAuth
+        self.PmpAuth = PmpAuth
+        self.test_url = "http://www.kpbs.com"
+        self.refreshed = threading.Event()
+
+    def fake_token(self, authorizer):
+        def get_access_token2(url):
+            authorizer.access_token = 'NEW-TOKEN'
+            authorizer.token_expires = (datetime.datetime.utcnow() +
+                                        datetime.timedelta(hours=4))
+            self.refreshed.set()
+            return authorizer.access_token
+        return get_access_token2
+
+    def test_bad_refresh_mode(self):
+        with self.assertRaises(ValueError):
+            self.PmpAuth('client-id', 'client-secret', refresh_mode='eager')
+
+    def test_refresh_due(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret',
+                                  refresh_margin=300)
+        self.assertFalse(authorizer.refresh_due)
+        authorizer.token_expires = (datetime.datetime.utcnow() +
+                                    datetime.timedelta(seconds=60))
+        self.assertTrue(authorizer.refresh_due)
+
+    def test_lazy_refresh_signs_with_current_token(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret',
+                                  refresh_mode='lazy', refresh_margin=300)
+        authorizer.access_token = 'OLD-TOKEN'
+        authorizer.access_token_url = "http://www.google.com"
+        authorizer.token_expires = (datetime.datetime.utcnow() +
+                                    datetime.timedelta(seconds=60))
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=self.fake_token(authorizer)):
+            signed = authorizer.sign_request(requests.Request('GET',
+                                                              self.test_url))
+            self.assertEqual(signed.headers['Authorization'],
+                             'Bearer OLD-TOKEN')
+            self.assertTrue(self.refreshed.wait(5))
+        signed = authorizer.sign_request(requests.Request('GET',
+                                                          self.test_url))
+        self.assertEqual(signed.headers['Authorization'], 'Bearer NEW-TOKEN')
+
+    def test_no_refresh_outside_margin(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret',
+                                  refresh_mode='lazy', refresh_margin=300)
+        authorizer.access_token = 'OLD-TOKEN'
+        authorizer.token_expires = (datetime.datetime.utcnow() +
+                                    datetime.timedelta(hours=1))
+        with patch.object(authorizer, 'refresh') as mocker:
+            authorizer.sign_request(requests.Request('GET', self.test_url))
+        self.assertFalse(mocker.called)
+
+    def test_background_refresh(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret',
+                                  refresh_mode='background',
+                                  refresh_margin=300)
+        issued = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+00:00")
+        result = {'access_token': 'OLD-TOKEN',
+                  'token_issue_date': issued,
+                  'token_expires_in': 0.2}
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=self.fake_token(authorizer)):
+            authorizer.store_token(result, "http://www.google.com")
+            self.assertTrue(self.refreshed.wait(5))
+            self.assertEqual(authorizer.access_token, 'NEW-TOKEN')
+            authorizer.stop_refresh()
+        self.assertEqual(authorizer._refresh_thread, None)
+
+    def test_margin_capped_by_token_lifetime(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret',
+                                  refresh_mode='background',
+                                  refresh_margin=300)
+        issued = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+00:00")
+        result = {'access_token': 'OLD-TOKEN',
+                  'token_issue_date': issued,
+                  'token_expires_in': 120}
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=self.fake_token(authorizer)) as mocker:
+            authorizer.store_token(result, "http://www.google.com")
+            self.assertFalse(self.refreshed.wait(0.2))
+            self.assertFalse(authorizer.refresh_due)
+            authorizer.stop_refresh()
+        self.assertFalse(mocker.called)
+
+    def test_min_refresh_interval(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret',
+                                  refresh_mode='lazy', refresh_margin=300)
+        authorizer.access_token = 'OLD-TOKEN'
+        authorizer.access_token_url = "http://www.google.com"
+        authorizer.token_expires = (datetime.datetime.utcnow() +
+                                    datetime.timedelta(seconds=60))
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=NoToken('refused')):
+            self.assertTrue(authorizer.refresh_due)
+            self.assertFalse(authorizer._refresh_quietly())
+            self.assertFalse(authorizer.refresh_due)
+
+    def test_concurrent_renewal_single_flight(self):
+        authorizer = self.PmpAuth('client-id', 'client-secret')
+        authorizer.access_token = 'OLD-TOKEN'
+        authorizer.access_token_url = "http://www.google.com"
+        authorizer.token_expires = (datetime.datetime.utcnow() -
+                                    datetime.timedelta(seconds=1))
+        fake = self.fake_token(authorizer)
+        calls = []
+
+        def slow_token(url):
+            calls.append(url)
+            self.refreshed.wait(0.1)
+            return fake(url)
+
+        tokens = []
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=slow_token):
+            threads = [threading.Thread(
+                target=lambda: tokens.append(
+                    authorizer.renew_token(stale_token='OLD-TOKEN')))
+                for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(tokens, ['NEW-TOKEN'] * 20)
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from multiprocessing import Process
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from pmp_api.core.cache import CacheEntry
+from pmp_api.core.cache import ChainCache
+from pmp_api.core.cache import HomeDocCache
+from pmp_api.core.cache import LRUStore
+from pmp_api.core.cache import NavigationCache
+from pmp_api.core.cache import QueryCache
+from pmp_api.core.cache import ResponseCache
+from pmp_api.core.cache import SqliteCache
+from pmp_api.collectiondoc.navigabledoc import NavigableDoc
+
+
+class TestLRUStore(TestCase):
+
+    def test_entry_limit_evicts_least_recent(self):
+        store = LRUStore(max_entries=2)
+        store.set('a', 1)
+        store.set('b', 2)
+        store.get('a')
+        store.set('c', 3)
+        self.assertEqual(store.keys(), ['a', 'c'])
+        self.assertEqual(store.evictions, 1)
+
+    def test_byte_limit(self):
+        store = LRUStore(max_bytes=10)
+        store.set('a', 1, size=4)
+        store.set('b', 2, size=4)
+        store.set('c', 3, size=4)
+        self.assertEqual(store.keys(), ['b', 'c'])
+        self.assertEqual(store.total_bytes, 8)
+
+    def test_oversized_value_not_stored(self):
+        store = LRUStore(max_bytes=10)
+        store.set('a', 1, size=11)
+        self.assertNotIn('a', store)
+        self.assertEqual(store.total_bytes, 0)
+
+    def test_replace_and_pop(self):
+        store = LRUStore()
+        store.set('a', 1, size=5)
+        store.set('a', 2, size=3)
+        self.assertEqual(store.total_bytes, 3)
+        self.assertEqual(store.pop('a'), 2)
+        self.assertEqual(store.total_bytes, 0)
+        self.assertEqual(store.pop('a'), None)
+
+
+class TestResponseCache(TestCase):
+
+    def test_entry_from_response(self):
+        response = Mock(**{'headers': {'ETag': '"abc"',
+                                       'Last-Modified': 'yesterday'},
+                           'content': b'{"a": 1}'})
+        entry = CacheEntry.from_response(response, {'a': 1})
+        self.assertEqual(entry.size, 8)
+        self.assertEqual(entry.validators(),
+                         {'If-None-Match': '"abc"',
+                          'If-Modified-Since': 'yesterday'})
+
+    def test_entry_max_age(self):
+        response = Mock(**{'headers': {'Cache-Control': 'public, max-age=60'},
+                           'content': b'{}'})
+        entry = CacheEntry.from_response(response, {})
+        self.assertTrue(entry.fresh)
+        self.assertFalse(entry.revalidatable)
+
+    def test_entry_without_validators_not_stored(self):
+        response = Mock(**{'headers': {}, 'content': b'{}'})
+        entry = CacheEntry.from_response(response, {})
+        cache = ResponseCache()
+        cache.set('a', entry)
+        self.assertEqual(cache.get('a'), None)
+        cache = ResponseCache(ttl=60)
+        cache.set('a', entry)
+        self.assertTrue(cache.get('a').fresh)
+
+    def test_no_store_not_stored(self):
+        response = Mock(**{'headers': {'Cache-Control': 'no-store, max-age=60',
+                                       'ETag': '"abc"'},
+                           'content': b'{}'})
+        entry = CacheEntry.from_response(response, {})
+        self.assertTrue(entry.no_store)
+        self.assertFalse(entry.fresh)
+        cache = ResponseCache(ttl=60)
+        cache.set('a', CacheEntry({}, etag='"old"'))
+        cache.set('a', entry)
+        self.assertEqual(cache.get('a'), None)
+
+    def test_cache_limits(self):
+        cache = ResponseCache(max_entries=2, max_bytes=100)
+        for url in ('a', 'b', 'c'):
+            cache.set(url, CacheEntry({}, etag=url, size=10))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('c').etag, 'c')
+        cache.delete('c')
+        self.assertEqual(cache.total_bytes, 10)
+
+
+def write_entries(path, prefix):
+    cache = SqliteCache(path, ttl=60)
+    for n in range(50):
+        cache.set('{}-{}'.format(prefix, n), CacheEntry({'n': n}, etag='x'))
+
+
+class TestSqliteCache(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        cache = SqliteCache(self.path, ttl=60)
+        body = {'href': 'http://www.google.com', 'items': [{'a': 'b'}] * 50}
+        cache.set('url', CacheEntry(body, etag='"v1"'))
+        entry = SqliteCache(self.path).get('url')
+        self.assertEqual(entry.body, body)
+        self.assertEqual(entry.etag, '"v1"')
+        self.assertTrue(entry.fresh)
+        # bodies are stored compressed
+        self.assertLess(cache.total_bytes, entry.size)
+
+    def test_expired_entries(self):
+        cache = SqliteCache(self.path, ttl=60)
+        past = time.time() - 1
+        cache.set('stale', CacheEntry({}, etag='"v1"', expires=past))
+        cache.set('gone', CacheEntry({}, expires=past))
+        entry = cache.get('stale')
+        self.assertFalse(entry.fresh)
+        self.assertEqual(entry.validators(), {'If-None-Match': '"v1"'})
+        self.assertEqual(cache.get('gone'), None)
+
+    def test_no_store_removes_entry(self):
+        cache = SqliteCache(self.path, ttl=60)
+        cache.set('url', CacheEntry({}, etag='"v1"'))
+        cache.set('url', CacheEntry({}, etag='"v2"', no_store=True))
+        self.assertEqual(cache.get('url'), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_size_cap(self):
+        cache = SqliteCache(self.path, ttl=60, max_bytes=200)
+        for n in range(20):
+            cache.set(str(n), CacheEntry({'n': n}, etag='x'))
+        self.assertLessEqual(cache.total_bytes, 200)
+        self.assertLess(len(cache), 20)
+        self.assertNotEqual(cache.get('19'), None)
+
+    def test_concurrent_processes(self):
+        SqliteCache(self.path)
+        workers = [Process(target=write_entries, args=(self.path, p))
+                   for p in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(len(SqliteCache(self.path)), 200)
+
+
+class TestHomeDocCache(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'home.json')
+        self.entry_point = 'https://api-sandbox.pmp.io'
+        self.body = {'href': self.entry_point, 'links': {}}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def response(self, status_code=200, headers=None):
+        return Mock(**{'status_code': status_code,
+                       'headers': headers or {},
+                       'content': json.dumps(self.body).encode('utf-8')})
+
+    def test_fresh_home_doc_not_refetched(self):
+        cache = HomeDocCache(ttl=60)
+        with patch('requests.get',
+                   return_value=self.response()) as mocker:
+            first = cache.fetch(self.entry_point)
+            first['edited'] = True
+            second = cache.fetch(self.entry_point)
+        self.assertEqual(mocker.call_count, 1)
+        self.assertEqual(second, self.body)
+
+    def test_stale_home_doc_revalidated(self):
+        cache = HomeDocCache(ttl=60)
+        cache.set(self.entry_point,
+                  CacheEntry(self.body, etag='"v1"', expires=time.time() - 1))
+        with patch('requests.get',
+                   return_value=self.response(304)) as mocker:
+            self.assertEqual(cache.fetch(self.entry_point), self.body)
+        mocker.assert_called_with(self.entry_point,
+                                  headers={'If-None-Match': '"v1"'})
+        self.assertTrue(cache.fresh(self.entry_point))
+
+    def test_saved_to_disk(self):
+        HomeDocCache(ttl=60, path=self.path).store(self.entry_point,
+                                                   self.body)
+        cache = HomeDocCache(ttl=60, path=self.path)
+        self.assertTrue(cache.fresh(self.entry_point))
+        with patch('requests.get') as mocker:
+            self.assertEqual(cache.fetch(self.entry_point), self.body)
+        self.assertFalse(mocker.called)
+        cache.delete(self.entry_point)
+        self.assertIsNone(HomeDocCache(path=self.path).get(self.entry_point))
+
+
+class TestChainCache(TestCase):
+
+    def test_hits_promoted(self):
+        memory = ResponseCache()
+        backing = ResponseCache()
+        cache = ChainCache(memory, backing)
+        backing.set('url', CacheEntry({'a': 1}, etag='x'))
+        self.assertEqual(cache.get('url').body, {'a': 1})
+        self.assertEqual(memory.get('url').body, {'a': 1})
+        cache.delete('url')
+        self.assertEqual(backing.get('url'), None)
+
+
+class TestNavigationCache(TestCase):
+
+    def test_depth_and_bytes(self):
+        cache = NavigationCache(depth=2)
+        docs = [NavigableDoc({'href': str(n), 'links': {}}) for n in range(3)]
+        for doc in docs:
+            cache.set(doc.href, doc)
+        self.assertEqual(cache.get('0'), None)
+        self.assertEqual(cache.get('2').collectiondoc, docs[2].collectiondoc)
+        cache = NavigationCache(max_bytes=100)
+        cache.set('0', docs[0], size=60)
+        cache.set('1', docs[1], size=60)
+        self.assertEqual(len(cache), 1)
+
+    def test_documents_copied(self):
+        cache = NavigationCache()
+        doc = NavigableDoc({'href': 'a', 'links': {},
+                            'attributes': {'title': 'old'}})
+        cache.set('a', doc)
+        doc.collectiondoc['attributes']['title'] = 'edited'
+        cached = cache.get('a')
+        self.assertIsNot(cached, doc)
+        cached.collectiondoc['attributes']['title'] = 'edited'
+        self.assertEqual(cache.get('a').attributes['title'], 'old')
+
+    def test_size_estimated_from_first_item(self):
+        cache = NavigationCache(max_bytes=1000)
+        item = {'href': 'x' * 80, 'attributes': {'guid': 'y' * 20}}
+        doc = NavigableDoc({'href': 'a', 'links': {}, 'items': [item] * 20})
+        cache.set('a', doc)
+        self.assertEqual(len(cache), 0)
+        cache.set('b', NavigableDoc({'href': 'b', 'links': {},
+                                     'items': [item]}))
+        self.assertEqual(len(cache), 1)
+
+    def test_max_age(self):
+        cache = NavigationCache(max_age=60)
+        doc = NavigableDoc({'href': 'a', 'links': {}})
+        cache.set('a', doc)
+        self.assertEqual(cache.get('a').href, 'a')
+        cache.max_age = -1
+        self.assertEqual(cache.get('a'), None)
+
+
+class TestQueryCache(TestCase):
+
+    def setUp(self):
+        self.page = NavigableDoc({
+            'href': 'https://api.pmp.io/docs?limit=2&tag=kpbs', 'links': {},
+            'items': [{'href': 'https://api.pmp.io/docs/a',
+                       'attributes': {'guid': 'a'}}]})
+
+    def test_params_canonicalized(self):
+        cache = QueryCache()
+        cache.set('urn:docs', {'tag': 'kpbs', 'limit': 2}, self.page.href,
+                  self.page)
+        self.assertIs(cache.get('urn:docs', {'limit': '2', 'tag': 'kpbs',
+                                             'profile': None})[1],
+                      self.page)
+        self.assertIsNone(cache.get('urn:docs', {'tag': 'kpbs'}))
+        self.assertIsNone(cache.get('urn:other', {'tag': 'kpbs',
+                                                  'limit': 2}))
+
+    def test_ttl_per_rel(self):
+        cache = QueryCache(ttl=60, ttls={'urn:live': -1})
+        cache.set('urn:docs', None, self.page.href, self.page)
+        cache.set('urn:live', None, self.page.href, self.page)
+        self.assertIsNotNone(cache.get('urn:docs'))
+        self.assertIsNone(cache.get('urn:live'))
+        cache.ttls['urn:docs'] = 0.01
+        cache.set('urn:docs', None, self.page.href, self.page)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('urn:docs'))
+        self.assertEqual(len(cache), 0)
+
+    def test_size_eviction(self):
+        cache = QueryCache(max_bytes=200)
+        for n in range(3):
+            cache.set('urn:docs', {'offset': n}, self.page.href, self.page,
+                      size=100)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('urn:docs', {'offset': 0}))
+
+    def test_invalidate(self):
+        cache = QueryCache()
+        cache.set('urn:docs', {'tag': 'kpbs'}, self.page.href, self.page)
+        cache.set('urn:docs', {'tag': 'other'}, 'x',
+                  NavigableDoc({'href': 'x', 'links': {}}))
+        self.assertEqual(cache.invalidate(guid='missing'), 0)
+        self.assertEqual(cache.invalidate(guid='a'), 1)
+        self.assertIsNone(cache.get('urn:docs', {'tag': 'kpbs'}))
+        self.assertEqual(cache.invalidate(href='x'), 1)
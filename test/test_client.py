@@ -1,5 +1,8 @@
 import os
 import json
+import shutil
+import tempfile
+import threading
 import requests
 
 
@@ -11,6 +14,11 @@ from pelecanus import PelicanJson
 from server import run_forever
 from pmp_api.pmp_client import Client
 from pmp_api.core.auth import PmpAuth
+from pmp_api.core.conn import PmpConnector
+from pmp_api.core.cache import HomeDocCache
+from pmp_api.core.cache import NavigationCache
+from pmp_api.core.cache import QueryCache
+from pmp_api.core.cache import ResponseCache
 
 from pmp_api.collectiondoc.navigabledoc import NavigableDoc
 from pmp_api.core.exceptions import NoToken
@@ -78,7 +86,7 @@ class TestPmpClient(TestCase):
 
     def test_gain_access_with_server(self):
         client = Client(self.test_entry_point)
-        response = Mock(**{"json.return_value": self.home_values})
+        response = Mock(**{"content": json.dumps(self.home_values)})
         with patch.object(requests, 'get', return_value=response):
             # We have to patch the first request for the homedoc...
             client.gain_access('client-id', 'client-secret')
@@ -306,7 +314,7 @@ class TestPmpClient(TestCase):
 
     def test_save(self):
         client = Client(self.test_entry_point)
-        response = Mock(**{"json.return_value": self.home_values})
+        response = Mock(**{"content": json.dumps(self.home_values)})
         with patch.object(requests, 'get', return_value=response):
             client.gain_access('client-id', 'client-secret')
         put_url = "http://127.0.0.1:8080/?json_response={}"
@@ -315,7 +323,7 @@ class TestPmpClient(TestCase):
 
     def test_delete(self):
         client = Client(self.test_entry_point)
-        response = Mock(**{"json.return_value": self.home_values})
+        response = Mock(**{"content": json.dumps(self.home_values)})
         with patch.object(requests, 'get', return_value=response):
             client.gain_access('client-id', 'client-secret')
         document = client.get(self.data_url)
@@ -325,3 +333,386 @@ class TestPmpClient(TestCase):
     # def test_upload(self):
     #     # this method has not been implemented
     #     self.fail("client test_upload not implemented")
+
+    def test_get_many_leaves_navigation(self):
+        client = Client(self.test_entry_point)
+        with open(self.data_doc, 'r') as jfile:
+            values = json.loads(jfile.read())
+        mock_connector = Mock(**{'get_many.return_value':
+                                 iter([(self.data_url, values),
+                                       (self.test_url, NoToken())])})
+        client.connector = mock_connector
+        results = dict(client.get_many([self.data_url, self.test_url]))
+        self.assertIsInstance(results[self.data_url], NavigableDoc)
+        self.assertIsInstance(results[self.test_url], NoToken)
+        self.assertEqual(client.history, [])
+        self.assertEqual(client.current_page, None)
+        self.assertEqual(client.document, None)
+
+    def test_back_forward_from_nav_cache(self):
+        client = Client(self.test_entry_point, nav_cache=NavigationCache())
+        with open(self.data_doc, 'r') as jfile:
+            values = json.loads(jfile.read())
+        mock_connector = Mock(**{'get.side_effect': lambda url: values})
+        client.connector = mock_connector
+        first = client.get(self.data_url)
+        second = client.get(self.test_url)
+        self.assertEqual(client.back().href, first.href)
+        self.assertEqual(client.forward().href, second.href)
+        self.assertEqual(mock_connector.get.call_count, 2)
+        self.assertEqual(client.current_page, self.test_url)
+        self.assertEqual(client.history, [self.data_url])
+
+    def test_nav_cache_max_age(self):
+        client = Client(self.test_entry_point,
+                        nav_cache=NavigationCache(max_age=0))
+        with open(self.data_doc, 'r') as jfile:
+            values = json.loads(jfile.read())
+        mock_connector = Mock(**{'get.side_effect': lambda url: values})
+        client.connector = mock_connector
+        client.get(self.data_url)
+        client.get(self.test_url)
+        client.back()
+        self.assertEqual(mock_connector.get.call_count, 3)
+
+
+class TestClientWarmUp(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            self.home_values = json.loads(jf.read())
+        self.entry_point = 'http://127.0.0.1:8080/'
+        self.tmpdir = tempfile.mkdtemp()
+        self.home_path = os.path.join(self.tmpdir, 'home.json')
+        self.profile_url = 'http://127.0.0.1:8080/profiles/story'
+        self.query_url = 'http://127.0.0.1:8080/docs?tag=kpbs'
+        self.token_requested = threading.Event()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def fake_token(self, url):
+        self.token_requested.set()
+        return 'TOKEN'
+
+    def warm_up(self, client, home_response):
+        with patch.object(requests, 'get', side_effect=home_response), \
+                patch.object(PmpAuth, 'get_access_token2',
+                             side_effect=self.fake_token), \
+                patch.object(PmpConnector, 'get',
+                             side_effect=lambda url: {'href': url,
+                                                      'links': {}}):
+            client.gain_access('client-id', 'client-secret', warm_up=True,
+                               home_doc_path=self.home_path,
+                               profiles=['story'],
+                               queries=[('urn:collectiondoc:query:docs',
+                                         {'tag': 'kpbs'})])
+
+    def test_warm_up_prefetches(self):
+        client = Client(self.entry_point)
+        response = Mock(**{"content": json.dumps(self.home_values)})
+        self.warm_up(client, lambda url: response)
+        self.assertIsInstance(client.connector, PmpConnector)
+        self.assertEqual(sorted(client.prefetched),
+                         [self.query_url, self.profile_url])
+        with open(self.home_path) as home_file:
+            self.assertEqual(json.loads(home_file.read()), self.home_values)
+
+        with patch.object(PmpConnector, 'get') as mocker:
+            document = client.get(self.profile_url)
+        self.assertFalse(mocker.called)
+        self.assertEqual(document.collectiondoc['href'], self.profile_url)
+        self.assertNotIn(self.profile_url, client.prefetched)
+
+    def test_saved_home_doc_overlaps_token_request(self):
+        with open(self.home_path, 'w') as home_file:
+            home_file.write(json.dumps(self.home_values))
+        fresh = dict(self.home_values, version='fresh')
+        response = Mock(**{"content": json.dumps(fresh)})
+
+        def home_response(url):
+            # only answers once the token request has started
+            self.assertTrue(self.token_requested.wait(5))
+            return response
+
+        client = Client(self.entry_point)
+        self.warm_up(client, home_response)
+        self.assertEqual(client.document.collectiondoc['version'], 'fresh')
+        self.assertEqual(len(client.prefetched), 2)
+
+    def test_saved_home_doc_used_when_fetch_fails(self):
+        with open(self.home_path, 'w') as home_file:
+            home_file.write(json.dumps(self.home_values))
+
+        def home_response(url):
+            raise requests.ConnectionError()
+
+        client = Client(self.entry_point)
+        self.warm_up(client, home_response)
+        self.assertEqual(client.document.collectiondoc, self.home_values)
+        self.assertIsInstance(client.connector, PmpConnector)
+
+
+class TestClientHomeDoc(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            self.home_values = json.loads(jf.read())
+        self.entry_point = 'http://127.0.0.1:8080/'
+        self.response = Mock(**{'status_code': 200, 'headers': {},
+                                'content': json.dumps(self.home_values)})
+
+    def test_home_uses_cache(self):
+        home_cache = HomeDocCache(ttl=60)
+        with patch.object(requests, 'get',
+                          return_value=self.response) as mocker:
+            Client(self.entry_point, home_cache=home_cache).home()
+            client = Client(self.entry_point, home_cache=home_cache)
+            document = client.home()
+        self.assertEqual(mocker.call_count, 1)
+        self.assertEqual(document.links, client.home_doc.links)
+
+    def test_query_uses_home_doc(self):
+        client = Client(self.entry_point, home_cache=HomeDocCache(ttl=60))
+        with patch.object(requests, 'get', return_value=self.response):
+            client.home()
+        client.document = NavigableDoc({'links': {}})
+        client.get = Mock()
+        client.query('urn:collectiondoc:query:docs', {'tag': 'kpbs'})
+        client.get.assert_called_with('http://127.0.0.1:8080/docs?tag=kpbs')
+
+
+class TestClientReadAhead(TestCase):
+
+    def setUp(self):
+        from test_pager import page
+        self.page = page
+        self.fetched = []
+
+        def fetch(url):
+            self.fetched.append(url)
+            return self.page(int(url.split('-')[1])).collectiondoc
+
+        self.client = Client('http://127.0.0.1:8080/', prefetch_depth=2)
+        self.client.connector = Mock(**{'get.side_effect': fetch})
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_next_served_from_read_ahead(self):
+        self.client.get('page-1')
+        for n in range(2, 6):
+            self.assertEqual(self.client.next().collectiondoc['href'],
+                             'page-{}'.format(n))
+        # every page was fetched once, in order
+        self.assertEqual(self.fetched[:5],
+                         ['page-1', 'page-2', 'page-3', 'page-4', 'page-5'])
+        self.assertEqual(len(set(self.fetched)), len(self.fetched))
+
+    def test_navigating_elsewhere_cancels(self):
+        self.client.get('page-1')
+        self.client.get('page-7')
+        self.assertNotIn('page-2', self.client.read_ahead)
+
+    def test_close(self):
+        with self.client as client:
+            client.get('page-1')
+        self.assertEqual(len(client.read_ahead), 0)
+        self.assertEqual(client.read_ahead._executor, None)
+        client.connector.close.assert_called_with()
+        client.connector.authorizer.stop_refresh.assert_called_with()
+
+
+class TestClientGetPages(TestCase):
+
+    def test_get_pages_in_order(self):
+        from test_pager import page
+        client = Client('http://127.0.0.1:8080/')
+        client.connector = PmpConnector(Mock())
+        client.pager = NavigableDoc({'links': {'navigation': [
+            {'rels': ['first'], 'href': 'http://x/docs?limit=2'},
+            {'rels': ['last'], 'href': 'http://x/docs?offset=18&limit=2'}]}
+        }).pager
+
+        def fake_get(endpoint):
+            doc = page(0).collectiondoc
+            doc['items'] = [endpoint + '#0', endpoint + '#1']
+            return doc
+
+        with patch.object(client.connector, 'get', side_effect=fake_get):
+            items = list(client.get_page_items(max_workers=4))
+        self.assertEqual(len(items), 20)
+        self.assertEqual(items[0], 'http://x/docs?limit=2#0')
+        self.assertEqual(items[-1], 'http://x/docs?offset=18&limit=2#1')
+        self.assertIsNone(client.current_page)
+
+
+class TestClientIterItems(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            self.client = Client('http://127.0.0.1:8080/')
+            self.client._set_home_doc(json.loads(jf.read()))
+
+    def test_iter_items_leaves_navigation(self):
+        from test_pager import page
+        requested = []
+
+        def fake_get(url):
+            requested.append(url)
+            doc = page(len(requested), last=2).collectiondoc
+            doc['items'] = [{'href': 'item', 'links': {}}] * 3
+            return doc
+
+        self.client.connector = Mock(**{'get.side_effect': fake_get})
+        stream = self.client.iter_items('urn:collectiondoc:query:docs',
+                                        {'tag': 'kpbs'}, page_size=3,
+                                        documents=True)
+        items = list(stream)
+        self.assertEqual(len(items), 6)
+        self.assertIsInstance(items[0], NavigableDoc)
+        self.assertEqual(requested,
+                         ['http://127.0.0.1:8080/docs?limit=3&tag=kpbs',
+                          'page-2'])
+        self.assertEqual(self.client.history, [])
+        self.assertIsNone(self.client.current_page)
+
+    def test_iter_items_resume(self):
+        self.client.connector = Mock(**{'get.return_value': {'items': [1, 2]}})
+        stream = self.client.iter_items(None, cursor=('page-5', 1))
+        self.assertEqual(list(stream), [2])
+        self.client.connector.get.assert_called_with('page-5')
+
+
+class TestClientFetch(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            self.client = Client('http://127.0.0.1:8080/')
+            self.client._set_home_doc(json.loads(jf.read()))
+        self.client.connector = Mock(**{'get.side_effect':
+                                        lambda url: {'href': url,
+                                                     'links': {}}})
+
+    def test_fetch_from_threads(self):
+        urls = ['http://127.0.0.1:8080/docs/{}'.format(n) for n in range(32)]
+        results = {}
+
+        def fetch(url):
+            results[url] = self.client.fetch(url)
+
+        threads = [threading.Thread(target=fetch, args=(url,))
+                   for url in urls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for url in urls:
+            self.assertEqual(results[url].collectiondoc['href'], url)
+        self.assertEqual(self.client.history, [])
+        self.assertIsNone(self.client.current_page)
+        self.assertIs(self.client.document, self.client.home_doc)
+
+    def test_fetch_query_uses_home_doc(self):
+        self.client.document = NavigableDoc({'links': {}})
+        document = self.client.fetch_query('urn:collectiondoc:query:docs',
+                                           {'tag': 'kpbs'})
+        self.assertEqual(document.collectiondoc['href'],
+                         'http://127.0.0.1:8080/docs?tag=kpbs')
+        with self.assertRaises(BadQuery):
+            self.client.fetch_query('urn:missing')
+
+
+class TestClientQueryCache(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            home_values = json.loads(jf.read())
+        self.client = Client('http://127.0.0.1:8080/',
+                             query_cache=QueryCache())
+        self.client._set_home_doc(home_values)
+        self.client.connector = Mock(**{'get.side_effect': self.page,
+                                        'put.return_value': True,
+                                        'delete.return_value': True})
+
+    def page(self, url):
+        return {'href': url, 'links': {},
+                'items': [{'href': 'http://127.0.0.1:8080/docs/a',
+                           'attributes': {'guid': 'a'}}]}
+
+    def test_query_reuses_results(self):
+        urn = 'urn:collectiondoc:query:docs'
+        first = self.client.query(urn, {'tag': 'kpbs', 'limit': 5})
+        self.assertIs(self.client.query(urn, {'limit': '5', 'tag': 'kpbs'}),
+                      first)
+        self.assertIs(self.client.fetch_query(urn, {'limit': 5,
+                                                    'tag': 'kpbs'}), first)
+        self.assertEqual(self.client.connector.get.call_count, 1)
+        self.assertEqual(self.client.history, [first.href])
+        self.assertEqual(self.client.current_page, first.href)
+
+    def test_save_and_delete_invalidate(self):
+        urn = 'urn:collectiondoc:query:docs'
+        self.client.query(urn, {'tag': 'kpbs'})
+        self.client.save('https://publish.pmp.io/docs/a',
+                         json.dumps({'attributes': {'guid': 'a'}}))
+        self.client.query(urn, {'tag': 'kpbs'})
+        self.assertEqual(self.client.connector.get.call_count, 2)
+        self.client.delete(NavigableDoc(self.page(
+            'http://127.0.0.1:8080/docs/a')))
+        self.client.fetch_query(urn, {'tag': 'kpbs'})
+        self.assertEqual(self.client.connector.get.call_count, 3)
+
+
+class TestClientSave(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            home_values = json.loads(jf.read())
+        self.read_url = 'http://127.0.0.1:8080/docs/a'
+        self.save_url = 'https://publish-sandbox.pmp.io/docs/a'
+        self.client = Client('http://127.0.0.1:8080/')
+        self.client._set_home_doc(home_values)
+
+    def doc(self, title):
+        return {'href': self.read_url, 'links': {},
+                'attributes': {'guid': 'a', 'title': title}}
+
+    def response(self, values, status_code=200):
+        return Mock(**{'ok': True, 'status_code': status_code, 'headers': {},
+                       'content': json.dumps(values).encode()})
+
+    def test_save_invalidates_read_url(self):
+        auth = Mock(**{'access_token': 'token',
+                       'sign_request.side_effect': lambda req: req})
+        self.client.connector = PmpConnector(
+            auth, cache=ResponseCache(ttl=300))
+        put = self.response({'url': self.read_url}, status_code=202)
+        session = Mock(**{'send.side_effect': [self.response(self.doc('old')),
+                                               put,
+                                               self.response(self.doc('new'))],
+                          'prepare_request.side_effect': lambda req: req})
+        with patch.object(requests, 'Session', return_value=session):
+            self.client.fetch(self.read_url)
+            self.client.save(self.save_url, json.dumps(self.doc('new')))
+            document = self.client.fetch(self.read_url)
+        self.assertEqual(document.attributes['title'], 'new')
+        self.assertEqual(session.send.call_count, 3)
+
+    def test_save_invalidates_nav_cache(self):
+        self.client.nav_cache = NavigationCache()
+        self.client.connector = Mock(**{'get.return_value': self.doc('old'),
+                                        'put.return_value': True,
+                                        'cache': None})
+        self.client.get(self.read_url)
+        self.client.save(self.save_url, json.dumps(self.doc('new')))
+        self.client.connector.get.return_value = self.doc('new')
+        document = self.client.get(self.read_url)
+        self.assertEqual(document.attributes['title'], 'new')
+        self.assertEqual(self.client.connector.get.call_count, 2)
@@ -2,11 +2,16 @@ from unittest import TestCase
 from unittest.mock import Mock, patch, call
 
 import os
+import json
+import time
 import datetime
+import threading
 import requests
 from multiprocessing import Process
 
 from pmp_api.core.conn import PmpConnector
+from pmp_api.core.cache import ResponseCache
+from pmp_api.core.retry import RetryPolicy
 from pmp_api.core.exceptions import BadRequest
 from pmp_api.core.exceptions import ExpiredToken
 from pmp_api.core.exceptions import EmptyResponse
@@ -28,7 +33,7 @@ class TestPmpConnector(TestCase):
                           'token_issued': datetime.datetime.utcnow() - self.delta,
                           'sign_request.return_value': self.signed_request}
         self.test_vals = {'a': 1, 'b': 2, 'c': 'VALUE'}
-        self.attribs = {'ok': True, 'json.return_value': self.test_vals}
+        self.attribs = {'ok': True, 'content': json.dumps(self.test_vals).encode()}
         # Live server testing with JSON responses
         current_dir = os.path.abspath(os.path.dirname(__file__))
         self.fixture_dir = os.path.join(current_dir, 'fixtures')
@@ -89,7 +94,7 @@ class TestPmpConnector(TestCase):
         against the url and auto-reset the access token.
 
         If the `reauthorize` method does attempt to reauthenticate, it
-        should call the method `authorizer.get_access_token2`.
+        should call the method `authorizer.renew_token`.
         """
         auth_vals = {'client_id': 'client-id',
                      'client_secret': 'client-secret',
@@ -105,7 +110,7 @@ class TestPmpConnector(TestCase):
             self.assertTrue(pconn.reauthorize())
             self.assertEqual(len(authorizer.mock_calls), 1)
             self.assertEqual(authorizer.mock_calls[0],
-                             call.get_access_token2('http://www.google.com'))
+                             call.renew_token(stale_token=None))
 
     def test_reauthorize_live_server_response(self):
         from pmp_api.core.auth import PmpAuth
@@ -114,6 +119,37 @@ class TestPmpConnector(TestCase):
         connector = PmpConnector(authorizer)
         self.assertTrue(connector.reauthorize())
 
+    def test_concurrent_reauthorize_single_flight(self):
+        from pmp_api.core.auth import PmpAuth
+        authorizer = PmpAuth('client-id', 'client-secret')
+        authorizer.access_token = 'OLD-TOKEN'
+        authorizer.access_token_url = "http://www.google.com"
+        authorizer.token_expires = (datetime.datetime.utcnow() -
+                                    datetime.timedelta(seconds=1))
+        calls = []
+
+        def slow_token(url):
+            calls.append(url)
+            time.sleep(0.1)
+            authorizer.access_token = 'NEW-TOKEN'
+            authorizer.token_expires = (datetime.datetime.utcnow() +
+                                        datetime.timedelta(hours=4))
+
+        connector = PmpConnector(authorizer)
+        results = []
+        with patch.object(authorizer, 'get_access_token2',
+                          side_effect=slow_token):
+            threads = [threading.Thread(
+                target=lambda: results.append(connector.reauthorize()))
+                for _ in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [True] * 20)
+        self.assertEqual(authorizer.access_token, 'NEW-TOKEN')
+
 
 class TestPmpConnectorGet(TestCase):
     def setUp(self):
@@ -129,13 +165,13 @@ class TestPmpConnectorGet(TestCase):
                           'token_issued': datetime.datetime.utcnow() - self.delta,
                           'sign_request.return_value': self.signed_request}
         self.test_vals = {'a': 1, 'b': 2, 'c': 'VALUE'}
-        self.attribs = {'ok': True, 'json.return_value': self.test_vals}
+        self.attribs = {'ok': True, 'content': json.dumps(self.test_vals).encode()}
 
     def test_bad_response(self):
         self.auth_vals['token_expires'] = datetime.datetime.utcnow() + self.delta
         authorizer = Mock(**self.auth_vals)
         pconn = PmpConnector(authorizer)
-        attribs = {'ok': False, 'json.side_effect': ValueError}
+        attribs = {'ok': False, 'content': b''}
         response = Mock(**attribs)
         session = Mock(**{'send.return_value': response,
                           'prepare_request.return_value': self.signed_request})
@@ -167,7 +203,7 @@ class TestPmpConnectorGet(TestCase):
 
     def test_get_with_no_json(self):
         self.auth_vals['token_expires'] = datetime.datetime.utcnow() + self.delta
-        attribs = {'ok': True, 'json.side_effect': ValueError}
+        attribs = {'ok': True, 'content': b''}
         response = Mock(**attribs)
         session = Mock(**{'send.return_value': response,
                           'prepare_request.return_value': self.signed_request})
@@ -183,7 +219,7 @@ class TestPmpConnectorGet(TestCase):
         against the url and auto-reset the access token.
 
         This test looks to see if the PmpConnector's authorizer has been
-        called three times, including a call to `get_access_token2` in the
+        called three times, including a call to `renew_token` in the
         middle, which only happens in that particular branch of the function.
         """
         auth_vals = {'client_id': 'client-id',
@@ -201,7 +237,7 @@ class TestPmpConnectorGet(TestCase):
             pconn.get("http://www.google.com")
             self.assertEqual(len(authorizer.mock_calls), 3)
             self.assertEqual(authorizer.mock_calls[1],
-                             call.get_access_token2('http://www.google.com'))
+                             call.renew_token(stale_token=False))
 
 
 class TestPmpConnectorPut(TestCase):
@@ -219,13 +255,13 @@ class TestPmpConnectorPut(TestCase):
                           'token_issued': datetime.datetime.utcnow() - self.delta,
                           'sign_request.return_value': self.signed_request}
         self.test_vals = {'a': 1, 'b': 2, 'c': 'VALUE'}
-        self.attribs = {'ok': True, 'json.return_value': self.test_vals}
+        self.attribs = {'ok': True, 'content': json.dumps(self.test_vals).encode()}
 
     def test_bad_put_response(self):
         self.auth_vals['token_expires'] = datetime.datetime.utcnow() + self.delta
         authorizer = Mock(**self.auth_vals)
         pconn = PmpConnector(authorizer)
-        attribs = {'ok': False, 'json.side_effect': ValueError}
+        attribs = {'ok': False, 'content': b''}
         response = Mock(**attribs)
         session = Mock(**{'send.return_value': response,
                           'prepare_request.return_value': self.signed_request})
@@ -257,7 +293,7 @@ class TestPmpConnectorPut(TestCase):
 
     def test_put_with_no_json(self):
         self.auth_vals['token_expires'] = datetime.datetime.utcnow() + self.delta
-        attribs = {'ok': True, 'json.side_effect': ValueError}
+        attribs = {'ok': True, 'content': b''}
         response = Mock(**attribs)
         session = Mock(**{'send.return_value': response,
                           'prepare_request.return_value': self.signed_request})
@@ -273,7 +309,7 @@ class TestPmpConnectorPut(TestCase):
         against the url and auto-reset the access token.
 
         This test looks to see if the PmpConnector's authorizer has been
-        called three times, including a call to `get_access_token2` in the
+        called three times, including a call to `renew_token` in the
         middle, which only happens in that particular branch of the function.
         """
         auth_vals = {'client_id': 'client-id',
@@ -291,7 +327,7 @@ class TestPmpConnectorPut(TestCase):
             pconn.put("http://www.google.com", {'some': 'data'})
             self.assertEqual(len(authorizer.mock_calls), 3)
             self.assertEqual(authorizer.mock_calls[1],
-                             call.get_access_token2('http://www.google.com'))
+                             call.renew_token(stale_token=False))
 
 
 class TestPmpConnectorDelete(TestCase):
@@ -337,7 +373,7 @@ class TestPmpConnectorDelete(TestCase):
         against the url and auto-reset the access token.
 
         This test looks to see if the PmpConnector's authorizer has been
-        called three times, including a call to `get_access_token2` in the
+        called three times, including a call to `renew_token` in the
         middle, which only happens in that particular branch of the function.
         """
         auth_vals = {'client_id': 'client-id',
@@ -356,4 +392,304 @@ class TestPmpConnectorDelete(TestCase):
             self.assertTrue(pconn.delete("http://www.google.com"))
             self.assertEqual(len(authorizer.mock_calls), 3)
             self.assertEqual(authorizer.mock_calls[1],
-                             call.get_access_token2('http://www.google.com'))
+                             call.renew_token(stale_token=False))
+
+
+class TestPmpConnectorSession(TestCase):
+
+    def setUp(self):
+        token = 'bd50df0000000000'
+        header = {'Authorization': 'Bearer ' + token}
+        header['Content-Type'] = 'application/vnd.collection.doc+json'
+        self.delta = datetime.timedelta(hours=4)
+        self.signed_request = Mock(**{'headers': header})
+        self.auth_vals = {'client_id': 'client-id',
+                          'client_secret': 'client-secret',
+                          'access_token': token,
+                          'access_token_url': None,
+                          'token_expires': datetime.datetime.utcnow() + self.delta,
+                          'sign_request.return_value': self.signed_request}
+        self.attribs = {'ok': True, 'status_code': 204,
+                        'content': b'{"a": 1}'}
+
+    def test_session_reused(self):
+        authorizer = Mock(**self.auth_vals)
+        response = Mock(**self.attribs)
+        session = Mock(**{'send.return_value': response,
+                          'prepare_request.return_value': self.signed_request})
+        pconn = PmpConnector(authorizer)
+        with patch.object(requests, 'Session', return_value=session) as mocker:
+            pconn.get("http://www.google.com")
+            pconn.put("http://www.google.com", {'some': 'data'})
+            pconn.delete("http://www.google.com")
+            self.assertEqual(mocker.call_count, 1)
+            self.assertEqual(session.send.call_count, 3)
+
+    def test_session_shared_by_threads(self):
+        pconn = PmpConnector(Mock(**self.auth_vals))
+        start = threading.Barrier(8)
+        sessions = []
+
+        def slow_session():
+            time.sleep(0.01)
+            return Mock()
+
+        def use_session():
+            start.wait()
+            sessions.append(pconn.session)
+
+        with patch.object(requests, 'Session',
+                          side_effect=slow_session) as mocker:
+            threads = [threading.Thread(target=use_session)
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(mocker.call_count, 1)
+        self.assertEqual(len(set(map(id, sessions))), 1)
+
+    def test_session_pool_settings(self):
+        pconn = PmpConnector(Mock(**self.auth_vals),
+                             pool_connections=3,
+                             pool_maxsize=7)
+        adapter = pconn.session.get_adapter('https://api.pmp.io')
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        pconn.close()
+
+    def test_context_manager_closes_session(self):
+        session = Mock()
+        with patch.object(requests, 'Session', return_value=session):
+            with PmpConnector(Mock(**self.auth_vals)) as pconn:
+                pconn.session
+            self.assertTrue(session.close.called)
+            self.assertEqual(pconn._session, None)
+
+    def test_session_rebuilt_after_fork(self):
+        pconn = PmpConnector(Mock(**self.auth_vals))
+        parent_session = pconn.session
+        with patch.object(os, 'getpid', return_value=-1):
+            child_session = pconn.session
+            self.assertIs(child_session, pconn.session)
+        self.assertIsNot(parent_session, child_session)
+
+    def test_no_keep_alive_header(self):
+        authorizer = Mock(**self.auth_vals)
+        response = Mock(**self.attribs)
+        session = Mock(**{'send.return_value': response,
+                          'prepare_request.return_value': self.signed_request})
+        pconn = PmpConnector(authorizer, keep_alive=False)
+        with patch.object(requests, 'Session', return_value=session):
+            pconn.get("http://www.google.com")
+        sent_request = authorizer.sign_request.call_args[0][0]
+        self.assertEqual(sent_request.headers['Connection'], 'close')
+
+
+class TestPmpConnectorGetMany(TestCase):
+
+    def setUp(self):
+        self.auth_vals = {'access_token': 'bd50df0000000000',
+                          'token_expires': datetime.datetime.utcnow() + datetime.timedelta(hours=4)}
+
+    def test_get_many_yields_results_and_errors(self):
+        pconn = PmpConnector(Mock(**self.auth_vals))
+        urls = ['http://www.google.com/{}'.format(n) for n in range(20)]
+
+        def fake_get(endpoint):
+            if endpoint.endswith('/7'):
+                raise BadRequest(endpoint)
+            return {'href': endpoint}
+
+        with patch.object(pconn, 'get', side_effect=fake_get) as mocker:
+            results = dict(pconn.get_many(urls, max_workers=4))
+            self.assertEqual(mocker.call_count, 20)
+        self.assertEqual(set(results), set(urls))
+        self.assertIsInstance(results[urls[7]], BadRequest)
+        self.assertEqual(results[urls[3]], {'href': urls[3]})
+
+    def test_get_many_bounded_in_flight(self):
+        pconn = PmpConnector(Mock(**self.auth_vals))
+        lock = threading.Lock()
+        counts = {'current': 0, 'peak': 0}
+
+        def fake_get(endpoint):
+            with lock:
+                counts['current'] += 1
+                counts['peak'] = max(counts['peak'], counts['current'])
+            time.sleep(0.01)
+            with lock:
+                counts['current'] -= 1
+            return {}
+
+        urls = ('http://www.google.com/{}'.format(n) for n in range(30))
+        with patch.object(pconn, 'get', side_effect=fake_get):
+            self.assertEqual(len(list(pconn.get_many(urls, max_workers=3))), 30)
+        self.assertLessEqual(counts['peak'], 3)
+        self.assertGreater(counts['peak'], 1)
+
+    def test_get_many_ordered(self):
+        pconn = PmpConnector(Mock(**self.auth_vals))
+        urls = ['http://www.google.com/{}'.format(n) for n in range(12)]
+
+        def fake_get(endpoint):
+            # early urls finish last
+            time.sleep(0.002 * (12 - int(endpoint.rsplit('/', 1)[1])))
+            if endpoint.endswith('/5'):
+                raise BadRequest(endpoint)
+            return {'href': endpoint}
+
+        with patch.object(pconn, 'get', side_effect=fake_get):
+            results = list(pconn.get_many(urls, max_workers=4, ordered=True))
+        self.assertEqual([url for url, _ in results], urls)
+        self.assertIsInstance(results[5][1], BadRequest)
+        self.assertEqual(results[0][1], {'href': urls[0]})
+
+
+class TestPmpConnectorCache(TestCase):
+
+    def setUp(self):
+        token = 'bd50df0000000000'
+        self.delta = datetime.timedelta(hours=4)
+        self.signed_request = Mock(**{'headers': {}})
+        self.auth_vals = {'access_token': token,
+                          'token_expires': datetime.datetime.utcnow() + self.delta,
+                          'sign_request.side_effect': lambda req: req}
+        self.test_vals = {'a': 1, 'b': [1, 2]}
+
+    def test_conditional_get(self):
+        cache = ResponseCache()
+        first = Mock(**{'ok': True, 'status_code': 200,
+                        'headers': {'ETag': '"v1"'},
+                        'content': json.dumps(self.test_vals).encode()})
+        not_modified = Mock(**{'ok': True, 'status_code': 304,
+                               'content': b''})
+        session = Mock(**{'send.side_effect': [first, not_modified],
+                          'prepare_request.side_effect': lambda req: req})
+        pconn = PmpConnector(Mock(**self.auth_vals), cache=cache)
+        with patch.object(requests, 'Session', return_value=session):
+            self.assertEqual(pconn.get("http://www.google.com"),
+                             self.test_vals)
+            first_req = session.send.call_args_list[0][0][0]
+            self.assertNotIn('If-None-Match', first_req.headers)
+
+            result = pconn.get("http://www.google.com")
+            second_req = session.send.call_args_list[1][0][0]
+            self.assertEqual(second_req.headers['If-None-Match'], '"v1"')
+        self.assertEqual(result, self.test_vals)
+        result['b'].append(3)
+        self.assertEqual(cache.get("http://www.google.com").body['b'], [1, 2])
+
+    def test_response_without_validators_not_cached(self):
+        cache = ResponseCache()
+        response = Mock(**{'ok': True, 'status_code': 200, 'headers': {},
+                           'content': json.dumps(self.test_vals).encode()})
+        session = Mock(**{'send.return_value': response,
+                          'prepare_request.side_effect': lambda req: req})
+        pconn = PmpConnector(Mock(**self.auth_vals), cache=cache)
+        with patch.object(requests, 'Session', return_value=session):
+            pconn.get("http://www.google.com")
+        self.assertEqual(len(cache), 0)
+
+    def test_fresh_entry_served_without_request(self):
+        cache = ResponseCache(ttl=60)
+        response = Mock(**{'ok': True, 'status_code': 200, 'headers': {},
+                           'content': json.dumps(self.test_vals).encode()})
+        session = Mock(**{'send.return_value': response,
+                          'prepare_request.side_effect': lambda req: req})
+        pconn = PmpConnector(Mock(**self.auth_vals), cache=cache)
+        with patch.object(requests, 'Session', return_value=session):
+            pconn.get("http://www.google.com")
+            self.assertEqual(pconn.get("http://www.google.com"),
+                             self.test_vals)
+        self.assertEqual(session.send.call_count, 1)
+
+    def test_put_and_delete_invalidate(self):
+        cache = ResponseCache(ttl=60)
+        url = "http://www.google.com"
+        got = Mock(**{'ok': True, 'status_code': 200, 'headers': {},
+                      'content': json.dumps(self.test_vals).encode()})
+        put = Mock(**{'ok': True, 'status_code': 202, 'headers': {},
+                      'content': b'{"url": "http://www.google.com"}'})
+        deleted = Mock(**{'ok': True, 'status_code': 204, 'headers': {}})
+        session = Mock(**{'send.side_effect': [got, put, got, deleted],
+                          'prepare_request.side_effect': lambda req: req})
+        pconn = PmpConnector(Mock(**self.auth_vals), cache=cache)
+        with patch.object(requests, 'Session', return_value=session):
+            pconn.get(url)
+            pconn.put(url, '{}')
+            self.assertIsNone(cache.get(url))
+            pconn.get(url)
+            self.assertEqual(session.send.call_count, 3)
+            self.assertTrue(pconn.delete(url))
+            self.assertIsNone(cache.get(url))
+
+
+class TestPmpConnectorRetry(TestCase):
+
+    def setUp(self):
+        self.auth_vals = {'access_token': 'bd50df0000000000',
+                          'token_expires': datetime.datetime.utcnow() + datetime.timedelta(hours=4),
+                          'sign_request.side_effect': lambda req: req}
+
+    def test_get_retried(self):
+        bad = Mock(**{'ok': False, 'status_code': 503, 'headers': {}})
+        good = Mock(**{'ok': True, 'status_code': 200,
+                       'content': b'{"a": 1}'})
+        session = Mock(**{'send.side_effect': [bad, good],
+                          'prepare_request.side_effect': lambda req: req})
+        policy = RetryPolicy(sleep=lambda seconds: None)
+        pconn = PmpConnector(Mock(**self.auth_vals), retry=policy)
+        with patch.object(requests, 'Session', return_value=session):
+            self.assertEqual(pconn.get("http://www.google.com"), {'a': 1})
+        self.assertEqual(policy.stats['retries'], 1)
+
+    def test_delete_not_retried_unless_idempotent(self):
+        bad = Mock(**{'status_code': 503, 'headers': {}})
+        good = Mock(**{'status_code': 204, 'headers': {}})
+        session = Mock(**{'send.side_effect': [bad, bad, good],
+                          'prepare_request.side_effect': lambda req: req})
+        policy = RetryPolicy(sleep=lambda seconds: None)
+        pconn = PmpConnector(Mock(**self.auth_vals), retry=policy)
+        with patch.object(requests, 'Session', return_value=session):
+            self.assertFalse(pconn.delete("http://www.google.com"))
+            self.assertTrue(pconn.delete("http://www.google.com",
+                                         idempotent=True))
+
+    def test_rate_limiter_consulted(self):
+        limiter = Mock()
+        good = Mock(**{'ok': True, 'status_code': 200, 'headers': {},
+                       'content': b'{"a": 1}'})
+        session = Mock(**{'send.return_value': good,
+                          'prepare_request.side_effect': lambda req: req})
+        pconn = PmpConnector(Mock(**self.auth_vals), rate_limiter=limiter)
+        with patch.object(requests, 'Session', return_value=session):
+            pconn.get("http://www.google.com")
+            pconn.put("http://www.google.com", {'some': 'data'})
+        limiter.acquire.assert_has_calls([call('GET'), call('PUT')])
+        limiter.update.assert_called_with('PUT', {})
+
+    def test_coalesced_get(self):
+        calls = []
+
+        def slow_send(req):
+            calls.append(req)
+            time.sleep(0.05)
+            return Mock(**{'ok': True, 'status_code': 200,
+                           'content': b'{"a": [1]}'})
+
+        session = Mock(**{'send.side_effect': slow_send,
+                          'prepare_request.side_effect': lambda req: req})
+        pconn = PmpConnector(Mock(**self.auth_vals), coalesce=True)
+        results = []
+        with patch.object(requests, 'Session', return_value=session):
+            pconn.session
+            threads = [threading.Thread(
+                target=lambda: results.append(pconn.get("http://www.google.com")))
+                for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'a': [1]}] * 5)
@@ -0,0 +1,204 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import Mock
+
+from pmp_api.pmp_client import Client
+from pmp_api.docstore import DocumentStore
+from pmp_api.collectiondoc.navigabledoc import NavigableDoc
+
+
+def story(guid, published, tags=(), collections=(), profile='story'):
+    links = {'profile': [{'href': 'https://api.pmp.io/profiles/' + profile}],
+             'collection': [{'href': 'https://api.pmp.io/docs/' + c}
+                            for c in collections]}
+    return {'href': 'https://api.pmp.io/docs/' + guid,
+            'links': links,
+            'attributes': {'guid': guid, 'published': published,
+                           'title': 'Story ' + guid, 'tags': list(tags)}}
+
+
+class TestDocumentStore(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'docs.db')
+        self.store = DocumentStore(self.path)
+        self.store.put_many([
+            story('a', '2014-01-01T00:00:00+00:00', tags=['kpbs'],
+                  collections=['news']),
+            story('b', '2014-01-03T00:00:00+00:00', tags=['kpbs', 'arts']),
+            story('c', '2014-01-02T00:00:00+00:00', tags=['arts'],
+                  collections=['news'], profile='image')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def guids(self, documents):
+        return [doc.attributes['guid'] for doc in documents]
+
+    def test_get(self):
+        document = self.store.get('b')
+        self.assertIsInstance(document, NavigableDoc)
+        self.assertEqual(document.attributes['title'], 'Story b')
+        self.assertIsNone(self.store.get('missing'))
+        self.assertEqual(self.store.get_href('https://api.pmp.io/docs/c')
+                         .attributes['guid'], 'c')
+
+    def test_find(self):
+        self.assertEqual(self.guids(self.store.find(tag='kpbs')), ['b', 'a'])
+        self.assertEqual(self.guids(self.store.find(collection='news')),
+                         ['c', 'a'])
+        self.assertEqual(self.guids(self.store.find(profile='story')),
+                         ['b', 'a'])
+        self.assertEqual(self.guids(self.store.find(
+            profile='https://api.pmp.io/profiles/image')), ['c'])
+        self.assertEqual(self.guids(self.store.find(
+            tag='arts', since='2014-01-03T00:00:00+00:00')), ['b'])
+        self.assertEqual(self.guids(self.store.find(limit=1)), ['b'])
+
+    def test_replace_updates_indexes(self):
+        self.store.put(story('a', '2014-01-05T00:00:00+00:00', tags=['new']))
+        self.assertEqual(self.guids(self.store.find(tag='kpbs')), ['b'])
+        self.assertEqual(self.guids(self.store.find(tag='new')), ['a'])
+        self.assertEqual(self.guids(self.store.find(collection='news')),
+                         ['c'])
+        self.store.delete('a')
+        self.assertEqual(len(self.store), 2)
+
+    def test_put_page_skips_listing(self):
+        store = DocumentStore(os.path.join(self.tmpdir, 'page.db'))
+        page = NavigableDoc({'href': 'https://api.pmp.io/docs?tag=x',
+                             'links': {},
+                             'items': [story('d', '2014-01-04')]})
+        self.assertEqual(store.put_page(page), 1)
+        self.assertEqual(len(store), 1)
+
+    def test_threads(self):
+        def put(n):
+            self.store.put(story('t{}'.format(n), '2014-02-01', tags=['t']))
+
+        threads = [threading.Thread(target=put, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.store.find(tag='t')), 8)
+
+    def test_search(self):
+        document = story('d', '2014-01-04T00:00:00+00:00')
+        document['attributes'].update({
+            'teaser': 'Rain returns to San Diego',
+            'byline': 'Jane Reporter',
+            'contentencoded': '<p>Storm&nbsp;drains <b>overflow</b></p>'})
+        self.store.put(document)
+        self.assertEqual(self.guids(self.store.search('san diego')), ['d'])
+        self.assertEqual(self.guids(self.store.search('reporter OVERFLOW')),
+                         ['d'])
+        self.assertEqual(self.guids(self.store.search('storm')), ['d'])
+        self.assertEqual(self.store.search('p'), [])
+        self.assertEqual(self.store.search('diego "snow'), [])
+        self.assertEqual(len(self.store.search('story', limit=2)), 2)
+
+        # replaced and deleted documents leave the index
+        document['attributes']['teaser'] = 'Snow in the mountains'
+        self.store.put(document)
+        self.assertEqual(self.store.search('diego'), [])
+        conn = self.store._connect()
+        self.assertEqual(
+            conn.execute('SELECT COUNT(*) FROM document_text').fetchone()[0],
+            len(self.store))
+        self.store.delete('d')
+        self.assertEqual(self.store.search('snow'), [])
+
+    def test_rebuild_search_index(self):
+        conn = self.store._connect()
+        conn.execute('DELETE FROM document_text')
+        self.assertEqual(self.store.search('story'), [])
+        self.store.rebuild_search_index()
+        self.assertEqual(sorted(self.guids(self.store.search('story'))),
+                         ['a', 'b', 'c'])
+
+
+class TestDocumentStoreFallback(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            home_values = json.loads(jf.read())
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = DocumentStore(os.path.join(self.tmpdir, 'docs.db'))
+        self.client = Client('http://127.0.0.1:8080/', doc_store=self.store)
+        self.client._set_home_doc(home_values)
+        self.store.client = self.client
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_falls_back_to_network(self):
+        self.client.connector = Mock(**{'get.return_value':
+                                        story('x', '2014-01-01')})
+        self.assertEqual(self.store.get('x').attributes['guid'], 'x')
+        self.client.connector.get.assert_called_once_with(
+            'http://127.0.0.1:8080/docs/x')
+        # now answered locally
+        self.assertEqual(self.store.get('x').attributes['guid'], 'x')
+        self.assertEqual(self.client.connector.get.call_count, 1)
+
+    def test_find_remote(self):
+        self.store.put(story('x', '2014-01-03', tags=['kpbs']))
+        page = {'href': 'http://127.0.0.1:8080/docs?tag=kpbs', 'links': {},
+                'items': [story('y', '2014-01-02', tags=['kpbs']),
+                          story('z', '2014-01-01', tags=['kpbs'])]}
+        self.client.connector = Mock(**{'get.return_value': page})
+        # only the mirrored document, without a request
+        self.assertEqual(len(self.store.find(tag='kpbs')), 1)
+        self.assertFalse(self.client.connector.get.called)
+        self.assertEqual(len(self.store.find(tag='kpbs', remote=True)), 2)
+        self.client.connector.get.assert_called_once_with(
+            'http://127.0.0.1:8080/docs?tag=kpbs')
+        self.assertEqual([doc.attributes['guid'] for doc
+                          in self.store.find(tag='kpbs')], ['x', 'y', 'z'])
+
+    def test_save_drops_local_copy(self):
+        self.store.put(story('x', '2014-01-01'))
+        self.client.connector = Mock(**{'put.return_value': {'url': 'x'},
+                                        'cache': None})
+        self.client.save('https://publish-sandbox.pmp.io/docs/x',
+                         json.dumps(story('x', '2014-01-02')))
+        self.assertIsNone(self.store.get('x', fetch=False))
+
+    def test_refused_delete_keeps_local_copy(self):
+        self.store.put(story('x', '2014-01-01'))
+        document = self.store.get('x')
+        self.client.connector = Mock(**{'delete.return_value': False})
+        self.assertFalse(self.client.delete(document))
+        self.assertIsNotNone(self.store.get('x', fetch=False))
+        self.client.connector = Mock(**{'delete.return_value': True})
+        self.assertTrue(self.client.delete(document))
+        self.assertIsNone(self.store.get('x', fetch=False))
+
+    def test_read_ahead_pages_stored(self):
+        from test_pager import page
+
+        def fetch(url):
+            n = int(url.split('-')[1])
+            listing = page(n, last=3).collectiondoc
+            listing['items'] = [story('p{}'.format(n), '2014-01-0{}'.format(n))]
+            return listing
+
+        client = Client('http://127.0.0.1:8080/', prefetch_depth=1,
+                        doc_store=self.store)
+        client.connector = Mock(**{'get.side_effect': fetch})
+        try:
+            client.get('page-1')
+            client.next()
+            client.next()
+        finally:
+            client.read_ahead.close()
+        self.assertEqual(sorted(doc.attributes['guid'] for doc in
+                                self.store.find()),
+                         ['p1', 'p2', 'p3'])
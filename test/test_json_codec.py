@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from pmp_api.utils import json_codec
+
+
+class TestJsonCodec(TestCase):
+
+    def tearDown(self):
+        json_codec.use_backend()
+
+    def test_round_trip_every_backend(self):
+        doc = {'href': 'http://www.google.com', 'items': [{'title': 'é'}],
+               'version': '1.0', 'count': 3, 'empty': None}
+        for name in json_codec.available_backends():
+            json_codec.use_backend(name)
+            encoded = json_codec.dumps(doc)
+            self.assertIsInstance(encoded, str)
+            self.assertEqual(json_codec.loads(encoded), doc)
+            self.assertEqual(json_codec.loads(encoded.encode('utf-8')), doc)
+
+    def test_invalid_json_raises_value_error(self):
+        for name in json_codec.available_backends():
+            json_codec.use_backend(name)
+            with self.assertRaises(ValueError):
+                json_codec.loads(b'')
+
+    def test_default_is_fastest_installed(self):
+        self.assertEqual(json_codec.backend,
+                         json_codec.available_backends()[0])
+        self.assertEqual(json_codec.available_backends()[-1], 'json')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            json_codec.use_backend('not-a-json-library')
@@ -140,6 +140,28 @@ class TestNavigableDoc(TestCase):
         self.assertEqual(self.homedoc.attributes['guid'],
                          result2)
 
+    def test_edit_updates_rels(self):
+        urn = 'urn:collectiondoc:query:users'
+        self.assertIsNotNone(self.homedoc.options(urn))
+        query_links = self.homedoc.links['query']
+        index = next(n for n, link in enumerate(query_links)
+                     if urn in link['rels'])
+        self.homedoc.edit(('links', 'query', index, 'rels'), ['urn:renamed'])
+        self.assertIsNone(self.homedoc.options(urn))
+        self.assertEqual(self.homedoc.template('urn:renamed'),
+                         query_links[index]['href-template'])
+        self.homedoc.edit(('links', 'navigation'),
+                          [{'rels': ['next'], 'href': 'NEXT'}])
+        self.assertEqual(self.homedoc.pager.next, 'NEXT')
+
+    def test_options_ignores_item_links(self):
+        doc = NavigableDoc({'links': {'query': [{'rels': ['urn:q'],
+                                                 'href-template': 'Q'}]},
+                            'items': [{'links': {'query': [
+                                {'rels': ['urn:q'], 'href-template': 'X'}]}}]})
+        self.assertEqual(doc.template('urn:q'), 'Q')
+        self.assertIsNone(doc.options(['urn:q']))
+
     def test_serialize(self):
         self.assertEqual(type(self.homedoc.serialize()),
                          str)
@@ -41,3 +41,139 @@ class TestPager(TestCase):
         self.assertEqual(actual_vals['last'], pager.last)
         self.assertEqual(actual_vals['first'], pager.first)
         self.assertEqual(actual_vals['current'], pager.current)
+
+
+def page(n, last=9):
+    """Returns collection.doc for page `n` of a listing."""
+    links = [{'rels': ['self'], 'href': 'page-{}'.format(n)}]
+    if n < last:
+        links.append({'rels': ['next'], 'href': 'page-{}'.format(n + 1)})
+    return NavigableDoc({'href': 'page-{}'.format(n),
+                         'links': {'navigation': links}})
+
+
+class TestReadAhead(TestCase):
+
+    def setUp(self):
+        import threading
+        from pmp_api.collectiondoc.pager import ReadAhead
+        self.fetched = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+        def fetch(url):
+            self.gate.wait(5)
+            self.fetched.append(url)
+            return page(int(url.split('-')[1]))
+
+        self.read_ahead = ReadAhead(fetch, depth=3)
+
+    def tearDown(self):
+        self.read_ahead.close()
+
+    def test_buffers_depth_pages(self):
+        self.read_ahead.start('page-1')
+        self.assertEqual(self.read_ahead.take('page-1').pager.next, 'page-2')
+        self.assertEqual(self.read_ahead.take('page-2').pager.next, 'page-3')
+        self.assertEqual(self.read_ahead.take('page-3').pager.next, 'page-4')
+        self.assertEqual(self.fetched[:3], ['page-1', 'page-2', 'page-3'])
+        self.assertLessEqual(len(self.read_ahead), 3)
+
+    def test_start_tops_up_after_take(self):
+        self.read_ahead.start('page-1')
+        self.read_ahead.take('page-1')
+        self.read_ahead.start('page-2')
+        self.assertIsNotNone(self.read_ahead.take('page-2'))
+        self.assertIsNotNone(self.read_ahead.take('page-3'))
+        self.assertIsNotNone(self.read_ahead.take('page-4'))
+        self.assertEqual(len(set(self.fetched)), len(self.fetched))
+
+    def test_take_missing(self):
+        self.assertIsNone(self.read_ahead.take('page-1'))
+
+    def test_cancel_stops_chain(self):
+        self.gate.clear()
+        self.read_ahead.start('page-1')
+        self.read_ahead.cancel()
+        self.gate.set()
+        self.read_ahead.close()
+        self.assertEqual(len(self.read_ahead), 0)
+        self.assertLessEqual(len(self.fetched), 1)
+
+
+class TestPagerRandomAccess(TestCase):
+
+    def setUp(self):
+        from pmp_api.collectiondoc.pager import Pager
+        self.Pager = Pager
+        docsdoc = os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                               'fixtures', 'datadoc.json')
+        with open(docsdoc, 'r') as d:
+            self.pager = NavigableDoc(json.loads(d.read())).pager
+
+    def test_page_size_and_count(self):
+        self.assertEqual(self.pager.page_size, 10)
+        self.assertEqual(self.pager.page_count, 1314)
+
+    def test_page_url(self):
+        base = "http://127.0.0.1:8080/docs?tag=npr_api&profile=someGUIDvalue"
+        self.assertEqual(self.pager.page_url(1), base)
+        self.assertEqual(self.pager.page_url(3), base + "&offset=20")
+        self.assertEqual(self.pager.page_url(1314), base + "&offset=13130")
+        with self.assertRaises(IndexError):
+            self.pager.page_url(1315)
+        self.assertEqual(len(self.pager.page_urls(2, 5)), 4)
+
+    def test_limit_kept(self):
+        pager = self.Pager()
+        pager.update([{'rels': ['self'], 'href': 'http://x/docs?limit=50'},
+                      {'rels': ['last'],
+                       'href': 'http://x/docs?offset=200&limit=50'}])
+        self.assertEqual(pager.page_count, 5)
+        self.assertEqual(pager.page_url(2), 'http://x/docs?offset=50&limit=50')
+
+    def test_unknown_size(self):
+        with self.assertRaises(ValueError):
+            self.Pager().page_url(2)
+
+
+class TestItemStream(TestCase):
+
+    def setUp(self):
+        from pmp_api.collectiondoc.pager import ItemStream
+        self.ItemStream = ItemStream
+        self.fetched = []
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        n = int(url.split('-')[1])
+        doc = page(n, last=3).collectiondoc
+        doc['items'] = [{'href': '{}/{}'.format(url, i), 'links': {}}
+                        for i in range(4)]
+        return doc
+
+    def test_streams_all_pages(self):
+        items = list(self.ItemStream(self.fetch, 'page-1'))
+        self.assertEqual(len(items), 12)
+        self.assertEqual(items[5]['href'], 'page-2/1')
+        self.assertEqual(self.fetched, ['page-1', 'page-2', 'page-3'])
+
+    def test_max_items(self):
+        stream = self.ItemStream(self.fetch, 'page-1', max_items=5)
+        self.assertEqual(len(list(stream)), 5)
+        self.assertEqual(self.fetched, ['page-1', 'page-2'])
+
+    def test_resume_from_cursor(self):
+        stream = self.ItemStream(self.fetch, 'page-1')
+        for _ in range(6):
+            next(stream)
+        self.assertEqual(stream.cursor, ('page-2', 2))
+        resumed = list(self.ItemStream(self.fetch, stream.cursor))
+        self.assertEqual(resumed[0]['href'], 'page-2/2')
+        self.assertEqual(len(resumed), 6)
+        self.assertEqual(len(list(stream)), 6)
+        self.assertIsNone(stream.cursor)
+
+    def test_wrap(self):
+        stream = self.ItemStream(self.fetch, 'page-3', wrap=NavigableDoc)
+        self.assertIsInstance(next(stream), NavigableDoc)
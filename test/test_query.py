@@ -1,7 +1,10 @@
 from unittest import TestCase
+from uritemplate import expand
 from pmp_api.collectiondoc.query import validate
 from pmp_api.collectiondoc.query import make_query
 from pmp_api.collectiondoc.query import bad_params
+from pmp_api.collectiondoc.query import compile_template
+from pmp_api.collectiondoc.query import make_queries
 
 from pmp_api.core.exceptions import BadQuery
 
@@ -100,3 +103,33 @@ class TestMakeQuery(TestCase):
         self.assertIn('profile=story', result)
         self.assertIn('has=audio', result)
         self.assertIn('?', result)
+
+
+class TestCompiledTemplate(TestCase):
+
+    def setUp(self):
+        self.test_template = 'https://api-pilot.pmp.io/docs/{guid}{?limit,offset,tag}'
+
+    def test_cached(self):
+        compiled = compile_template(self.test_template)
+        self.assertIs(compile_template(self.test_template), compiled)
+        self.assertEqual(compiled.variables,
+                         {'guid', 'limit', 'offset', 'tag'})
+        self.assertEqual(compiled.bad_params({'tag': 'a', 'lang': 'en'}),
+                         {'lang'})
+
+    def test_expand_matches_uritemplate(self):
+        compiled = compile_template(self.test_template)
+        for params in ({}, {'guid': 'abc'}, {'tag': 'a b', 'limit': 5},
+                       {'guid': 'x', 'tag': ['a', 'b'], 'offset': None}):
+            self.assertEqual(compiled.expand(params),
+                             expand(self.test_template, params))
+
+    def test_make_queries(self):
+        queries = make_queries(self.test_template,
+                               [{'guid': n, 'limit': 1} for n in range(3)])
+        self.assertEqual(queries[2],
+                         'https://api-pilot.pmp.io/docs/2?limit=1')
+        self.assertEqual(len(queries), 3)
+        with self.assertRaises(BadQuery):
+            make_queries(self.test_template, [{'guid': 1}, {'bad': 2}])
@@ -0,0 +1,64 @@
+import time
+import asyncio
+import threading
+
+from unittest import TestCase
+
+from pmp_api.core.ratelimit import RateLimiter
+from pmp_api.core.ratelimit import TokenBucket
+
+
+class TestTokenBucket(TestCase):
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 0.2, places=2)
+
+    def test_threads_share_budget(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+        start = time.monotonic()
+        workers = [threading.Thread(target=bucket.acquire) for _ in range(11)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_acquire_async(self):
+        bucket = TokenBucket(rate=100, capacity=1)
+
+        async def run():
+            await asyncio.gather(*[bucket.acquire_async() for _ in range(6)])
+
+        start = time.monotonic()
+        asyncio.run(run())
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+
+class TestRateLimiter(TestCase):
+
+    def test_separate_budgets(self):
+        limiter = RateLimiter(read_rate=5, write_rate=1)
+        self.assertIs(limiter.bucket('GET'), limiter.read)
+        self.assertIs(limiter.bucket('put'), limiter.write)
+        self.assertIs(limiter.bucket('DELETE'), limiter.write)
+
+    def test_adaptive_update(self):
+        limiter = RateLimiter(read_rate=50, adaptive=True)
+        limiter.update('GET', {'X-RateLimit-Remaining': '10',
+                               'X-RateLimit-Reset': '5'})
+        self.assertEqual(limiter.read.rate, 2.0)
+        # never faster than configured
+        limiter.update('GET', {'X-RateLimit-Remaining': '1000',
+                               'X-RateLimit-Reset': '1'})
+        self.assertEqual(limiter.read.rate, 50.0)
+        self.assertEqual(limiter.write.rate, 2.0)
+
+    def test_update_ignored_unless_adaptive(self):
+        limiter = RateLimiter(read_rate=50)
+        limiter.update('GET', {'X-RateLimit-Remaining': '10',
+                               'X-RateLimit-Reset': '5'})
+        self.assertEqual(limiter.read.rate, 50.0)
@@ -0,0 +1,75 @@
+import requests
+
+from unittest import TestCase
+from unittest.mock import Mock
+
+from pmp_api.core.retry import RetryPolicy
+
+
+def response(status, headers=None):
+    return Mock(**{'status_code': status, 'headers': headers or {}})
+
+
+class TestRetryPolicy(TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self.policy = RetryPolicy(max_attempts=4, sleep=self.sleeps.append)
+
+    def test_retries_status_then_succeeds(self):
+        send = Mock(side_effect=[response(503), response(502), response(200)])
+        result = self.policy.call('GET', send)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(self.policy.stats['retries'], 2)
+        self.assertEqual(self.policy.stats['status_503'], 1)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_exhausted_returns_last_response(self):
+        send = Mock(return_value=response(503))
+        self.assertEqual(self.policy.call('GET', send).status_code, 503)
+        self.assertEqual(send.call_count, 4)
+        self.assertEqual(self.policy.stats['exhausted'], 1)
+
+    def test_exceptions_retried_and_reraised(self):
+        send = Mock(side_effect=requests.ConnectionError)
+        with self.assertRaises(requests.ConnectionError):
+            self.policy.call('GET', send)
+        self.assertEqual(send.call_count, 4)
+        self.assertEqual(self.policy.stats['ConnectionError'], 4)
+
+    def test_put_only_retried_when_idempotent(self):
+        send = Mock(side_effect=[response(503), response(200)])
+        self.assertEqual(self.policy.call('PUT', send).status_code, 503)
+        send = Mock(side_effect=[response(503), response(200)])
+        result = self.policy.call('PUT', send, idempotent=True)
+        self.assertEqual(result.status_code, 200)
+
+    def test_retry_after_honored(self):
+        send = Mock(side_effect=[response(429, {'Retry-After': '7'}),
+                                 response(200)])
+        self.policy.call('GET', send)
+        self.assertEqual(self.sleeps, [7.0])
+
+    def test_long_retry_after_not_waited(self):
+        send = Mock(side_effect=[response(503, {'Retry-After': '86400'}),
+                                 response(200)])
+        self.assertEqual(self.policy.call('GET', send).status_code, 503)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.sleeps, [])
+        self.assertEqual(self.policy.stats['exhausted'], 1)
+
+    def test_full_jitter_backoff(self):
+        policy = RetryPolicy(backoff_base=1, backoff_max=5)
+        for attempt in range(1, 10):
+            delay = policy.backoff(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(5, 2 ** (attempt - 1)))
+
+    def test_total_timeout(self):
+        policy = RetryPolicy(max_attempts=10, total_timeout=5,
+                             sleep=self.sleeps.append)
+        send = Mock(return_value=response(503, {'Retry-After': '60'}))
+        self.assertEqual(policy.call('GET', send).status_code, 503)
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual(self.sleeps, [])
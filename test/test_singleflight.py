@@ -0,0 +1,78 @@
+import time
+import threading
+
+from unittest import TestCase
+
+from pmp_api.core.singleflight import SingleFlight
+
+
+class TestSingleFlight(TestCase):
+
+    def run_threads(self, count, target):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_calls_coalesced(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.05)
+            return {'a': 1}
+
+        self.run_threads(8, lambda: results.append(flight.do('k', slow)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'a': 1}] * 8)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_errors_shared(self):
+        flight = SingleFlight()
+        errors = []
+
+        def fail():
+            time.sleep(0.05)
+            raise ValueError('boom')
+
+        def call():
+            try:
+                flight.do('k', fail)
+            except ValueError as exc:
+                errors.append(exc)
+
+        self.run_threads(4, call)
+        self.assertEqual(len(errors), 4)
+
+    def test_sequential_calls_not_cached(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('k', lambda: 1), 1)
+        self.assertEqual(flight.do('k', lambda: 2), 2)
+
+    def test_share_applied_to_waiters(self):
+        flight = SingleFlight()
+        results = []
+        self.run_threads(4, lambda: results.append(
+            flight.do('k', lambda: time.sleep(0.05) or [1], share=list)))
+        self.assertEqual(len(set(id(r) for r in results)), 4)
+
+    def test_leader_mutation_not_shared(self):
+        flight = SingleFlight()
+        results = []
+
+        def slow():
+            deadline = time.time() + 1
+            while flight._calls['k'].waiters < 3 and time.time() < deadline:
+                time.sleep(0.005)
+            return [1]
+
+        def call():
+            result = flight.do('k', slow, share=list)
+            result.append('mine')
+            results.append(result)
+
+        self.run_threads(4, call)
+        self.assertEqual(results, [[1, 'mine']] * 4)
@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+from urllib.parse import parse_qs, urlsplit
+
+from pmp_api.pmp_client import Client
+from pmp_api.sync import FileCheckpointStore
+from pmp_api.sync import MemoryCheckpointStore
+from pmp_api.sync import SyncEngine
+
+
+def doc(n, day):
+    return {'href': 'http://127.0.0.1:8080/docs/guid-{}'.format(n),
+            'links': {},
+            'attributes': {'guid': 'guid-{}'.format(n),
+                           'published': '2014-01-{:02d}T00:00:00+00:00'.format(day)}}
+
+
+class FakeServer(object):
+    """Answers docs queries from `corpus`, newest first, with offset/limit
+    paging like the PMP API."""
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.requests = []
+
+    def get(self, url):
+        self.requests.append(url)
+        params = {key: values[0]
+                  for key, values in parse_qs(urlsplit(url).query).items()}
+        found = [item for item in self.corpus
+                 if item['attributes']['published'] >= params.get('startdate', '')
+                 and item['attributes']['published'] <= params.get('enddate', '9')]
+        if 'guid' in params:
+            guids = params['guid'].split(',')
+            found = [item for item in found
+                     if item['attributes']['guid'] in guids]
+        found.sort(key=lambda item: item['attributes']['published'],
+                   reverse=True)
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 10))
+        navigation = []
+        if offset + limit < len(found):
+            query = dict(params, offset=offset + limit)
+            next_url = 'http://127.0.0.1:8080/docs?' + '&'.join(
+                '{}={}'.format(key, value) for key, value in query.items())
+            navigation.append({'rels': ['next'], 'href': next_url})
+        return {'items': found[offset:offset + limit],
+                'links': {'navigation': navigation}}
+
+
+class TestSyncEngine(TestCase):
+
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(os.path.join(current_dir, 'fixtures', 'homedoc.json')) as jf:
+            home_values = json.loads(jf.read())
+        self.server = FakeServer([doc(n, 1 + n // 3) for n in range(10)])
+        self.client = Client('http://127.0.0.1:8080/')
+        self.client._set_home_doc(home_values)
+        self.client.connector = Mock(**{'get.side_effect': self.server.get})
+        self.store = MemoryCheckpointStore()
+        self.engine = SyncEngine(self.client, self.store, page_size=4)
+
+    def guids(self, items):
+        return sorted(item['attributes']['guid'] for item in items)
+
+    def test_incremental_runs(self):
+        handled = []
+        self.assertEqual(self.engine.run(handled.append), 10)
+        checkpoint = self.store.load(self.engine.key)
+        self.assertEqual(checkpoint['since'], '2014-01-04T00:00:00+00:00')
+        self.assertEqual(checkpoint['seen'], ['guid-9'])
+        self.assertIsNone(checkpoint['run'])
+
+        # same day as the high-water mark, and a later day
+        self.server.corpus.extend([doc(10, 4), doc(11, 5)])
+        handled = []
+        self.assertEqual(self.engine.run(handled.append), 2)
+        self.assertEqual(self.guids(handled), ['guid-10', 'guid-11'])
+        self.assertEqual(self.engine.run(handled.append), 0)
+
+    def test_changed_documents(self):
+        self.engine.run(lambda item: None)
+        # edited after the run: one published within `revisit` of the
+        # high-water mark, one long before it
+        for item in self.server.corpus:
+            if item['attributes']['guid'] in ('guid-8', 'guid-0'):
+                item['attributes']['modified'] = '2999-01-01T00:00:00+00:00'
+        handled = []
+        self.assertEqual(self.engine.run(handled.append), 1)
+        self.assertEqual(self.guids(handled), ['guid-8'])
+        params = parse_qs(urlsplit(self.server.requests[-1]).query)
+        self.assertEqual(params['startdate'], ['2014-01-03T00:00:00+00:00'])
+
+        # not changed again since the previous run started
+        mark = self.store.load(self.engine.key)['modified']
+        for item in self.server.corpus:
+            item['attributes'].pop('modified', None)
+        self.server.corpus[8]['attributes']['modified'] = mark
+        self.assertEqual(self.engine.run(handled.append), 0)
+        self.engine.revisit = None
+        self.server.corpus[8]['attributes']['modified'] = '2999-01-01'
+        self.assertEqual(self.engine.run(handled.append), 0)
+
+    def test_resume_after_crash(self):
+        handled = []
+
+        def crash_on_sixth(item):
+            if len(handled) == 5:
+                raise RuntimeError("crash")
+            handled.append(item)
+
+        with self.assertRaises(RuntimeError):
+            self.engine.run(crash_on_sixth)
+        self.assertIsNotNone(self.store.load(self.engine.key)['run'])
+
+        # published during the crash: after the interrupted run's window
+        late = doc(20, 9)
+        late['attributes']['published'] = '2999-01-01T00:00:00+00:00'
+        self.server.corpus.append(late)
+        resumed = []
+        self.engine.run(resumed.append)
+        self.assertEqual(self.guids(handled + resumed),
+                         sorted('guid-{}'.format(n) for n in range(10)))
+        self.assertEqual(len(handled + resumed), 10)
+
+    def test_find_deleted(self):
+        held = ['guid-1', 'guid-2', 'guid-gone']
+        self.assertEqual(list(self.engine.find_deleted(held)), ['guid-gone'])
+
+
+class TestFileCheckpointStore(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sync.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        store = FileCheckpointStore(self.path)
+        self.assertIsNone(store.load('docs'))
+        store.save('docs', {'since': 'x', 'seen': ['a'], 'run': None})
+        store.save('other', {'since': None, 'seen': [], 'run': None})
+        self.assertEqual(FileCheckpointStore(self.path).load('docs'),
+                         {'since': 'x', 'seen': ['a'], 'run': None})
+        self.assertEqual(os.listdir(self.tmpdir), ['sync.json'])
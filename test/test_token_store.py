@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import datetime
+import tempfile
+from multiprocessing import Process
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from pmp_api.core.auth import PmpAuth
+from pmp_api.core.token_store import FileTokenStore
+
+TOKEN_URL = "https://api-sandbox.pmp.io/auth/access_token"
+
+
+def token_response(token):
+    issued = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S+00:00")
+    return Mock(**{'ok': True,
+                   'json.return_value': {'access_token': token,
+                                         'token_issue_date': issued,
+                                         'token_expires_in': 3600}})
+
+
+def request_token(path, log_path, worker):
+    def post(*args, **kwargs):
+        with open(log_path, 'a') as log:
+            log.write('{}\n'.format(worker))
+        time.sleep(0.1)
+        return token_response('TOKEN-{}'.format(worker))
+
+    authorizer = PmpAuth('client-id', 'client-secret',
+                         token_store=FileTokenStore(path))
+    with patch('requests.post', side_effect=post):
+        authorizer.get_access_token2(TOKEN_URL)
+
+
+class TestFileTokenStore(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'tokens.json')
+        self.store = FileTokenStore(self.path)
+        self.issued = datetime.datetime.utcnow()
+        self.expires = self.issued + datetime.timedelta(hours=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_and_load(self):
+        self.assertIsNone(self.store.load('client-id', TOKEN_URL))
+        self.store.save('client-id', TOKEN_URL, 'TOKEN', self.issued,
+                        self.expires)
+        self.assertEqual(FileTokenStore(self.path).load('client-id',
+                                                         TOKEN_URL),
+                         ('TOKEN', self.issued, self.expires))
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_keyed_by_client_and_url(self):
+        self.store.save('client-id', TOKEN_URL, 'TOKEN', self.issued,
+                        self.expires)
+        self.store.save('other-id', TOKEN_URL, 'OTHER', self.issued,
+                        self.expires)
+        self.assertIsNone(self.store.load('client-id', 'http://elsewhere'))
+        self.assertEqual(self.store.load('other-id', TOKEN_URL)[0], 'OTHER')
+        self.store.delete('other-id', TOKEN_URL)
+        self.assertIsNone(self.store.load('other-id', TOKEN_URL))
+        self.assertEqual(self.store.load('client-id', TOKEN_URL)[0], 'TOKEN')
+
+    def test_damaged_file_ignored(self):
+        with open(self.path, 'w') as token_file:
+            token_file.write('{not json')
+        self.assertIsNone(self.store.load('client-id', TOKEN_URL))
+
+    def test_auth_reuses_valid_token(self):
+        self.store.save('client-id', TOKEN_URL, 'SHARED', self.issued,
+                        self.expires)
+        authorizer = PmpAuth('client-id', 'client-secret',
+                             token_store=self.store)
+        with patch('requests.post') as mocker:
+            self.assertEqual(authorizer.get_access_token2(TOKEN_URL),
+                             'SHARED')
+        self.assertFalse(mocker.called)
+        self.assertEqual(authorizer.token_expires, self.expires)
+        self.assertEqual(authorizer.access_token_url, TOKEN_URL)
+
+    def test_auth_replaces_expired_token(self):
+        expired = self.issued - datetime.timedelta(seconds=1)
+        self.store.save('client-id', TOKEN_URL, 'STALE', self.issued,
+                        expired)
+        authorizer = PmpAuth('client-id', 'client-secret',
+                             token_store=self.store)
+        with patch('requests.post', return_value=token_response('FRESH')):
+            self.assertEqual(authorizer.get_access_token2(TOKEN_URL),
+                             'FRESH')
+        self.assertEqual(self.store.load('client-id', TOKEN_URL)[0], 'FRESH')
+
+    def test_auth_renews_own_stale_token(self):
+        self.store.save('client-id', TOKEN_URL, 'CURRENT', self.issued,
+                        self.expires)
+        authorizer = PmpAuth('client-id', 'client-secret',
+                             token_store=self.store)
+        authorizer.access_token = 'CURRENT'
+        with patch('requests.post', return_value=token_response('FRESH')):
+            self.assertEqual(authorizer.get_access_token2(TOKEN_URL),
+                             'FRESH')
+
+    def test_concurrent_processes_share_one_token(self):
+        log_path = os.path.join(self.tmpdir, 'requests.log')
+        workers = [Process(target=request_token,
+                           args=(self.path, log_path, worker))
+                   for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+        with open(log_path) as log:
+            self.assertEqual(len(log.readlines()), 1)
@@ -4,6 +4,8 @@ from unittest import TestCase
 
 from pmp_api.utils.json_utils import qfind
 from pmp_api.utils.json_utils import filter_dict
+from pmp_api.utils.json_utils import copy_json
+from pmp_api.utils.json_utils import index_rels
 
 
 class TestQfind(TestCase):
@@ -115,3 +117,31 @@ class TestFilterDict(TestCase):
             next(filter_dict(self.test_data['links']['alternate'],
                              'href',
                              'http://BAD-VALUE'))
+
+
+class TestCopyJson(TestCase):
+
+    def test_copy_is_deep(self):
+        original = {'a': [1, {'b': 'c'}], 'd': {'e': None}}
+        copied = copy_json(original)
+        self.assertEqual(copied, original)
+        copied['a'][1]['b'] = 'changed'
+        copied['d']['f'] = 1
+        self.assertEqual(original, {'a': [1, {'b': 'c'}], 'd': {'e': None}})
+
+
+class TestIndexRels(TestCase):
+
+    def test_index(self):
+        first = {'rels': ['self', 'first'], 'href': 'a'}
+        second = {'rels': ['next'], 'href': 'b'}
+        links = {'navigation': [first, second],
+                 'profile': [{'href': 'no rels'}],
+                 'edit': [{'rels': 'urn:edit', 'href': 'c'}]}
+        index = index_rels(links)
+        self.assertEqual(index['self'], [first])
+        self.assertEqual(index['first'], [first])
+        self.assertEqual(index['urn:edit'][0]['href'], 'c')
+        self.assertEqual(set(index), {'self', 'first', 'next', 'urn:edit'})
+        self.assertEqual(index_rels([first, second])['next'], [second])
+        self.assertEqual(index_rels(None), {})